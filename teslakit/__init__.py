@@ -20,6 +20,7 @@ from . import mda
 from . import mjo
 from . import numerical_models
 from . import pca
+from . import pipeline
 from . import rbf
 from . import statistical
 from . import storms
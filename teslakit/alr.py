@@ -3,6 +3,7 @@
 
 # common
 import pickle
+import hashlib
 import time
 import sys
 import os
@@ -13,10 +14,9 @@ from datetime import datetime, date, timedelta
 # pip
 import numpy as np
 import pandas as pd
-from sklearn import linear_model
-import statsmodels.discrete.discrete_model as sm
 import scipy.stats as stat
 import xarray as xr
+import netCDF4
 
 # fix tqdm for notebook 
 from tqdm import tqdm as tqdm_base
@@ -33,6 +33,8 @@ stats.chisqprob = lambda chisq, df: stats.chi2.sf(chisq, df)
 # tk
 from .io.aux_nc import StoreBugXdset
 from .util.time_operations import npdt64todatetime as npdt2dt
+from .util.time_operations import get_years_months_days, time2datetime64, \
+day_of_year
 from .kma import Persistences
 from .plotting.alr import Plot_PValues, Plot_Params, Plot_Terms
 from .plotting.wts import Plot_Compare_PerpYear, Plot_Compare_Transitions, Plot_Compare_Persistences
@@ -63,6 +65,9 @@ class ALR_WRP(object):
         # config (only tested with statsmodels library)
         self.model_library = 'statsmodels'  # sklearn / statsmodels
 
+        # store fitting terms at disk cache (reused for same settings)
+        self.terms_cache = True
+
         # paths
         self.p_base = p_base
 
@@ -70,6 +75,9 @@ class ALR_WRP(object):
         self.p_save_model = op.join(p_base, 'model.sav')
         self.p_save_terms_fit = op.join(p_base, 'terms.sav')
 
+        # alr model compact export (coefficients and terms settings)
+        self.p_save_model_nc = op.join(p_base, 'model.nc')
+
         # store fit and simulated bmus
         self.p_save_fit_xds = op.join(p_base, 'xds_input.nc')
         self.p_save_sim_xds = op.join(p_base, 'xds_output.nc')
@@ -81,6 +89,9 @@ class ALR_WRP(object):
         # log sim
         self.p_log_sim_xds = op.join(p_base, 'xds_log_sim.nc')
 
+        # fitting terms cache
+        self.p_terms_cache = op.join(p_base, 'terms_cache')
+
     def SetFitData(self, cluster_size, xds_bmus_fit, d_terms_settings):
         '''
         Sets data needed for ALR fitting
@@ -120,8 +131,28 @@ class ALR_WRP(object):
         time_fit = self.xds_bmus_fit.time.values
         cluster_size = self.cluster_size
 
-        self.terms_fit, self.terms_fit_names = self.GenerateALRTerms(
-            d_terms_settings, bmus_fit, time_fit, cluster_size, time2yfrac=True)
+        # fitting terms cache file (settings and data hash)
+        p_cache = None
+        if self.terms_cache:
+            p_cache = op.join(self.p_terms_cache, '{0}.npz'.format(
+                Terms_Hash(d_terms_settings, bmus_fit, time_fit, cluster_size)))
+
+        if p_cache != None and op.isfile(p_cache):
+            self.terms_fit, self.terms_fit_names = Load_Terms(p_cache)
+            if d_terms_settings['covariates'][0]:
+                self.cov_names = d_terms_settings['covariates'][1].cov_names.values
+
+        else:
+            self.terms_fit, self.terms_fit_names = self.GenerateALRTerms(
+                d_terms_settings, bmus_fit, time_fit, cluster_size, time2yfrac=True)
+
+            if p_cache != None:
+                Save_Terms(p_cache, self.terms_fit, self.terms_fit_names)
+
+                # cache only keeps current fitting terms
+                for fn in os.listdir(self.p_terms_cache):
+                    if fn.endswith('.npz') and fn != op.basename(p_cache):
+                        os.remove(op.join(self.p_terms_cache, fn))
 
         # store data
         self.mk_order = d_terms_settings['mk_order']
@@ -181,10 +212,10 @@ class ALR_WRP(object):
                 # simulation covars are previously normalized
                 cov_norm = xds_cov.cov_norm.values
 
-            # generate covar terms
+            # generate covar terms (column arrays)
             for i in range(cov_norm.shape[1]):
                 cn = cov_names[i]
-                terms[cn] = np.transpose(np.asmatrix(cov_norm[:,i]))
+                terms[cn] = cov_norm[:, i:i+1]
                 terms_names.append(cn)
 
                 # Covariates seasonality
@@ -192,12 +223,9 @@ class ALR_WRP(object):
                     cov_season = d_terms_settings['covariates_seasonality'][1]
 
                     if cov_season[i]:
-                        terms['{0}_cos'.format(cn)] = np.multiply(
-                            terms[cn].T, np.cos(2*np.pi*time_yfrac)
-                        ).T
-                        terms['{0}_sin'.format(cn)] = np.multiply(
-                            terms[cn].T, np.sin(2*np.pi*time_yfrac)
-                        ).T
+                        yf = np.asarray(time_yfrac)[:, np.newaxis]
+                        terms['{0}_cos'.format(cn)] = terms[cn] * np.cos(2*np.pi*yf)
+                        terms['{0}_sin'.format(cn)] = terms[cn] * np.sin(2*np.pi*yf)
                         terms_names.append('{0}_cos'.format(cn))
                         terms_names.append('{0}_sin'.format(cn))
 
@@ -245,12 +273,12 @@ class ALR_WRP(object):
             #  helmert
             dum = helmert_norm(cluster_size, reverse=True)
 
-            # solve markov order N
+            # solve markov order N (helmert rows for lagged bmus)
             mk_order = d_terms_settings['mk_order']
+            bmus = np.asarray(bmus).astype(int)
             for i in range(mk_order):
                 Z = np.zeros((bmus.size, cluster_size-1))
-                for indz in range(bmus.size-i-1):
-                    Z[indz+i+1,:] = np.squeeze(dum[bmus[indz]-1,:])
+                Z[i+1:,:] = dum[bmus[:bmus.size-i-1]-1, :]
 
                 terms['markov_{0}'.format(i+1)] = Z
 
@@ -264,57 +292,59 @@ class ALR_WRP(object):
     def GetFracYears(self, time):
         'Returns time in custom year decimal format'
 
-        # fix np.datetime64
-        if not 'year' in dir(time[0]):
-            time_0 = pd.to_datetime(time[0])
-            time_1 = pd.to_datetime(time[-1])
-            time_d = pd.to_datetime(time[1])
-        else:
-            time_0 = time[0]
-            time_1 = time[-1]
-            time_d = time[1]
+        # years and days since epoch (any date format)
+        ys, _, _ = get_years_months_days([time[0], time[1], time[-1]])
+        dd = time2datetime64([time[0], time[-1]], unit='D').astype(int)
 
         # resolution year
-        if time_d.year - time_0.year == 1:
-            return range(time_1.year - time_0.year+1)
-
-        # resolution day: get start/end data
-        y0 = time_0.year
-        m0 = time_0.month
-        d0 = time_0.day
-        y1 = time_1.year
-        m1 = time_1.month
-        d1 = time_1.day
+        if ys[1] - ys[0] == 1:
+            return range(ys[2] - ys[0]+1)
 
         # start "year cicle" at 01/01 
-        d_y0 = date(y0, 1, 1)
-
-        # time array
-        d_0 = date(y0, m0, d0)
-        d_1 = date(y1, m1, d1)
-
-        # year_decimal from year start to d1
-        delta_y0 = d_1 - d_y0
-        y_fraq_y0 = np.array(range(delta_y0.days+1))/365.25
+        d_y0 = np.datetime64('{0:04d}-01-01'.format(ys[0]), 'D').astype(int)
 
-        # cut year_decimal from d_0 
-        i0 = (d_0-d_y0).days
-        y_fraq = y_fraq_y0[i0:]
+        # year_decimal from d_0 to d_1
+        y_fraq = np.arange(dd[0] - d_y0, dd[1] - d_y0 + 1)/365.25
 
         return y_fraq
 
-    def FitModel(self, max_iter=1000):
-        'Fits ARL model using sklearn'
+    def FitModel(self, max_iter=1000, warm_start=False):
+        '''
+        Fits ARL model using statsmodels or sklearn
+
+        max_iter    - maximum number of solver iterations
+        warm_start  - start solver from previous model coefficients (current
+                      or stored model). Terms not found at previous model
+                      start at 0
+        '''
 
         # get fitting data
         X = np.concatenate(list(self.terms_fit.values()), axis=1)
         y = self.xds_bmus_fit.bmus.values
 
+        # previous model coefficients for warm start
+        params_0 = None
+        if warm_start:
+            if self.model == None and op.isfile(self.p_save_model):
+                self.model = pickle.load(open(self.p_save_model, 'rb'))
+            if self.model != None:
+                params_0 = self.GetModelParams()
+
+        # starting coefficients (terms, n_clusters-1) for current terms
+        start_params = None
+        nc = len(np.unique(y))
+        if params_0 is not None and params_0.shape[1] == nc-1:
+            start_params = params_0.reindex(self.terms_fit_names).fillna(0).values
+            print('warm start: {0} of {1} terms from previous model'.format(
+                params_0.index.isin(self.terms_fit_names).sum(),
+                len(self.terms_fit_names)))
+
         # fit model
         print("\nFitting autoregressive logistic model ...")
         start_time = time.time()
 
         if self.model_library == 'statsmodels':
+            import statsmodels.discrete.discrete_model as sm
 
             # mount data with pandas
             X = pd.DataFrame(X, columns=self.terms_fit_names)
@@ -322,6 +352,7 @@ class ALR_WRP(object):
 
             # TODO: CAPTURAR LA EVOLUCION DE L (maximun-likelihood) 
             self.model = sm.MNLogit(y,X).fit(
+                start_params = None if start_params is None else start_params.ravel(order='F'),
                 method='lbfgs',
                 maxiter=max_iter,
                 retall=True,
@@ -332,12 +363,21 @@ class ALR_WRP(object):
             )
 
         elif self.model_library == 'sklearn':
+            from sklearn import linear_model
 
             # use sklearn logistig regression
             self.model = linear_model.LogisticRegression(
                 penalty='l2', C=1e5, fit_intercept=False,
-                solver='lbfgs'
+                solver='lbfgs', max_iter=max_iter,
+                warm_start = start_params is not None,
             )
+
+            # sklearn coefficients (n_clusters, terms), first cluster at 0
+            if start_params is not None:
+                self.model.coef_ = np.row_stack(
+                    [np.zeros(len(self.terms_fit_names)), start_params.T])
+                self.model.intercept_ = np.zeros(nc)
+
             self.model.fit(X, y)
 
         else:
@@ -352,6 +392,24 @@ class ALR_WRP(object):
         # save fitted model
         self.SaveModel()
 
+    def GetModelParams(self):
+        '''
+        Fitted model coefficients relative to first cluster
+
+        returns pandas.DataFrame (index: terms, columns: n_clusters-1)
+        '''
+
+        if isinstance(self.model, ALR_Predictor):
+            return self.model.params.iloc[:, 1:]
+
+        elif self.model_library == 'statsmodels':
+            params = self.model.params
+            return pd.DataFrame(params.values, index=params.index)
+
+        elif self.model_library == 'sklearn':
+            coef = self.model.coef_ - self.model.coef_[0]
+            return pd.DataFrame(coef[1:].T, index=self.terms_fit_names)
+
     def SaveModel(self):
         'Saves fitted model (and fitting terms) for future use'
 
@@ -367,8 +425,72 @@ class ALR_WRP(object):
             open(self.p_save_terms_fit, 'wb')
         )
 
-    def LoadModel(self):
-        'Load fitted model (and fitting terms)'
+        # save compact model
+        self.SaveModel_Compact()
+
+    def SaveModel_Compact(self):
+        '''
+        Saves fitted model coefficients and terms settings to netCDF file.
+        Independent of statsmodels / sklearn versions, used with LoadModel(compact=True)
+        '''
+
+        dts = self.d_terms_settings
+
+        # model coefficients (first cluster as reference, coefficients 0)
+        params = self.GetModelParams()
+        coefs = np.column_stack([np.zeros(len(params)), params.values])
+
+        xds_model = xr.Dataset(
+            {
+                'params': (('terms', 'n_clusters'), coefs),
+            },
+            coords = {
+                'terms': list(params.index),
+                'n_clusters': np.arange(1, coefs.shape[1]+1),
+            },
+            attrs = {
+                'cluster_size': self.cluster_size,
+                'mk_order': dts['mk_order'],
+                'constant': int(dts['constant']),
+                'long_term': int(dts['long_term']),
+                'seasonality': int(dts['seasonality'][0]),
+                'covariates': int(dts['covariates'][0]),
+                'covariates_seasonality': int(dts['covariates_seasonality'][0]),
+                'model_library': self.model_library,
+            }
+        )
+
+        # seasonality phases
+        if dts['seasonality'][0]:
+            xds_model['seasonality_phases'] = (('phases',), np.array(dts['seasonality'][1]))
+
+        # covariates names, normalization constants and seasonality
+        if dts['covariates'][0]:
+            xds_cov = dts['covariates'][1]
+            xds_model['cov_names'] = (('cov_names',), xds_cov.cov_names.values)
+            if 'cov_values' in xds_cov.keys():
+                cov_values = xds_cov.cov_values.values
+                xds_model['cov_mean'] = (('cov_names',), cov_values.mean(axis=0))
+                xds_model['cov_std'] = (('cov_names',), cov_values.std(axis=0))
+
+            if dts['covariates_seasonality'][0]:
+                xds_model['cov_seasonality'] = (
+                    ('cov_names',), np.array(dts['covariates_seasonality'][1], dtype=int)
+                )
+
+        xds_model.to_netcdf(self.p_save_model_nc, 'w')
+
+    def LoadModel(self, compact=False):
+        '''
+        Load fitted model (and fitting terms)
+
+        compact  - True for loading model coefficients and terms settings only
+                   (see SaveModel_Compact). Fitting terms are not loaded and
+                   statsmodels / sklearn are not needed.
+        '''
+
+        if compact:
+            return self.LoadModel_Compact()
 
         # load model
         self.model = pickle.load(open(self.p_save_model, 'rb'))
@@ -385,6 +507,45 @@ class ALR_WRP(object):
 
         self.mk_order = self.d_terms_settings['mk_order']
 
+    def LoadModel_Compact(self):
+        'Load model coefficients and terms settings from compact netCDF file'
+
+        with xr.open_dataset(self.p_save_model_nc) as xds_model:
+            xds_model.load()
+
+        at = xds_model.attrs
+
+        # rebuild terms settings
+        dts = {
+            'mk_order': int(at['mk_order']),
+            'constant': bool(at['constant']),
+            'long_term': bool(at['long_term']),
+            'seasonality': (False, []),
+            'covariates': (False, []),
+            'covariates_seasonality': (False, []),
+        }
+
+        if at['seasonality']:
+            dts['seasonality'] = (True, list(xds_model.seasonality_phases.values))
+
+        if at['covariates']:
+            cov_vns = [vn for vn in ['cov_mean', 'cov_std'] if vn in xds_model]
+            dts['covariates'] = (True, xds_model[cov_vns])
+            self.cov_names = xds_model.cov_names.values
+
+            if at['covariates_seasonality']:
+                dts['covariates_seasonality'] = (
+                    True, list(xds_model.cov_seasonality.values.astype(bool))
+                )
+
+        self.d_terms_settings = dts
+        self.terms_fit_names = list(xds_model.terms.values)
+        self.mk_order = dts['mk_order']
+        self.model_library = at['model_library']
+
+        # lightweight predictor
+        self.model = ALR_Predictor(xds_model.params.to_pandas())
+
     def SaveBmus_Fit(self):
         'Saves bmus - fit for future use'
 
@@ -470,7 +631,9 @@ class ALR_WRP(object):
         return f
 
     def Simulate(self, num_sims, time_sim, xds_covars_sim=None,
-                 log_sim=False, overfit_filter=False, of_probs=0.98, of_pers=5):
+                 log_sim=False, log_sims=None, log_time=None,
+                 log_dtype='float32', log_chunk=365,
+                 overfit_filter=False, of_probs=0.98, of_pers=5):
         '''
         Launch ARL model simulations
 
@@ -482,6 +645,12 @@ class ALR_WRP(object):
             ("n_sim" dimension (optional) will be iterated with each simulation)
 
         log_sim            - Store a .nc file with all simulation detailed information.
+            log is written to disk in chunks while simulating, optional log
+            settings:
+            log_sims       - list of simulation indexes to log (default all)
+            log_time       - slice of dates to log (default all)
+            log_dtype      - log floating point data type
+            log_chunk      - number of time steps kept in memory before writing
 
         filters for exceptional ALR overfit probabilities situation and patch:
 
@@ -493,57 +662,131 @@ class ALR_WRP(object):
         class SimLog(object):
             '''
             simulatiom log - records and stores detail info for each time step and n_sim
-            '''
-            def __init__(self, time_yfrac, mk_order, num_sims, cluster_size, terms_fit_names):
 
-                # initialize variables to record
-                self.terms = np.nan * np.zeros((len(time_yfrac)-mk_order,
-                                                num_sims, mk_order+1, len(terms_fit_names)))
-                self.probs = np.nan * np.zeros((len(time_yfrac)-mk_order, num_sims, mk_order+1, cluster_size))
-                self.ptrns = np.nan * np.zeros((len(time_yfrac)-mk_order, num_sims, cluster_size))
-                self.nrnd = np.nan * np.zeros((len(time_yfrac)-mk_order, num_sims))
-                self.evbmu_sims = np.nan * np.zeros((len(time_yfrac)-mk_order, num_sims))
+            data is buffered for log_chunk time steps and written to a netCDF
+            file, only selected simulations and time window are stored.
+            '''
+            def __init__(self, p_save, time_log, mk_order, num_sims, cluster_size,
+                         terms_fit_names, log_sims=None, log_time=None,
+                         log_dtype='float32', log_chunk=365):
+
+                # simulations to log (position at log file)
+                if log_sims == None: log_sims = range(num_sims)
+                self.ix_sims = dict([(s, c) for c, s in enumerate(log_sims)])
+
+                # time window to log [t0, t1)
+                def to_t64(t):
+                    if isinstance(t, str): t = np.datetime64(t)
+                    return time2datetime64([t], 's')[0]
+
+                self.t0, self.t1 = 0, len(time_log)
+                if log_time != None:
+                    t_log = time2datetime64(time_log, 's')
+                    if log_time.start != None:
+                        self.t0 = np.searchsorted(t_log, to_t64(log_time.start))
+                    if log_time.stop != None:
+                        self.t1 = np.searchsorted(
+                            t_log, to_t64(log_time.stop), side='right')
+                nt = self.t1 - self.t0
+
+                if nt <= 0:
+                    raise ValueError(
+                        'log_time {0} outside simulation time'.format(log_time))
+
+                # memory buffers (log_chunk time steps)
+                nc = max(1, min(log_chunk, nt))
+                nm, ntr = mk_order+1, len(terms_fit_names)
+                self.buffs = OrderedDict([
+                    ('alr_terms', np.zeros((nc, nm, ntr), dtype=log_dtype)),
+                    ('probs', np.zeros((nc, nm, cluster_size), dtype=log_dtype)),
+                    ('probTrans', np.zeros((nc, cluster_size), dtype=log_dtype)),
+                    ('nrnd', np.zeros((nc,), dtype=log_dtype)),
+                    ('evbmus_sims', np.zeros((nc,), dtype='int32')),
+                    ('overfit_filter_state', np.zeros((nc,), dtype='int8')),
+                    ('evbmus_sims_filtered', np.zeros((nc,), dtype='int32')),
+                ])
+                self.b0, self.nb = self.t0, 0
+
+                # remove previous file
+                if op.isfile(p_save):
+                    os.remove(p_save)
+                self.p_save = p_save
+
+                # create netCDF file
+                root = netCDF4.Dataset(p_save, 'w', format='NETCDF4')
+                root.createDimension('time', nt)
+                root.createDimension('n_sim', len(self.ix_sims))
+                root.createDimension('mk', nm)
+                root.createDimension('terms', ntr)
+                root.createDimension('n_clusters', cluster_size)
+
+                # coordinates (time stored as StoreBugXdset)
+                units, calendar = 'hours since 1970-01-01 00:00:00', 'standard'
+                dv = root.createVariable('time', 'int64', ('time',))
+                dv[:] = netCDF4.date2num(
+                    list(time_log[self.t0:self.t1]), units=units, calendar=calendar)
+                dv.units = units
+                dv.calendar = calendar
+
+                dv = root.createVariable('n_sim', 'int32', ('n_sim',))
+                dv[:] = list(self.ix_sims.keys())
+
+                dv = root.createVariable('terms', str, ('terms',))
+                dv[:] = np.array(terms_fit_names, dtype=object)
+
+                # log variables (chunked by simulation)
+                d_dims = {
+                    'alr_terms': ('mk', 'terms'),
+                    'probs': ('mk', 'n_clusters'),
+                    'probTrans': ('n_clusters',),
+                }
+                for vn, vb in self.buffs.items():
+                    root.createVariable(
+                        vn, vb.dtype, ('time', 'n_sim') + d_dims.get(vn, ()),
+                        chunksizes = (nc, 1) + vb.shape[1:],
+                    )
 
-                # overfit filter variables (filter states and filtered bmus) 
-                self.of_state = np.zeros((len(time_yfrac)-mk_order, num_sims), dtype=bool)
-                self.of_bmus = np.nan * np.zeros((len(time_yfrac)-mk_order, num_sims))
+                self.root = root
 
             def Add(self, ix_t, ix_s, terms, prob, probTrans, nrnd, of_state, of_bmus):
 
-                # add iteration to log
-                self.terms[ix_t,ix_s,:,:] = terms
-                self.probs[ix_t,ix_s,:,:] = prob
-                self.ptrns[ix_t,ix_s,:] = probTrans
-                self.nrnd[ix_t,ix_s] = nrnd
-                self.evbmu_sims[ix_t,ix_s] = np.where(probTrans>nrnd)[0][0]+1
-
-                # add overfit filter data to log
-                self.of_state[ix_t,ix_s] = of_state
-                self.of_bmus[ix_t,ix_s] = of_bmus
-
-            def Save(self, p_save, terms_names):
-
-                # use xarray to store netcdf
-                xds_log = xr.Dataset(
-                    {
-                        'alr_terms': (('time', 'n_sim', 'mk', 'terms',), self.terms),
-                        'probs': (('time', 'n_sim', 'mk', 'n_clusters'), self.probs),
-                        'probTrans': (('time', 'n_sim', 'n_clusters'), self.ptrns),
-                        'nrnd': (('time', 'n_sim'), self.nrnd),
-                        'evbmus_sims': (('time', 'n_sim'), self.evbmu_sims.astype(int)),
-
-                        'overfit_filter_state': (('time', 'n_sim'), self.of_state),
-                        'evbmus_sims_filtered': (('time', 'n_sim'), self.of_bmus.astype(int)),
-                    },
-
-                    coords = {
-                        'time' : time_sim[mk_order:],
-                        'terms' : terms_names,
-                    },
-                )
+                # check simulation and time window
+                if ix_s not in self.ix_sims or not self.t0 <= ix_t < self.t1:
+                    return
+
+                # add iteration to buffer
+                b = self.nb
+                self.buffs['alr_terms'][b] = terms
+                self.buffs['probs'][b] = prob
+                self.buffs['probTrans'][b] = probTrans
+                self.buffs['nrnd'][b] = nrnd
+                self.buffs['evbmus_sims'][b] = np.where(probTrans>nrnd)[0][0]+1
+
+                # add overfit filter data to buffer
+                self.buffs['overfit_filter_state'][b] = of_state
+                self.buffs['evbmus_sims_filtered'][b] = of_bmus
+                self.nb += 1
+
+                # write buffer when full or at time window end
+                if self.nb == len(self.buffs['nrnd']) or ix_t == self.t1-1:
+                    self.Flush(self.ix_sims[ix_s])
 
-                StoreBugXdset(xds_log, p_save)
-                print('simulation data log stored at {0}\n'.format(p_save))
+            def Flush(self, c_s):
+                'write buffer to log file'
+
+                p0 = self.b0 - self.t0
+                for vn, vb in self.buffs.items():
+                    self.root[vn][p0:p0+self.nb, c_s] = vb[:self.nb]
+
+                # restart buffer
+                self.b0 = self.b0 + self.nb
+                if self.b0 >= self.t1: self.b0 = self.t0
+                self.nb = 0
+
+            def Save(self):
+
+                self.root.close()
+                print('simulation data log stored at {0}\n'.format(self.p_save))
 
         class OverfitFilter(object):
             '''
@@ -591,7 +834,9 @@ class ALR_WRP(object):
 
 
         # switch library probabilities predictor function 
-        if self.model_library == 'statsmodels':
+        if isinstance(self.model, ALR_Predictor):
+            pred_prob_fun = self.model.predict
+        elif self.model_library == 'statsmodels':
             pred_prob_fun = self.model.predict
         elif self.model_library == 'sklearn':
             pred_prob_fun = self.model.predict_proba
@@ -626,11 +871,21 @@ class ALR_WRP(object):
 
         # initialize optional simulation log 
         if log_sim:
-            SL = SimLog(time_yfrac, mk_order, num_sims, self.cluster_size, self.terms_fit_names)
+            SL = SimLog(
+                self.p_log_sim_xds, time_sim[mk_order:], mk_order, num_sims,
+                self.cluster_size, self.terms_fit_names,
+                log_sims = log_sims, log_time = log_time,
+                log_dtype = log_dtype, log_chunk = log_chunk,
+            )
 
         # initialize ALR overfit filter
         ofilt = OverfitFilter(of_probs, of_pers)
 
+        # overfit filter: historical bmus for each day of year
+        if overfit_filter:
+            of_table, of_counts = DayOfYear_Table(evbmus_values, time_fit)
+            doy_sim = day_of_year(time_sim)
+
         # initialize ALR simulated bmus array, and overfit filter register array
         evbmus_sims = np.zeros((len(time_yfrac), num_sims))
         ofbmus_sims = np.zeros((len(time_yfrac), num_sims), dtype=bool)
@@ -704,9 +959,7 @@ class ALR_WRP(object):
                 # override overfit bmus if filter active
                 if ofilt.active:
                     # criteria: random bmus from that date of the year at  historical
-                    ix_of = np.random.choice(np.where(
-                        self.xds_bmus_fit["time.dayofyear"] == time_sim[i].timetuple().tm_yday)[0])
-                    new_bmus = self.xds_bmus_fit.bmus.values[ix_of]
+                    new_bmus = DayOfYear_Draw(of_table, of_counts, doy_sim[i])
 
                 # append_bmus 
                 evbmus = np.append(evbmus, new_bmus)
@@ -742,7 +995,7 @@ class ALR_WRP(object):
         StoreBugXdset(xds_out, self.p_save_sim_xds)
 
         # save log file
-        if log_sim: SL.Save(self.p_log_sim_xds, terms_names)
+        if log_sim: SL.Save()
 
         # overfit filter log
         ofilt.PrintLog()
@@ -878,17 +1131,158 @@ class ALR_WRP(object):
         Interactive plot for simulation log
 
         n_sim  - simulation log to plot
+        t_slice - optional time slice to plot
         '''
 
-        # load fit and sim bmus
-        xds_log = xr.open_dataset(self.p_log_sim_xds, decode_times=True)
+        # open simulation log (lazy, only selection is loaded)
+        with xr.open_dataset(self.p_log_sim_xds, decode_times=True) as xds_log:
+
+            # get simulation (n_sim coordinate: logged simulations indexes)
+            if 'n_sim' in xds_log.coords:
+                log_sim = xds_log.sel(n_sim=n_sim)
+            else:
+                log_sim = xds_log.isel(n_sim=n_sim)
 
-        # get simulation
-        log_sim = xds_log.isel(n_sim=n_sim)
+            if t_slice != None:
+                log_sim = log_sim.sel(time=t_slice)
 
-        if t_slice != None:
-            log_sim = log_sim.sel(time=t_slice)
+            log_sim = log_sim.load()
 
         # plot interactive report
         Plot_Log_Sim(log_sim);
 
+
+class ALR_Predictor(object):
+    '''
+    Lightweight ALR probabilities predictor from model coefficients.
+    (multinomial logistic model, statsmodels / sklearn not needed)
+    '''
+
+    def __init__(self, params):
+        '''
+        params - pandas.DataFrame (index: terms, columns: n_clusters)
+        '''
+
+        self.params = params
+
+    def predict(self, X):
+        '''
+        Clusters probabilities for ALR terms matrix
+
+        X - np.array (n, terms)
+
+        returns np.array (n, n_clusters)
+        '''
+
+        # softmax
+        z = np.dot(X, self.params.values)
+        z = np.exp(z - z.max(axis=1, keepdims=True))
+
+        return z / z.sum(axis=1, keepdims=True)
+
+def Terms_Hash(d_terms_settings, bmus, time, cluster_size):
+    '''
+    Hash for ALR terms settings and fitting data
+
+    returns sha1 hex digest
+    '''
+
+    def to_bytes(v):
+        'array bytes. object arrays (dates, strings) hashed by value'
+
+        v = np.asarray(v)
+        if v.dtype == object and v.size:
+            try:
+                v = time2datetime64(v, 's')
+            except (AttributeError, TypeError, ValueError):
+                v = np.array([str(x) for x in v.ravel()])
+
+        return np.ascontiguousarray(v).tobytes()
+
+    h = hashlib.sha1()
+
+    for k in sorted(d_terms_settings.keys()):
+        h.update(k.encode())
+
+        v = d_terms_settings[k]
+        for x in (v if isinstance(v, tuple) else (v,)):
+            if isinstance(x, xr.Dataset):
+                for vn in sorted(x.variables):
+                    h.update(vn.encode())
+                    h.update(to_bytes(x[vn].values))
+            else:
+                h.update(repr(x).encode())
+
+    h.update(to_bytes(bmus))
+    h.update(to_bytes(time))
+    h.update(repr(cluster_size).encode())
+
+    return h.hexdigest()
+
+def Save_Terms(p_npz, terms, terms_names):
+    'Stores ALR terms (OrderedDict) and terms names at .npz file'
+
+    if not op.isdir(op.dirname(p_npz)):
+        os.makedirs(op.dirname(p_npz))
+
+    np.savez(
+        p_npz,
+        terms_keys = np.array(list(terms.keys())),
+        terms_names = np.array(terms_names),
+        **dict([('t_{0}'.format(c), v) for c, v in enumerate(terms.values())])
+    )
+
+def Load_Terms(p_npz):
+    'Load ALR terms (OrderedDict) and terms names from .npz file'
+
+    with np.load(p_npz) as npz:
+        terms = OrderedDict([
+            (k, npz['t_{0}'.format(c)]) for c, k in enumerate(npz['terms_keys'])
+        ])
+        terms_names = list(npz['terms_names'])
+
+    return terms, terms_names
+
+def DayOfYear_Table(bmus, time):
+    '''
+    Table of historical bmus for each day of the year
+
+    bmus - historical bmus (time,)
+    time - historical time (any date format)
+
+    returns np.array (366 x max. count) with bmus for each day of year (padded
+    with 0) and number of bmus for each day of year (366,).
+    Days without data use previous day of year bmus.
+    '''
+
+    # day of year (0 - 365)
+    doy = day_of_year(time) - 1
+    counts = np.bincount(doy, minlength=366)
+
+    # bmus sorted by day of year, position inside each day
+    o = np.argsort(doy, kind='stable')
+    d_ini = np.cumsum(counts) - counts
+    pos = np.arange(len(doy)) - np.repeat(d_ini, counts)
+
+    table = np.zeros((366, np.max(counts)), dtype=int)
+    table[doy[o], pos] = np.asarray(bmus)[o]
+
+    # days without data (leap day): previous day of year
+    for d in np.where(counts == 0)[0]:
+        table[d], counts[d] = table[d-1], counts[d-1]
+
+    return table, counts
+
+def DayOfYear_Draw(table, counts, doy):
+    '''
+    Random historical bmus for day of year (1 - 366). doy can be an array
+    (for example, one day of year for each simulation)
+
+    table, counts - DayOfYear_Table() output
+    '''
+
+    d = np.asarray(doy) - 1
+    ix = (np.random.rand(*d.shape) * counts[d]).astype(int)
+
+    return table[d, ix]
+
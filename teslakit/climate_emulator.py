@@ -9,6 +9,10 @@ import pickle
 from itertools import permutations
 import glob
 import shutil
+import json
+import hashlib
+import socket
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 # pip
 import numpy as np
@@ -16,7 +20,6 @@ import pandas as pd
 import xarray as xr
 from scipy.special import ndtri  # norm inv
 from scipy.stats import  genextreme, gumbel_l, spearmanr, norm, weibull_min
-from statsmodels.distributions.empirical_distribution import ECDF
 from numpy.random import choice, multivariate_normal, randint, rand
 
 # fix tqdm for notebook 
@@ -29,8 +32,10 @@ def tqdm(*args, **kwargs):
 
 # tk
 from .statistical import Empirical_ICDF
-from .extremes import FitGEV_KMA_Frechet, Smooth_GEV_Shape, ACOV
+from .extremes import FitGEV_Frechet_Samples, GEV_Sample_Key, \
+Smooth_GEV_Shape, ACOV
 from .io.aux_nc import StoreBugXdset
+from .util.operations import segment_index, segment_argmax
 
 from .database import clean_files
 from .plotting.extremes import Plot_GEVParams, Plot_ChromosomesProbs, \
@@ -72,7 +77,7 @@ class Climate_Emulator(object):
         # extremes model params
         self.GEV_Par = None         # GEV fitting parameters
         self.GEV_Par_S = None       # GEV simulation sampled parameters
-        self.sigma = None           # Pearson sigma correlation
+        self.sigma = None           # sigma correlation (Sigma_Dataset)
 
         # chromosomes
         self.do_chrom = True        # True for chromosomes combinations methodology
@@ -88,6 +93,9 @@ class Climate_Emulator(object):
         # to override a particular variable simulation distribution with a Empirical
         self.sim_icdf_empirical_override = []  # full variable name: "family_var_WT", example: ['swell_2_Hs_23', 'sea_Hs_15', ...] 
 
+        # number of parallel processes used at fitting
+        self.num_workers = 1
+
         # simulated waves filter
         self.sim_waves_filter = {
             'hs': (0, 8),
@@ -103,7 +111,8 @@ class Climate_Emulator(object):
         self.p_WVS_TCs   = op.join(p_base, 'WVS_TCs.nc')
         self.p_chrom     = op.join(p_base, 'chromosomes.nc')
         self.p_GEV_Par   = op.join(p_base, 'GEV_Parameters.nc')
-        self.p_GEV_Sigma = op.join(p_base, 'GEV_SigmaCorrelation.nc')
+        self.p_GEV_Sigma = op.join(p_base, 'GEV_SigmaCorrelation.nc')  # old pickle
+        self.p_GEV_Cache = op.join(p_base, 'GEV_FitCache.npz')
 
         self.p_report_fit = op.join(p_base, 'report_fit')
         self.p_report_sim = op.join(p_base, 'report_sim')
@@ -113,6 +122,7 @@ class Climate_Emulator(object):
         self.p_sim_wvs_notcs = op.join(self.p_sims, 'WAVES_noTCs')
         self.p_sim_wvs_tcs   = op.join(self.p_sims, 'WAVES_TCs')
         self.p_sim_tcs       = op.join(self.p_sims, 'TCs')
+        self.p_sim_manifest  = op.join(self.p_sims, 'manifest')
 
     def ConfigVariables(self, config):
         '''
@@ -255,7 +265,7 @@ class Climate_Emulator(object):
         self.KMA_MS = ms_KMA
         self.GEV_Par = GEV_Par
         self.chrom = chromosomes
-        self.sigma = d_sigma
+        self.sigma = Sigma_Dataset(d_sigma)
         self.Save()
 
     def Save(self):
@@ -272,11 +282,10 @@ class Climate_Emulator(object):
         self.WVS_MS.to_netcdf(self.p_WVS_MS)
         self.KMA_MS.to_netcdf(self.p_KMA_MS)
         self.WVS_TCs.to_netcdf(self.p_WVS_TCs)
-        self.chrom.to_netcdf(self.p_chrom)
         self.GEV_Par.to_netcdf(self.p_GEV_Par)
 
-        # store pickle
-        pickle.dump(self.sigma, open(self.p_GEV_Sigma, 'wb'))
+        # chromosomes and sigma correlation share .nc file
+        xr.merge([self.chrom, self.sigma]).to_netcdf(self.p_chrom)
 
         # store config
         pickle.dump(
@@ -298,6 +307,151 @@ class Climate_Emulator(object):
             nm = '{0:08d}.nc'.format(n_sim)  # sim code
             StoreBugXdset(d, op.join(p, nm))
 
+    def Save_SimManifest(self, n_sim, d_rec):
+        '''
+        Store simulation manifest record (one .json file for each simulation,
+        processes sharing the simulation folder do not write the same file)
+
+        d_rec - dict: n_sim, status, seed, checksum, host, date
+        '''
+
+        if not op.isdir(self.p_sim_manifest): os.makedirs(self.p_sim_manifest)
+
+        p_rec = op.join(self.p_sim_manifest, '{0:08d}.json'.format(n_sim))
+        p_tmp = '{0}.{1}.tmp'.format(p_rec, os.getpid())
+        with open(p_tmp, 'w') as jf:
+            json.dump(d_rec, jf, indent=2)
+        os.replace(p_tmp, p_rec)
+
+    def Load_SimManifest(self):
+        '''
+        Load simulations manifest
+
+        returns dict {n_sim: record}
+        '''
+
+        d_man = {}
+        for p_rec in sorted(glob.glob(op.join(self.p_sim_manifest, '*.json'))):
+            with open(p_rec, 'r') as jf:
+                d_rec = json.load(jf)
+            d_man[d_rec['n_sim']] = d_rec
+
+        return d_man
+
+    def Check_Sim(self, n_sim, d_rec):
+        '''
+        Check a simulation is finished and its stored files are valid
+
+        d_rec - simulation manifest record
+
+        returns True / False
+        '''
+
+        if d_rec == None or d_rec.get('status') != 'done':
+            return False
+
+        nm = '{0:08d}.nc'.format(n_sim)  # sim code
+        for p, cs in d_rec['checksum'].items():
+            p_f = op.join(self.p_sims, p, nm)
+            if not op.isfile(p_f) or File_Checksum(p_f) != cs:
+                return False
+
+        return True
+
+    def Simulate(self, xds_DWT, xds_TCs_params, xds_TCs_simulation,
+                 prob_change_TCs, MU_WT, TAU_WT, n_sims=1,
+                 filters={'hs':False, 'tp':False, 'ws':False},
+                 extra_vars_update=[], seed=None, resume=True,
+                 shard=0, n_shards=1):
+        '''
+        Climate Emulator simulation campaign (checkpointed).
+        For each DWTs simulation: Simulate_Waves, Simulate_TCs and SaveSim
+
+        Each simulation status, random seed and stored files checksum is
+        recorded at a manifest (self.p_sim_manifest)
+
+        xds_DWT      - xarray.Dataset, vars: evbmus_sims (time, n_sim)
+        xds_TCs_params, xds_TCs_simulation, prob_change_TCs, MU_WT, TAU_WT,
+        extra_vars_update - view Simulate_TCs()
+        n_sims, filters   - view Simulate_Waves()
+
+        seed     - base random seed (simulation seed: seed + n_sim).
+                   None for random seeds
+        resume   - True: skip finished (and valid) simulations,
+                   redo partial ones. False: redo all simulations
+        shard, n_shards - solve only simulations with n_sim % n_shards == shard
+                   (distribute simulations between processes / machines
+                   sharing the simulation folder)
+
+        returns list of solved simulations indexes
+        '''
+
+        d_man = self.Load_SimManifest() if resume else {}
+
+        # simulation files checksum keys
+        p_fs = [
+            op.relpath(p, self.p_sims) for p in
+            [self.p_sim_wvs_notcs, self.p_sim_tcs, self.p_sim_wvs_tcs]
+        ]
+
+        l_solved = []
+        for n in xds_DWT.n_sim.values[:]:
+            n = int(n)
+
+            # simulation shard
+            if n % n_shards != shard:
+                continue
+
+            # finished simulation
+            d_rec = d_man.get(n)
+            if self.Check_Sim(n, d_rec):
+                continue
+
+            # simulation random seed (partial simulations keep their seed)
+            if d_rec != None and d_rec.get('seed') != None:
+                seed_n = d_rec['seed']
+            elif seed != None:
+                seed_n = (seed + n) % 2**32
+            else:
+                seed_n = randint(2**31)
+
+            d_rec = {
+                'n_sim': n, 'status': 'running', 'seed': int(seed_n),
+                'checksum': {}, 'host': socket.gethostname(),
+                'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            }
+            self.Save_SimManifest(n, d_rec)
+
+            # Select DWTs simulation
+            DWTs = xds_DWT.sel(n_sim=n)
+            np.random.seed(seed_n)
+
+            # Simulate Max. Storms Waves (No TCs)
+            WVS_sim = self.Simulate_Waves(DWTs, n_sims, filters=filters)
+
+            # Simulate TCs and update simulated waves
+            TCs_sim, WVS_upd = self.Simulate_TCs(
+                DWTs, WVS_sim, xds_TCs_params, xds_TCs_simulation,
+                prob_change_TCs, MU_WT, TAU_WT,
+                extra_vars_update=extra_vars_update,
+            )
+
+            # store simulation data
+            self.SaveSim(WVS_sim, TCs_sim, WVS_upd, n)
+
+            # record finished simulation
+            nm = '{0:08d}.nc'.format(n)  # sim code
+            d_rec['checksum'] = dict(
+                [(p, File_Checksum(op.join(self.p_sims, p, nm))) for p in p_fs]
+            )
+            d_rec['status'] = 'done'
+            d_rec['date'] = time.strftime('%Y-%m-%d %H:%M:%S')
+            self.Save_SimManifest(n, d_rec)
+
+            l_solved.append(n)
+
+        return l_solved
+
     def Load(self):
         'Loads fitted climate emulator data'
 
@@ -305,11 +459,19 @@ class Climate_Emulator(object):
         self.WVS_MS = xr.open_dataset(self.p_WVS_MS)
         self.KMA_MS = xr.open_dataset(self.p_KMA_MS)
         self.WVS_TCs = xr.open_dataset(self.p_WVS_TCs)
-        self.chrom = xr.open_dataset(self.p_chrom)
         self.GEV_Par = xr.open_dataset(self.p_GEV_Par)
 
-        # store pickle
-        self.sigma = pickle.load(open(self.p_GEV_Sigma, 'rb'))
+        # chromosomes and sigma correlation
+        xds_chrom = xr.open_dataset(self.p_chrom)
+        self.chrom = xds_chrom[['chrom', 'probs']]
+
+        if 'sigma_corr' in xds_chrom.variables:
+            vns_sigma = [vn for vn in xds_chrom.data_vars if vn.startswith('sigma_')]
+            self.sigma = xds_chrom[vns_sigma]
+
+        else:
+            # sigma correlation stored with pickle (old emulator fits)
+            self.sigma = Sigma_Dataset(pickle.load(open(self.p_GEV_Sigma, 'rb')))
 
         # load config
         self.fams, self.vars_GEV, self.vars_EMP, self.vars_WBL, self.extra_variables = pickle.load(
@@ -351,37 +513,139 @@ class Climate_Emulator(object):
         TCs - True / False. Load WVS (TCs updated) + TCs / WVS (without TCs) simulations
         '''
 
-        # count available waves simulations
-        n_sims_DWTs = len(glob.glob(op.join(self.p_sim_wvs_tcs,'*.nc' )))
-
-        # iterate over simulations
-        l_sims = []
-        for n in range(n_sims_DWTs):
-
-            if TCs:
-                # Load simulated Waves (TCs updated) and TCs
-                _, TCs_sim, WVS_upd = self.LoadSim(n_sim = n)
+        # load simulations storms columns
+        xds_sims = self.LoadSim_Columns(n_sim_ce=n_sim_ce, TCs=TCs)
+        vns = [vn for vn in xds_sims.data_vars if vn not in ['sim_offset']]
 
-                pd_sim = xr.merge(
-                    [WVS_upd.isel(n_sim = n_sim_ce), TCs_sim.isel(n_sim = n_sim_ce)]
-                ).to_dataframe()
+        return pd.DataFrame(dict([(vn, xds_sims[vn].values) for vn in vns]))
 
-            else:
-                # Load simulated Waves (without TCs)
-                WVS_sim, _, _ = self.LoadSim(n_sim = n)
-
-                pd_sim = WVS_sim.isel(n_sim = n_sim_ce).to_dataframe()
+    def LoadSim_Columns(self, vns=None, n_sims=None, n_sim_ce=0, TCs=True,
+                        num_workers=1, lazy=False):
+        '''
+        Load waves and TCs (1 DWT -> 1 output) simulations as columns:
+        storms from all simulations concatenated. Only requested variables
+        and simulations are read
+
+        vns         - list of variables to load (default: all)
+        n_sims      - list of DWTs simulations to load (default: all stored)
+        n_sim_ce    - inner climate emulator simulation
+        TCs         - True / False. Load WVS (TCs updated) + TCs / WVS (without TCs) simulations
+        num_workers - number of threads reading simulation files
+        lazy        - True: returns a dask backed dataset (data is read on demand)
+
+        returns xarray.Dataset
+            vars: vns, time, n_sim  (dims: storm)
+                  sim_offset (dims: sim), first storm of each simulation
+        '''
 
-            # add columns
-            pd_sim['n_sim'] = n  # store simulation index with data
-            pd_sim['time'] = pd_sim.index  # store dates as a variable
+        # simulation folders
+        if TCs:
+            p_fs = [self.p_sim_wvs_tcs, self.p_sim_tcs]
+        else:
+            p_fs = [self.p_sim_wvs_notcs]
 
-            l_sims.append(pd_sim)
+        # available simulations
+        if n_sims == None:
+            n_sims = sorted(
+                [int(op.basename(p)[:-3]) for p in glob.glob(op.join(p_fs[0], '*.nc'))]
+            )
+        n_sims = [int(n) for n in n_sims]
+
+        # open (lazy) simulation files. each variable from its first file,
+        # storms time axes are aligned
+        def open_sim(n, chunks=None):
+            nm = '{0:08d}.nc'.format(n)  # sim code
+            l_xds = []
+            for p in p_fs:
+                xds = xr.open_dataset(op.join(p, nm), chunks=chunks)
+                if 'n_sim' in xds.dims:
+                    xds = xds.isel(n_sim = n_sim_ce)
+                l_xds.append(xds)
+
+            # WVS and TCs storms time axes (outer join, as xr.merge)
+            if len(l_xds) > 1 and not all(
+                x.indexes['time'].equals(l_xds[0].indexes['time']) for x in l_xds[1:]):
+                l_xds = list(xr.align(*l_xds, join='outer'))
+            return l_xds
+
+        def sim_vars(l_xds):
+            d_vs = {}
+            for xds in l_xds:
+                for vn in xds.data_vars:
+                    if vn not in d_vs and (vns == None or vn in vns):
+                        d_vs[vn] = xds[vn]
+            return d_vs
+
+        # variables (from first simulation)
+        l_xds = open_sim(n_sims[0])
+        d_vs = sim_vars(l_xds)
+        vns = list(d_vs.keys())
+        for xds in l_xds: xds.close()
+
+        # lazy: concatenate dask backed simulations
+        if lazy:
+            l_sims = []
+            for n in n_sims:
+                d_vs = sim_vars(open_sim(n, chunks={}))
+                t = d_vs[vns[0]].time.values[:]
+                xds = xr.Dataset(
+                    dict([(vn, (('storm',), d_vs[vn].data)) for vn in vns])
+                )
+                xds['time'] = (('storm',), t)
+                xds['n_sim'] = (('storm',), np.full(len(t), n))
+                l_sims.append(xds)
+
+            xds_sims = xr.concat(l_sims, dim='storm')
+            n_storms = [len(x.storm) for x in l_sims]
+            xds_sims['sim_offset'] = (('sim',), np.cumsum([0] + n_storms[:-1]))
+            xds_sims.coords['sim'] = n_sims
+
+            return xds_sims
+
+        # simulations size and data types (files metadata)
+        n_storms, t_obj, d_dt = [], False, {}
+        for n in n_sims:
+            l_xds = open_sim(n)
+            d_vs = sim_vars(l_xds)
+            n_storms.append(len(l_xds[0].time))
+            t_obj = t_obj or l_xds[0].time.dtype == object
+            for vn in vns:
+                d_dt[vn] = np.result_type(d_dt.get(vn, d_vs[vn].dtype), d_vs[vn].dtype)
+            for xds in l_xds: xds.close()
+
+        sim_offset = np.cumsum([0] + n_storms[:-1])
+        n_total = int(np.sum(n_storms))
+
+        # preallocate columns
+        d_cols = dict([(vn, np.empty(n_total, dtype=d_dt[vn])) for vn in vns])
+        d_cols['time'] = np.empty(n_total, dtype=object if t_obj else 'datetime64[ns]')
+        d_cols['n_sim'] = np.repeat(n_sims, n_storms)
+
+        # read each simulation into its columns slice
+        def read_sim(i):
+            i0, i1 = sim_offset[i], sim_offset[i] + n_storms[i]
+            l_xds = open_sim(n_sims[i])
+            d_vs = sim_vars(l_xds)
+            for vn in vns:
+                d_cols[vn][i0:i1] = d_vs[vn].values[:]
+            d_cols['time'][i0:i1] = l_xds[0].time.values[:]
+            for xds in l_xds: xds.close()
+
+        if num_workers > 1:
+            with ThreadPoolExecutor(max_workers=num_workers) as exe:
+                list(exe.map(read_sim, range(len(n_sims))))
+        else:
+            for i in range(len(n_sims)):
+                read_sim(i)
 
-        # join all waves simulations
-        all_sims = pd.concat(l_sims, ignore_index=True)
+        # columns dataset
+        xds_sims = xr.Dataset(
+            dict([(vn, (('storm',), d_cols[vn])) for vn in d_cols.keys()])
+        )
+        xds_sims['sim_offset'] = (('sim',), sim_offset)
+        xds_sims.coords['sim'] = n_sims
 
-        return all_sims
+        return xds_sims
 
     def Set_Simulation_Folder(self, p_sim, copy_WAVES_noTCs=False):
         '''
@@ -399,6 +663,7 @@ class Climate_Emulator(object):
         self.p_sim_wvs_notcs = op.join(self.p_sims, 'WAVES_noTCs')
         self.p_sim_wvs_tcs   = op.join(self.p_sims, 'WAVES_TCs')
         self.p_sim_tcs       = op.join(self.p_sims, 'TCs')
+        self.p_sim_manifest  = op.join(self.p_sims, 'manifest')
 
         # optional copy files
         if copy_WAVES_noTCs:
@@ -421,24 +686,32 @@ class Climate_Emulator(object):
         return dates_tup_WT
 
     def Calc_StormsMaxProxy(self, wvs_PROXY, lt_storm_dates):
-        'Returns xarray.Dataset with max. PROXY variable value and time'
+        '''
+        Returns xarray.Dataset with max. PROXY variable value and time
 
-        # find max PROXY inside each storm
-        ms_PROXY = []
-        ms_times = []
-        for d1, d2 in lt_storm_dates:
+        Storm window: [d1, d2 + 23h]. Ties are solved with first maximum time,
+        windows without PROXY data are discarded.
+        '''
 
-            # get TWL inside WT window
-            wt_PROXY = wvs_PROXY.sel(time = slice(d1, d2 + np.timedelta64(23,'h')))[:]
+        time = wvs_PROXY.time.values[:]
+        vv = wvs_PROXY.values[:]
 
-            # get window maximum TWL date
-            wt_PROXY_max = wt_PROXY.where(wt_PROXY==wt_PROXY.max(), drop=True).squeeze()
+        # storm windows to time index
+        d1s = np.array([d1 for d1, _ in lt_storm_dates], dtype=time.dtype)
+        d2s = np.array([d2 for _, d2 in lt_storm_dates], dtype=time.dtype)
+        ix_1 = np.searchsorted(time, d1s, side='left')
+        ix_2 = np.searchsorted(time, d2s + np.timedelta64(23,'h'), side='right')
 
-            # append data
-            ms_PROXY.append(wt_PROXY_max.values)
-            ms_times.append(wt_PROXY_max.time.values)
+        # find max PROXY inside each storm (segmented argmax)
+        seg_len = ix_2 - ix_1
+        ix_1, seg_len = ix_1[seg_len > 0], seg_len[seg_len > 0]
+        ix_seg, seg_ini = segment_index(ix_1, seg_len)
+        ix_max = segment_argmax(vv[ix_seg], seg_ini)
 
-        return wvs_PROXY.sel(time=ms_times)
+        # discard windows with only nans
+        ix_max = ix_max[ix_max < len(ix_seg)]
+
+        return wvs_PROXY.isel(time=ix_seg[ix_max])
 
     def Calc_GEVParams(self, xds_KMA_MS, xds_WVS_MS):
         '''
@@ -460,11 +733,35 @@ class Climate_Emulator(object):
             }
         )
 
+        # load GEV fitting cache (only refit changed WT-variable samples)
+        d_cache = {}
+        if op.isfile(self.p_GEV_Cache):
+            with np.load(self.p_GEV_Cache) as npz:
+                d_cache = dict(zip(npz['key'], npz['params']))
+
         # Fit each wave family var to GEV distribution (using KMA bmus)
-        for vn in vars_gev:
-            gp_pars = FitGEV_KMA_Frechet(
-                bmus, n_clusters, xds_WVS_MS[vn].values[:])
-            xds_GEV_Par[vn] = (('n_cluster', 'parameter',), gp_pars)
+        l_var = [
+            xds_WVS_MS[vn].values[np.where((bmus==i+1))[0]] \
+            for vn in vars_gev for i in range(n_clusters)
+        ]
+        gp_pars = FitGEV_Frechet_Samples(
+            l_var, num_workers=self.num_workers, cache=d_cache)
+
+        for c, vn in enumerate(vars_gev):
+            xds_GEV_Par[vn] = (
+                ('n_cluster', 'parameter',),
+                gp_pars[c*n_clusters:(c+1)*n_clusters, :]
+            )
+
+        # store GEV fitting cache (only current WT-variable samples)
+        if not op.isdir(self.p_base): os.makedirs(self.p_base)
+        np.savez(
+            self.p_GEV_Cache,
+            key = np.array([GEV_Sample_Key(v) for v in l_var]),
+            variable = np.repeat(vars_gev, n_clusters),
+            n_cluster = np.tile(np.arange(n_clusters)+1, len(vars_gev)),
+            params = gp_pars,
+        )
 
         return xds_GEV_Par
 
@@ -548,113 +845,18 @@ class Climate_Emulator(object):
             }
         )
 
-    def Calc_SigmaCorrelation(self, xds_KMA_MS, xds_WVS_MS, xds_GEV_Par):
-        'Calculate Sigma Pearson correlation for each WT-chromosome combo'
-
-        bmus = xds_KMA_MS.bmus.values[:]
-        cenEOFs = xds_KMA_MS.cenEOFs.values[:]
-        n_clusters = len(xds_KMA_MS.n_clusters)
-        wvs_fams = self.fams
-        vars_extra = self.extra_variables
-        vars_GEV = self.vars_GEV
-
-        # smooth GEV shape parameter 
-        d_shape = {}
-        for vn in vars_GEV:
-            sh_GEV = xds_GEV_Par.sel(parameter='shape')[vn].values[:]
-            d_shape[vn] = Smooth_GEV_Shape(cenEOFs, sh_GEV)
-
-        # Get sigma correlation for each KMA cluster 
-        d_sigma = {}  # nested dict [WT][crom]
-        for iwt in range(n_clusters):
-            c = iwt+1
-            pos = np.where((bmus==c))[0]
-            d_sigma[c] = {}
-
-            # current cluster waves
-            xds_K_wvs = xds_WVS_MS.isel(time=pos)
-
-            # get chromosomes from waves (0/1)
-            var_c = np.column_stack(
-                [xds_K_wvs['{0}_Hs'.format(x)].values[:] for x in wvs_fams]
-            )
-            var_c[~np.isnan(var_c)] = 1
-            var_c[np.isnan(var_c)] = 0
-            chrom = ChromMatrix(var_c)
-
-            # get sigma for each chromosome
-            for ucix, uc in enumerate(chrom):
-                wt_crom = 1  # data / no data 
-
-                # find data position for this chromosome
-                p_c = np.where((var_c == uc).all(axis=1))[0]
-
-                # if not enought data, get all chromosomes with shared 1s
-                if len(p_c) < 20:
-                    p1s = np.where(uc==1)[0]
-                    p_c = np.where((var_c[:,p1s] == uc[p1s]).all(axis=1))[0]
-
-                    wt_crom = 0  # data / no data 
-
-                # select waves chrom data 
-                xds_chr_wvs = xds_K_wvs.isel(time=p_c)
-
-                # solve normal inverse GEV/EMP/WBL CDF for each active chromosome
-                to_corr = np.empty((0, len(p_c)))  # append for spearman correlation
-                for i_c in np.where(uc==1)[0]:
-
-                    # get wave family chromosome variables
-                    fam_n = wvs_fams[i_c]
-                    vn_Hs = '{0}_Hs'.format(fam_n)
-                    vn_Tp = '{0}_Tp'.format(fam_n)
-                    vn_Dir = '{0}_Dir'.format(fam_n)
-
-                    vv_Hs = xds_chr_wvs[vn_Hs].values[:]
-                    vv_Tp = xds_chr_wvs[vn_Tp].values[:]
-                    vv_Dir = xds_chr_wvs[vn_Dir].values[:]
-
-                    # Hs 
-                    norm_Hs = self.CDF_Distribution(
-                        vn_Hs, vv_Hs, xds_GEV_Par, d_shape, iwt)
-
-                    # Tp 
-                    norm_Tp = self.CDF_Distribution(
-                        vn_Tp, vv_Tp, xds_GEV_Par, d_shape, iwt)
-
-                    # Dir 
-                    norm_Dir = self.CDF_Distribution(
-                        vn_Dir, vv_Dir, xds_GEV_Par, d_shape, iwt)
-
-                    # normal inverse CDF 
-                    u_cdf = np.column_stack([norm_Hs, norm_Tp, norm_Dir])
-                    u_cdf[u_cdf>=1.0] = 0.999999
-                    inv_n = ndtri(u_cdf)
-
-                    # concatenate data for correlation
-                    to_corr = np.concatenate((to_corr, inv_n.T), axis=0)
-
-                # concatenate extra variables for correlation
-                for vn in vars_extra:
-                    vv = xds_chr_wvs[vn].values[:]
-
-                    norm_vn = self.CDF_Distribution(vn, vv, xds_GEV_Par, d_shape, iwt)
-                    norm_vn[norm_vn>=1.0] = 0.999999
-
-                    inv_n = ndtri(norm_vn)
-                    to_corr = np.concatenate((to_corr, inv_n[:, None].T), axis=0)
-
-                # sigma: spearman correlation
-                corr, pval = spearmanr(to_corr, axis=1)
+    def Calc_SigmaCorrelation(self, xds_KMA_MS, xds_WVS_MS, xds_GEV_Par,
+                              all_on=False):
+        '''
+        Calculate Sigma Pearson correlation for each WT-chromosome combo
 
-                # store data at dict
-                d_sigma[c][ucix] = {
-                    'corr': corr, 'data': len(p_c), 'wt_crom': wt_crom
-                }
+        all_on - True for using only all-on chromosome combination
+                 (waves families nans are filled)
 
-        return d_sigma
+        WTs are solved in parallel (self.num_workers processes)
 
-    def Calc_SigmaCorrelation_AllOn_Chromosomes(self, xds_KMA_MS, xds_WVS_MS, xds_GEV_Par):
-        'Calculate Sigma Pearson correlation for each WT, all on chrom combo'
+        returns nested dict [WT][chrom]: {'corr', 'data', 'wt_crom'}
+        '''
 
         bmus = xds_KMA_MS.bmus.values[:]
         cenEOFs = xds_KMA_MS.cenEOFs.values[:]
@@ -663,79 +865,66 @@ class Climate_Emulator(object):
         vars_extra = self.extra_variables
         vars_GEV = self.vars_GEV
 
+        # waves data matrix (storms x variables)
+        vns = ['{0}_{1}'.format(f, v) for f in wvs_fams for v in ['Hs','Tp','Dir']]
+        vns = vns + list(vars_extra)
+        np_wvs = np.column_stack([xds_WVS_MS[vn].values[:] for vn in vns])
+
+        # families (Hs, Tp, Dir) and extra variables columns
+        ix_fams = np.arange(3*len(wvs_fams)).reshape(-1, 3)
+        ix_extra = list(range(3*len(wvs_fams), len(vns)))
+
+        # chromosomes matrix
+        chrom = None
+        if not all_on:
+            chrom = ChromMatrix(np.empty((0, len(wvs_fams))))
+
         # smooth GEV shape parameter 
         d_shape = {}
         for vn in vars_GEV:
             sh_GEV = xds_GEV_Par.sel(parameter='shape')[vn].values[:]
             d_shape[vn] = Smooth_GEV_Shape(cenEOFs, sh_GEV)
 
-        # Get sigma correlation for each KMA cluster 
-        d_sigma = {}  # nested dict [WT][crom]
-        for iwt in range(n_clusters):
-            c = iwt+1
-            pos = np.where((bmus==c))[0]
-            d_sigma[c] = {}
-
-            # current cluster waves
-            xds_K_wvs = xds_WVS_MS.isel(time=pos)
-
-            # append data for spearman correlation
-            to_corr = np.empty((0, len(xds_K_wvs.time)))
-
-            # solve normal inverse GEV/EMP/WBL CDF for each waves family 
-            for fam_n in wvs_fams:
-
-                # get wave family variables
-                vn_Hs = '{0}_Hs'.format(fam_n)
-                vn_Tp = '{0}_Tp'.format(fam_n)
-                vn_Dir = '{0}_Dir'.format(fam_n)
-
-                vv_Hs = xds_K_wvs[vn_Hs].values[:]
-                vv_Tp = xds_K_wvs[vn_Tp].values[:]
-                vv_Dir = xds_K_wvs[vn_Dir].values[:]
-
-                # fix fams nan: Hs 0, Tp mean, dir mean
-                p_nans = np.where(np.isnan(vv_Hs))[0]
-                vv_Hs[p_nans] = 0
-                vv_Tp[p_nans] = np.nanmean(vv_Tp)
-                vv_Dir[p_nans] = np.nanmean(vv_Dir)
-
-                # Hs 
-                norm_Hs = self.CDF_Distribution(vn_Hs, vv_Hs, xds_GEV_Par, d_shape, iwt)
-
-                # Tp 
-                norm_Tp = self.CDF_Distribution(vn_Tp, vv_Tp, xds_GEV_Par, d_shape, iwt)
-
-                # Dir 
-                norm_Dir = self.CDF_Distribution(vn_Dir, vv_Dir, xds_GEV_Par, d_shape, iwt)
-
-                # normal inverse CDF 
-                u_cdf = np.column_stack([norm_Hs, norm_Tp, norm_Dir])
-                u_cdf[u_cdf>=1.0] = 0.999999
-                inv_n = ndtri(u_cdf)
-
-                # concatenate data for correlation
-                to_corr = np.concatenate((to_corr, inv_n.T), axis=0)
-
-            # concatenate extra variables for correlation
-            for vn in vars_extra:
-                vv = xds_K_wvs[vn].values[:]
+        # each variable CDF distribution
+        def wt_distributions(iwt):
+            l_dist = []
+            for vn in vns:
+                if vn in vars_GEV:
+                    loc_g = xds_GEV_Par.sel(parameter='location')[vn].values[iwt]
+                    sca_g = xds_GEV_Par.sel(parameter='scale')[vn].values[iwt]
+                    l_dist.append(('GEV', (d_shape[vn][iwt], loc_g, sca_g)))
+                elif vn in self.vars_EMP:
+                    l_dist.append(('EMP',))
+                elif vn in self.vars_WBL:
+                    l_dist.append(('WBL',))
+                else:
+                    raise ValueError(
+                        'variable {0} has no distribution configured'.format(vn))
+            return l_dist
 
-                norm_vn = self.CDF_Distribution(vn, vv, xds_GEV_Par, d_shape, iwt)
-                norm_vn[norm_vn>=1.0] = 0.999999
+        # each KMA cluster data
+        l_args = []
+        for iwt in range(n_clusters):
+            pos = np.where((bmus==iwt+1))[0]
+            l_args.append(
+                (np_wvs[pos,:], ix_fams, ix_extra, wt_distributions(iwt), chrom)
+            )
 
-                inv_n = ndtri(norm_vn)
-                to_corr = np.concatenate((to_corr, inv_n[:, None].T), axis=0)
+        # Get sigma correlation for each KMA cluster (optional process pool)
+        if self.num_workers > 1 and n_clusters > 1:
+            with ProcessPoolExecutor(max_workers=self.num_workers) as exe:
+                l_sigma = list(exe.map(SigmaCorrelation_WT, *zip(*l_args)))
+        else:
+            l_sigma = [SigmaCorrelation_WT(*a) for a in l_args]
 
-            # sigma: spearman correlation
-            corr, pval = spearmanr(to_corr, axis=1)
+        # nested dict [WT][crom]
+        return dict([(iwt+1, s) for iwt, s in enumerate(l_sigma)])
 
-            # store data at dict (keep cromosomes structure)
-            d_sigma[c][0] = {
-                'corr': corr, 'data': len(xds_K_wvs.time), 'wt_crom': 1
-            }
+    def Calc_SigmaCorrelation_AllOn_Chromosomes(self, xds_KMA_MS, xds_WVS_MS, xds_GEV_Par):
+        'Calculate Sigma Pearson correlation for each WT, all on chrom combo'
 
-        return d_sigma
+        return self.Calc_SigmaCorrelation(
+            xds_KMA_MS, xds_WVS_MS, xds_GEV_Par, all_on=True)
 
     def GEV_Parameters_Sampling(self, n_sims):
         '''
@@ -966,6 +1155,7 @@ class Climate_Emulator(object):
         elif vn in vars_EMP:
 
             # empirical CDF
+            from statsmodels.distributions.empirical_distribution import ECDF
             ecdf = ECDF(vv)
             norm_VV = ecdf(vv)
 
@@ -1030,7 +1220,7 @@ class Climate_Emulator(object):
         bmus                 - KMA max. storms bmus series
         n_clusters           - KMA number of clusters
         chrom, chrom_probs   - chromosomes and probabilities
-        sigma                - pearson correlation for each WT
+        sigma                - sigma correlation for each WT - chrom (Sigma_Dataset)
         xds_GEV_Par_Sampled  - GEV/GUMBELL parameters sampled for simulation
         DWT                  - np.array with DWT bmus sim series (dims: time,)
         filters              - filter simulated waves by hs, tp, and/or wave setpness
@@ -1056,6 +1246,10 @@ class Climate_Emulator(object):
         # extra variables (optional)
         vars_extra = self.extra_variables
 
+        # sigma correlation factors (WT, chrom, var_i, var_j)
+        sigma_chol = sigma.sigma_chol.values[:]
+        sigma_nvar = sigma.sigma_nvar.values[:]
+
         # simulate one value for each storm 
         dwt_df = np.diff(DWT)
         dwt_df[-1] = 1  # ensure last day storm
@@ -1086,10 +1280,10 @@ class Climate_Emulator(object):
                 ci = choice(range(chrom.shape[0]), 1, p=pr)
                 crm = chrom[ci].astype(int).squeeze()
 
-                # get sigma correlation for this WT - crm combination 
-                corr = sigma[WT][int(ci)]['corr']
-                mvn_m = np.zeros(corr.shape[0])
-                sims = multivariate_normal(mvn_m, corr)
+                # correlated normal draw: sigma factor for this WT - crm combination 
+                nv = sigma_nvar[int(ci)]
+                chol = sigma_chol[iwt, int(ci), :nv, :nv]
+                sims = chol.dot(np.random.standard_normal(nv))
                 prob_sim = norm.cdf(sims, 0, 1)
 
                 # solve normal inverse CDF for each active chromosome
@@ -1273,119 +1467,113 @@ class Climate_Emulator(object):
                 xds_wvs_sim[vn].values[:] for vn in extra_vars_update
             ])
 
+        # KMA WTs MU, TAU flattened (and each WT start position)
+        all_MUs = np.concatenate(MU_WT)
+        all_TAUs = np.concatenate(TAU_WT)
+        n_mutau = np.array([len(x) for x in MU_WT])
+        ix_mutau = np.cumsum(n_mutau) - n_mutau
+
+        # probabilities of TC category change (last: TC does not enter)
+        prob_t = np.row_stack([prob_TCs, np.ones(prob_TCs.shape[1])])
+
+        # TCs pools: indexes of TCs for each category
+        s_pmin = TCs_params.pressure_min.values[:]
+        cat_bands = {
+            0:(1000, np.nanmax(s_pmin)+1),
+            1:(979, 1000),
+            2:(964, 979),
+            3:(944, 964),
+            4:(920, 944),
+            5:(np.nanmin(s_pmin)-1, 920),
+        }
+        cat_pools = dict(
+            [(k, np.where((s_pmin > p1) & (s_pmin <= p2))[0])
+             for k, (p1, p2) in cat_bands.items()]
+        )
+
+        # TCs simulated data
+        tcs_mu = TCs_simulation.mu.values[:]
+        tcs_ss = TCs_simulation.ss.values[:]
+        tcs_wvs = np.column_stack([
+            TCs_simulation[vn].values[:] for vn in ['hs', 'tp', 'dir']
+        ])
+        if extra_vars_update:
+            tcs_extra = np.column_stack([
+                TCs_simulation[vn].values[:] for vn in extra_vars_update
+            ])
+
+        # locate index of wave family to modify
+        ixu = wvs_fams.index(mod_fam) * 3
+
         # new progress bar 
         pbar = tqdm(
             total=len(DWT_sim),
             desc = 'C.E: Sim. TCs  '
         )
 
-        # Simulate TCs (mu, ss, tau)
+        # Simulate TCs (mu, ss, tau). storms with nans or values < 0 are
+        # generated again until all storms are solved
         sims_out = np.zeros((len(DWT_sim), 3))
-        c = 0
-        while c < len(DWT_sim):
-            WT = int(DWT_sim[c])
-            iwt = WT - 1
-
-            do_upd_wvs = False  # to record when to update simulated waves
-
-            # KMA Weather Types tcs generation
-            if WT <= n_clusters:
-
-                # get random MU,TAU from current WT
-                # TODO: random excluyente?
-                ri = randint(len(MU_WT[iwt]))
-                mu_s = MU_WT[iwt][ri]
-                tau_s = TAU_WT[iwt][ri]
-                ss_s = 0
-
-            # TCs Weather Types waves generation
-            else:
-                # get probability of category change for this WT
-                prob_t = np.append(prob_TCs[:, iwt-n_clusters], 1)
-
-                # generate random r2 category
-                ri = rand()
-                si = np.where(prob_t >= ri)[0][0]
-
-                if si == len(prob_t)-1:
-                    # TC does not enter. random mu_s, 0.5 tau_s, 0 ss_s
-                    all_MUs = np.concatenate(MU_WT)
-                    ri = randint(len(all_MUs))
-                    # TODO: check mu 0s, set nans (?)
-
-                    mu_s = all_MUs[ri]
-                    tau_s = 0.5
-                    ss_s = 0
-
-                else:
-
-                    # locate TCs with category "si"
-                    s_pmin = TCs_params.pressure_min.values[:]
-                    p1, p2 = {
-                        0:(1000, np.nanmax(s_pmin)+1),
-                        1:(979, 1000),
-                        2:(964, 979),
-                        3:(944, 964),
-                        4:(920, 944),
-                        5:(np.nanmin(s_pmin)-1, 920),
-                    }[si]
-
-                    psi = np.where((s_pmin > p1) & (s_pmin <= p2))[0]
-
-                    if psi.any():
-
-                        # get a random TC from psi indexes
-                        ri = choice(psi)
-
-                        mu_s = TCs_simulation.mu.values[ri]
-                        ss_s = TCs_simulation.ss.values[ri]
-                        tau_s = 0.5
-
-                        # Get waves family data from simulated TCs (numerical+rbf)
-                        mod_fam_Hs = TCs_simulation.hs.values[ri]
-                        mod_fam_Tp = TCs_simulation.tp.values[ri]
-                        mod_fam_Dir = TCs_simulation.dir.values[ri]
-
-                        # locate index of wave family to modify
-                        ixu = wvs_fams.index(mod_fam) * 3
-
-                        # replace waves: only sea family 
-                        upd_wvs = sim_wvs[c,:] * 0
-                        upd_wvs[ixu:ixu+3] = [mod_fam_Hs, mod_fam_Tp, mod_fam_Dir]
-                        do_upd_wvs = True
-
-                        # replace extra variables (optional)
-                        if extra_vars_update:
-                            upd_extra = sim_extra[c,:] * 0
-                            for ve_c, ve in enumerate(extra_vars_update):
-                                upd_extra[ve_c] = TCs_simulation[ve].values[ri]
-
-                    else:
-                        # TODO: no deberia caer aqui
-                        mu_s = 0
-                        ss_s = 0
-                        tau_s = 0
-
-            sim_row = np.array([mu_s, tau_s, ss_s])
+        ix_p = np.arange(len(DWT_sim))  # storms pending
+        while len(ix_p) > 0:
+            iwt = DWT_sim[ix_p].astype(int) - 1
+
+            sim_rows = np.zeros((len(ix_p), 3))
+            ri_tcs = np.full(len(ix_p), -1)  # TCs used for updating waves
+
+            # KMA Weather Types tcs generation: random MU,TAU from current WT
+            p_kma = np.where(iwt < n_clusters)[0]
+            if len(p_kma):
+                iw = iwt[p_kma]
+                ri = ix_mutau[iw] + randint(0, n_mutau[iw])
+                sim_rows[p_kma, 0] = all_MUs[ri]
+                sim_rows[p_kma, 1] = all_TAUs[ri]
+
+            # TCs Weather Types generation: random category change
+            p_tcs = np.where(iwt >= n_clusters)[0]
+            if len(p_tcs):
+                itc = iwt[p_tcs] - n_clusters
+                si = np.argmax(prob_t[:, itc] >= rand(len(p_tcs)), axis=0)
+
+                # TC does not enter. random mu_s, 0.5 tau_s, 0 ss_s
+                p_ne = p_tcs[si == prob_t.shape[0]-1]
+                if len(p_ne):
+                    sim_rows[p_ne, 0] = all_MUs[randint(len(all_MUs), size=len(p_ne))]
+                    sim_rows[p_ne, 1] = 0.5
+
+                # get a random TC from each category pool 
+                for k, psi in cat_pools.items():
+                    p_k = p_tcs[si == k]
+                    if len(p_k) == 0 or len(psi) == 0:
+                        continue  # TODO: no deberia caer aqui (mu, tau, ss: 0)
+
+                    ri = psi[randint(len(psi), size=len(p_k))]
+                    sim_rows[p_k, 0] = tcs_mu[ri]
+                    sim_rows[p_k, 1] = 0.5
+                    sim_rows[p_k, 2] = tcs_ss[ri]
+                    ri_tcs[p_k] = ri
 
             # no nans or values < 0 stored 
-            if ~np.isnan(sim_row).any() and len(np.where(sim_row<0)[0])==0:
+            p_ok = ~np.isnan(sim_rows).any(axis=1) & ~(sim_rows < 0).any(axis=1)
+            ix_ok = ix_p[p_ok]
 
-                # store TCs sim
-                sims_out[c] = sim_row
+            # store TCs sim
+            sims_out[ix_ok] = sim_rows[p_ok]
 
-                if do_upd_wvs:
-                    # update waves: only sea from TCs
-                    sim_wvs[c, :] = upd_wvs
+            # update waves: only sea from TCs (other families set to 0)
+            p_upd = p_ok & (ri_tcs >= 0)
+            ix_upd, ri_upd = ix_p[p_upd], ri_tcs[p_upd]
+            sim_wvs[ix_upd] = sim_wvs[ix_upd] * 0
+            sim_wvs[ix_upd, ixu:ixu+3] = tcs_wvs[ri_upd]
 
-                    # update_extra_variables (optional)
-                    if extra_vars_update:
-                        sim_extra[c, :] = upd_extra
+            # update_extra_variables (optional)
+            if extra_vars_update:
+                sim_extra[ix_upd] = tcs_extra[ri_upd]
 
-                c+=1
+            # progress bar
+            pbar.update(len(ix_ok))
 
-                # progress bar
-                pbar.update(1)
+            ix_p = ix_p[~p_ok]
 
         pbar.close()
 
@@ -1437,7 +1625,7 @@ class Climate_Emulator(object):
 
         # Chromosomes and Sigma reports
         chrom = self.chrom
-        d_sigma = self.sigma
+        sigma = self.sigma
 
         # Plot cromosomes probabilities
         if plot_chrom:
@@ -1447,7 +1635,7 @@ class Climate_Emulator(object):
 
         # Plot sigma correlation triangle
         if plot_sigma:
-            f = Plot_SigmaCorrelation(chrom, d_sigma, show=show)
+            f = Plot_SigmaCorrelation(chrom, sigma, show=show)
             f_out.append(f)
 
         return f_out
@@ -1492,3 +1680,169 @@ def ChromMatrix(vs):
 
     return chrom
 
+def File_Checksum(p_file):
+    'Returns file content sha1 checksum'
+
+    h = hashlib.sha1()
+    with open(p_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(2**20), b''):
+            h.update(chunk)
+
+    return h.hexdigest()
+
+def Correlation_Factor(corr):
+    '''
+    Returns factor L (corr = L L^T) for correlated normal random draws.
+    Cholesky decomposition, eigen decomposition for semidefinite matrices
+    '''
+
+    if not np.isfinite(corr).all():
+        return np.full(corr.shape, np.nan)
+
+    try:
+        return np.linalg.cholesky(corr)
+
+    except np.linalg.LinAlgError:
+        w, v = np.linalg.eigh(corr)
+        return v * np.sqrt(np.clip(w, 0, None))
+
+def Sigma_Dataset(d_sigma):
+    '''
+    Stores sigma correlation nested dict [WT][chrom] at padded arrays.
+    Each correlation matrix (and its factor) is placed at the upper left
+    corner of (var_i, var_j) arrays, padded with nans
+
+    d_sigma - nested dict [WT][chrom]: {'corr', 'data', 'wt_crom'}
+
+    returns xarray.Dataset
+        vars: sigma_corr, sigma_chol (WT, n, var_i, var_j),
+              sigma_data, sigma_wt_crom (WT, n), sigma_nvar (n,)
+    '''
+
+    k_wts = sorted(d_sigma.keys())
+    k_chs = sorted(d_sigma[k_wts[0]].keys())
+
+    # number of variables for each chromosome
+    nvar = np.array(
+        [np.atleast_2d(d_sigma[k_wts[0]][k]['corr']).shape[0] for k in k_chs]
+    )
+    n_max = np.max(nvar)
+
+    corr = np.full((len(k_wts), len(k_chs), n_max, n_max), np.nan)
+    chol = np.full((len(k_wts), len(k_chs), n_max, n_max), np.nan)
+    data = np.zeros((len(k_wts), len(k_chs)), dtype=int)
+    wt_crom = np.zeros((len(k_wts), len(k_chs)), dtype=int)
+
+    for i, k_wt in enumerate(k_wts):
+        for j, k_ch in enumerate(k_chs):
+            d = d_sigma[k_wt][k_ch]
+            c = np.atleast_2d(d['corr'])
+            nv = nvar[j]
+
+            corr[i, j, :nv, :nv] = c
+            chol[i, j, :nv, :nv] = Correlation_Factor(c)
+            data[i, j] = d['data']
+            wt_crom[i, j] = d['wt_crom']
+
+    return xr.Dataset(
+        {
+            'sigma_corr': (('WT', 'n', 'var_i', 'var_j'), corr),
+            'sigma_chol': (('WT', 'n', 'var_i', 'var_j'), chol),
+            'sigma_data': (('WT', 'n'), data),
+            'sigma_wt_crom': (('WT', 'n'), wt_crom),
+            'sigma_nvar': (('n',), nvar),
+        },
+        coords = {
+            'WT': k_wts,
+        }
+    )
+
+def SigmaCorrelation_WT(vv_wt, ix_fams, ix_extra, l_dist, chrom=None):
+    '''
+    Calculate Sigma Spearman correlation for each chromosome of one WT
+
+    vv_wt    - np.array (storms x variables), WT storms data
+    ix_fams  - np.array (families x 3), Hs, Tp, Dir columns for each family
+    ix_extra - list of extra variables columns
+    l_dist   - CDF distribution for each column: ('GEV', (shape, loc, scale)),
+               ('EMP',) or ('WBL',)
+    chrom    - chromosomes matrix (chromosomes x families).
+               None for all-on chromosome (families nans are filled)
+
+    returns dict [chrom]: {'corr', 'data', 'wt_crom'}
+    '''
+
+    vv = np.array(vv_wt, dtype=float)
+    ix_fams = np.asarray(ix_fams, dtype=int).reshape(-1, 3)
+
+    all_on = chrom is None
+    if all_on:
+        chrom = np.ones((1, len(ix_fams)))
+
+        # fix fams nan: Hs 0, Tp mean, dir mean
+        for i_hs, i_tp, i_dir in ix_fams:
+            p_nans = np.isnan(vv[:, i_hs])
+            vv[p_nans, i_tp] = np.nanmean(vv[:, i_tp])
+            vv[p_nans, i_dir] = np.nanmean(vv[:, i_dir])
+            vv[p_nans, i_hs] = 0
+
+    # GEV CDF: all WT storms and variables at once
+    u_wt = np.full(vv.shape, np.nan)
+    ix_gev = [i for i, d in enumerate(l_dist) if d[0] == 'GEV']
+    if ix_gev:
+        sha_g, loc_g, sca_g = np.array([l_dist[i][1] for i in ix_gev]).T
+        u_wt[:, ix_gev] = genextreme.cdf(vv[:, ix_gev], -1*sha_g, loc_g, sca_g)
+
+    # get chromosomes from waves (0/1)
+    var_c = (~np.isnan(vv[:, ix_fams[:,0]])).astype(float)
+
+    # get sigma for each chromosome
+    d_sigma = {}
+    for ucix, uc in enumerate(chrom):
+        wt_crom = 1  # data / no data 
+
+        if all_on:
+            p_c = np.arange(vv.shape[0])
+
+        else:
+            # find data position for this chromosome
+            p_c = np.where((var_c == uc).all(axis=1))[0]
+
+            # if not enought data, get all chromosomes with shared 1s
+            if len(p_c) < 20:
+                p1s = np.where(uc==1)[0]
+                p_c = np.where((var_c[:,p1s] == uc[p1s]).all(axis=1))[0]
+
+                wt_crom = 0  # data / no data 
+
+        # active families and extra variables columns
+        cols = np.concatenate(
+            (ix_fams[uc==1].ravel(), np.asarray(ix_extra, dtype=int))
+        )
+
+        # solve GEV/EMP/WBL CDF (EMP, WBL fitted to chromosome data)
+        u_cdf = u_wt[np.ix_(p_c, cols)]
+        for j, ic in enumerate(cols):
+            if l_dist[ic][0] == 'EMP':
+                from statsmodels.distributions.empirical_distribution import ECDF
+                vc = vv[p_c, ic]
+                u_cdf[:,j] = ECDF(vc)(vc)
+
+            elif l_dist[ic][0] == 'WBL':
+                vc = vv[p_c, ic]
+                u_cdf[:,j] = weibull_min.cdf(vc, *weibull_min.fit(vc))
+
+        # normal inverse CDF 
+        u_cdf[u_cdf>=1.0] = 0.999999
+        inv_n = ndtri(u_cdf)
+
+        # sigma: spearman correlation
+        corr, pval = spearmanr(inv_n, axis=0)
+
+        # store data at dict
+        d_sigma[ucix] = {
+            'corr': corr, 'data': len(p_c), 'wt_crom': wt_crom
+        }
+
+    return d_sigma
+
@@ -525,7 +525,15 @@ class Database(object):
         s =  SplitStorage(ps)
         return s.Load(vns=vns, decode_times=decode_times, use_cftime=use_cftime)
 
-    def Generate_SIM_Covariates(self, total_sims=None):
+    def Generate_SIM_Covariates(self, total_sims=None, n_sim=None):
+        '''
+        Load, fix, and resample (hourly) all simulated covariates:
+            AWT, MJO, DWT, MMSL, AT
+
+        total_sims - optional, only use first total_sims simulations
+        n_sim      - optional, only use simulation n_sim (no n_sim dimension
+                     at output, only one simulation hourly data in memory)
+        '''
 
         # load data
         AWT = self.Load_SST_AWT_sim()
@@ -541,6 +549,13 @@ class Database(object):
             MJO = MJO.isel(n_sim=slice(0, total_sims))
             DWT = DWT.isel(n_sim=slice(0, total_sims))
 
+        # optional select one sim (keep n_sim dimension for reindexing)
+        if n_sim != None:
+            AWT = AWT.isel(n_sim=[n_sim])
+            MSL = MSL.isel(n_sim=[n_sim])
+            MJO = MJO.isel(n_sim=[n_sim])
+            DWT = DWT.isel(n_sim=[n_sim])
+
         # reindex data to hourly (pad)
         AWT_h = fast_reindex_hourly_nsim(AWT)
         MSL_h = fast_reindex_hourly_nsim(MSL)
@@ -568,6 +583,10 @@ class Database(object):
             coords = {'time': times}
         )
 
+        # single simulation output
+        if n_sim != None:
+            xds = xds.isel(n_sim=0)
+
         return xds
 
     def Save_SIM_OFFSHORE(self, xds, n_sim):
@@ -263,7 +263,8 @@ class Predictor(object):
         )
 
         # Calculate hydrographs for each WT
-        _, l_xds_MUTAU = Calculate_Hydrographs(xds_BMUS, xds_WAVES)
+        _, l_xds_MUTAU = Calculate_Hydrographs(
+            xds_BMUS, xds_WAVES, hydrographs=False)
 
         return l_xds_MUTAU
 
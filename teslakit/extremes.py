@@ -1,66 +1,166 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
+# common
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
 # pip
-from datetime import timedelta
 import numpy as np
 import xarray as xr
 from scipy.stats import  gumbel_l, genextreme
+from scipy.special import gamma as gamma_fun
 
-from .util.time_operations import date2datenum as d2d
+from .util.time_operations import date2datenum as d2d, timedelta2hours
+from .util.operations import segment_index, segment_reduce, segment_argmax
 
-def FitGEV_KMA_Frechet(bmus, n_clusters, var):
+def GEV_LMoments(var):
     '''
-    Returns stationary GEV/Gumbel_L params for KMA bmus and varible series
+    Returns GEV params (shape, loc, scale) estimated with L-moments (Hosking)
+    Used as initial guess for GEV maximum likelihood fitting.
 
-    bmus        - KMA bmus (time series of KMA centroids)
-    n_clusters  - number of KMA clusters
-    var         - time series of variable to fit to GEV/Gumbel_L
+    var  - variable sample (no nans)
 
-    returns np.array (n_clusters x parameters). parameters = (shape, loc, scale)
+    returns (shape, loc, scale), shape with scipy.stats.genextreme sign
+    '''
+
+    x = np.sort(var)
+    n = len(x)
+    j = np.arange(n)
+
+    # probability weighted moments and L-moments
+    b0 = np.mean(x)
+    b1 = np.sum(j * x) / (n * (n-1))
+    b2 = np.sum(j * (j-1) * x) / (n * (n-1) * (n-2))
+    l1 = b0
+    l2 = 2*b1 - b0
+    l3 = 6*b2 - 6*b1 + b0
+
+    # GEV parameters (Hosking, 1985)
+    z = 2 / (3 + l3/l2) - np.log(2) / np.log(3)
+    shape = 7.8590*z + 2.9554*z**2
+    gam = gamma_fun(1 + shape)
+    scale = l2 * shape / ((1 - 2**(-shape)) * gam)
+    loc = l1 - scale * (1 - gam) / shape
+
+    return shape, loc, scale
+
+def FitGEV_Frechet(var, warm_start=True):
+    '''
+    Returns stationary GEV/Gumbel_L params for a variable sample
+
+    var         - variable sample to fit to GEV/Gumbel_L
+    warm_start  - True for starting GEV/Gumbel_L fits from L-moments and
+                  moments estimates
+
+    returns np.array parameters = (shape, loc, scale)
     for gumbel distributions shape value will be ~0 (0.0000000001)
     '''
 
-    param_GEV = np.empty((n_clusters, 3))
-    for i in range(n_clusters):
-        c = i+1
-        pos = np.where((bmus==c))[0]
+    # remove nans
+    var_c = var[~np.isnan(var)]
+    if len(var_c) == 0:
+        return np.array([np.nan, np.nan, np.nan])
+
+    # initial guess for fitting
+    kw_gl, kw_gev, c = {}, {}, -0.1
+    if warm_start and len(var_c) > 2 and np.std(var_c) > 0:
+
+        # Gumbel_l (moments)
+        sca_0 = np.sqrt(6) * np.std(var_c) / np.pi
+        kw_gl = {'loc': -(np.mean(var_c) - 0.5772*sca_0), 'scale': sca_0}
+
+        # GEV (L-moments)
+        c_lm, loc_lm, sca_lm = GEV_LMoments(var_c)
+        if np.isfinite([c_lm, loc_lm, sca_lm]).all() and sca_lm > 0:
+            c, kw_gev = c_lm, {'loc': loc_lm, 'scale': sca_lm}
+
+    # fit to Gumbel_l and get negative loglikelihood
+    loc_gl, scale_gl = gumbel_l.fit(-var_c, **kw_gl)
+    theta_gl = (0.0000000001, -1*loc_gl, scale_gl)
+    nLogL_gl = genextreme.nnlf(theta_gl, var_c)
 
-        if len(pos) == 0:
-            param_GEV[i,:] = [np.nan, np.nan, np.nan]
+    # fit to GEV and get negative loglikelihood
+    shape_gev, loc_gev, scale_gev = genextreme.fit(var_c, c, **kw_gev)
+    theta_gev = (shape_gev, loc_gev, scale_gev)
+    nLogL_gev = genextreme.nnlf(theta_gev, var_c)
 
+    # store negative shape
+    theta_gev_fix = (-shape_gev, loc_gev, scale_gev)
+
+    # apply significance test if Frechet
+    if shape_gev < 0:
+
+        # TODO: cant replicate ML exact solution
+        if nLogL_gl - nLogL_gev >= 1.92:
+            return np.array(theta_gev_fix)
         else:
+            return np.array(theta_gl)
+    else:
+        return np.array(theta_gev_fix)
+
+def GEV_Sample_Key(var, warm_start=True):
+    'returns FitGEV_Frechet_Samples cache key (sample data and fitting method)'
+
+    v = np.ascontiguousarray(var, dtype=float)
+    tag = 'gev_frechet_ws{0:d}'.format(warm_start).encode()
+
+    return hashlib.sha1(tag + v.tobytes()).hexdigest()
 
-            # get variable at cluster position
-            var_c = var[pos]
-            var_c = var_c[~np.isnan(var_c)]
+def FitGEV_Frechet_Samples(l_var, num_workers=1, cache=None, warm_start=True):
+    '''
+    Fits a list of variable samples to GEV/Gumbel_L (FitGEV_Frechet)
+
+    l_var        - list of variable samples (np.array)
+    num_workers  - number of parallel processes used for fitting
+    cache        - optional dictionary {sample hash: parameters}. Samples
+                   found at cache are not fitted, new fits are added to it
+    warm_start   - see FitGEV_Frechet()
 
-            # fit to Gumbel_l and get negative loglikelihood
-            loc_gl, scale_gl = gumbel_l.fit(-var_c)
-            theta_gl = (0.0000000001, -1*loc_gl, scale_gl)
-            nLogL_gl = genextreme.nnlf(theta_gl, var_c)
+    returns np.array (len(l_var) x parameters). parameters = (shape, loc, scale)
+    '''
 
-            # fit to GEV and get negative loglikelihood
-            c = -0.1
-            shape_gev, loc_gev, scale_gev = genextreme.fit(var_c, c)
-            theta_gev = (shape_gev, loc_gev, scale_gev)
-            nLogL_gev = genextreme.nnlf(theta_gev, var_c)
+    # sample keys (data hash and fitting method)
+    keys = [GEV_Sample_Key(v, warm_start) for v in l_var]
 
-            # store negative shape
-            theta_gev_fix = (-shape_gev, loc_gev, scale_gev)
+    # samples to fit (not at cache)
+    if cache is None: cache = {}
+    ix_fit = [i for i, k in enumerate(keys) if k not in cache]
+    ix_fit = [i for i in ix_fit if keys.index(keys[i]) == i]  # unique
+    l_fit = [l_var[i] for i in ix_fit]
 
-            # apply significance test if Frechet
-            if shape_gev < 0:
+    # fit samples (optional process pool)
+    if num_workers > 1 and len(l_fit) > 1:
+        with ProcessPoolExecutor(max_workers=num_workers) as exe:
+            l_par = list(exe.map(
+                FitGEV_Frechet, l_fit, [warm_start]*len(l_fit)))
+    else:
+        l_par = [FitGEV_Frechet(v, warm_start) for v in l_fit]
 
-                # TODO: cant replicate ML exact solution
-                if nLogL_gl - nLogL_gev >= 1.92:
-                    param_GEV[i,:] = list(theta_gev_fix)
-                else:
-                    param_GEV[i,:] = list(theta_gl)
-            else:
-                param_GEV[i,:] = list(theta_gev_fix)
+    # update cache
+    for i, p in zip(ix_fit, l_par):
+        cache[keys[i]] = p
 
-    return param_GEV
+    return np.array([cache[k] for k in keys]).reshape(-1, 3)
+
+def FitGEV_KMA_Frechet(bmus, n_clusters, var, num_workers=1, cache=None):
+    '''
+    Returns stationary GEV/Gumbel_L params for KMA bmus and varible series
+
+    bmus        - KMA bmus (time series of KMA centroids)
+    n_clusters  - number of KMA clusters
+    var         - time series of variable to fit to GEV/Gumbel_L
+    num_workers - number of parallel processes used for fitting
+    cache       - optional fitting cache dictionary (FitGEV_Frechet_Samples)
+
+    returns np.array (n_clusters x parameters). parameters = (shape, loc, scale)
+    for gumbel distributions shape value will be ~0 (0.0000000001)
+    '''
+
+    # variable at each cluster
+    l_var = [var[np.where((bmus==i+1))[0]] for i in range(n_clusters)]
+
+    return FitGEV_Frechet_Samples(l_var, num_workers=num_workers, cache=cache)
 
 def Smooth_GEV_Shape(cenEOFs, param):
     '''
@@ -162,145 +262,130 @@ def Peaks_Over_Threshold(xds, var_name, percentile=99, threshold=None,
 
     Peaks Over Threshold methodology to find extreme values.
 
-    xds         - xarray.Dataset (time dim)
+    xds         - xarray.Dataset (time,) or (time, n_sim) dims
     var_name    - variable to apply POT
     percentile  - if threshold not given, calculate it with this percentile
-    threshold   - optional, threshold to apply POT
+    threshold   - optional, threshold to apply POT (scalar or one for each n_sim)
     window_days - minimum number of days between consecutive independent peaks
 
     returns xarray.Dataset ('time', ) vars: peaks, excedeence, area, and duration
-    '''
-
-    # TODO: refactor with times
-    def to_hours(time_diff):
-
-        # single
-        if isinstance(time_diff, (timedelta, np.timedelta64)):
-            if isinstance(time_diff, np.timedelta64):
-                dt_h = time_diff / np.timedelta64(1, 'h')
-
-            elif isinstance(time_diff, timedelta):
-                dt_h = np.array(time_diff.total_seconds()/3600.0)
-
-            return dt_h
-
-        # else: array
-        if isinstance(time_diff[0], np.timedelta64):
-            dt_h = time_diff / np.timedelta64(1, 'h')
-
-        elif isinstance(time_diff[0], timedelta):
-            dt_h = np.array([x.total_seconds()/3600.0 for x in time_diff])
-
-        return dt_h
 
+    for (time, n_sim) input returns xarray.Dataset ('n_sim', 'peak') with
+    same vars plus time and threshold (padded with nans)
+    '''
 
-    # get variable
-    vv = xds[var_name].values[:]
+    # get variable (n_sim, time)
+    xda = xds[var_name]
+    do_nsim = 'n_sim' in xda.dims
+    if do_nsim:
+        xda = xda.transpose('n_sim', 'time')
+    vv = np.atleast_2d(xda.values[:]).astype(float)
     vt = xds['time'].values[:]
+    n_sim, n_t = vv.shape
 
-    # data delta time (hours)
-    npdf = np.diff(vt)
-    dt_h = to_hours(npdf)
+    # data delta time and time since start (hours)
+    dt_h = np.append(timedelta2hours(np.diff(vt)), 0)
+    vt_h = timedelta2hours(vt - vt[0])
 
     # threshold
-    if threshold == None:
-        threshold = np.percentile(vv, percentile)
-
-    # consecutive peaks over threshold
-    ind_mask = np.where(vv >= threshold, 1, 0)
-    ind_dif = np.diff(ind_mask)
-
-    # peaks start and end
-    ind_ini = np.where(ind_dif == 1)[0] + 1
-    ind_end = np.where(ind_dif == -1)[0] + 1
-
-    # start and end corrections
-    if ind_end[0]<ind_ini[0]: ind_ini = np.insert(ind_ini,0,0)
-    if ind_end[-1]<ind_ini[-1]: ind_end = np.append(ind_end, len(ind_dif))
-
-    # store variable max, time max, duration and area above threshold for each peak
-    time_max, vv_max, area, durac = [], [], [], []
-
-    for i, f in zip(ind_ini, ind_end):
-
-        vv_max.append(np.max(vv[i:f]))
-
-        area.append(np.sum(vv[i:f] * dt_h[i:f] - threshold))
-
-        ind_max = np.argmax(vv[i:f])
-        ind_time = list(range(i, f))
-        time_max.append(vt[ind_time[ind_max]])
-
-        durac.append(to_hours(vt[f] - vt[i]))
-
-
-    # ensure independence between maxs
-    ind_window_mask = np.where(to_hours(np.diff(time_max)) < 24*window_days, 1, 0)
-    if np.any(ind_window_mask):
-
-        # solve dependent events
-        ind_dif = np.diff(ind_window_mask)
-
-        # first event corrections 
-        ind_dif = np.insert(ind_dif, 0, 0)
-        if ind_dif[1] == -1: ind_dif[0] = 1
-
-        ind_ini = np.where(ind_dif == 1)[0]
-        ind_fin = np.where(ind_dif == -1)[0] + 1
-
-        # Keep maximum of dependent events
-        time_max_indep = []
-        vv_max_indep = []
-        durac_indep = []
-        area_indep = []
-        ind_delete = []
-        for ind_i, ind_f in zip(ind_ini, ind_fin):
-
-            vv_temp = np.max(vv_max[ind_i:ind_f])
-            vv_max_indep.append(vv_temp)
-
-            vv_ind_max = np.argmax(vv_max[ind_i:ind_f])
-            ind_time = list(range(ind_i,ind_f))
-            time_temp = time_max[ind_time[vv_ind_max]]
-            time_max_indep.append(time_temp)
-
-            durac_indep.append(
-                to_hours(time_max[ind_f]-time_max[ind_i])
-            )
-
-            area_indep.append(np.sum(area[ind_i:ind_f]))
-
-            ind_delete.extend(ind_time)
-
-        # remove all dependent events
-        vv_max = np.delete(vv_max, [ind_delete])
-        time_max = np.delete(time_max, [ind_delete])
-        durac = np.delete(durac, [ind_delete])
-        area = np.delete(area, [ind_delete])
-
-        # add independent events
-        vv_max = np.concatenate((vv_max, vv_max_indep))
-        time_max = np.concatenate((time_max, time_max_indep))
-        durac = np.concatenate((durac, durac_indep))  # hours
-        area = np.concatenate((area, area_indep))
+    if threshold is None:
+        threshold = np.percentile(vv, percentile, axis=1)
+    thr = np.broadcast_to(np.asarray(threshold, dtype=float), (n_sim,))
+
+    # consecutive peaks over threshold (peaks end before last sample)
+    ind_mask = vv >= thr[:,None]
+    ind_mask[:,-1] = False
+    ind_dif = np.diff(np.concatenate([[0], ind_mask.ravel().astype(int)]))
+
+    # peaks start and end (flat index)
+    ind_ini = np.where(ind_dif == 1)[0]
+    ind_end = np.where(ind_dif == -1)[0]
+    ind_sim = ind_ini // n_t
+
+    # gather peaks data
+    ix_p, p_ini = segment_index(ind_ini, ind_end - ind_ini)
+    vv_p = vv.ravel()[ix_p]
+    dt_p = dt_h[ix_p % n_t]
+    thr_p = thr[ix_p // n_t]
+
+    # variable max, time max, duration and area above threshold for each peak
+    vv_max = segment_reduce(np.fmax, vv_p, p_ini)
+    time_max = ix_p[segment_argmax(vv_p, p_ini, vv_max)] % n_t
+    area = segment_reduce(np.add, vv_p * dt_p - thr_p, p_ini)
+    durac = vt_h[ind_end % n_t] - vt_h[ind_ini % n_t]
+
+    # ensure independence between maxs (same simulation)
+    n_pk = len(ind_ini)
+    ind_window_mask = (np.diff(ind_sim) == 0) & \
+            (np.diff(vt_h[time_max]) < 24*window_days)
+
+    # dependent events groups: keep maximum
+    g_new = np.ones(n_pk, dtype=bool)
+    g_new[1:] = ~ind_window_mask
+    g_ini = np.where(g_new)[0]
+    g_len = np.diff(np.append(g_ini, n_pk))
+
+    g_vv_max = segment_reduce(np.fmax, vv_max, g_ini)
+    g_time_max = time_max[segment_argmax(vv_max, g_ini, g_vv_max)]
+    g_area = segment_reduce(np.add, area, g_ini)
+    g_sim = ind_sim[g_ini]
+
+    # dependent events duration: from first to next event max. time
+    g_nxt = g_ini + g_len
+    g_nxt[(g_nxt == n_pk)] -= 1
+    g_nxt[ind_sim[g_nxt] != g_sim] -= 1
+    g_durac = np.where(
+        g_len > 1,
+        vt_h[time_max[g_nxt]] - vt_h[time_max[g_ini]],
+        durac[g_ini]
+    )
 
     # output
+    if not do_nsim:
+        peaks = xr.Dataset(
+            {
+                '{0}'.format(var_name): (('time',), g_vv_max),
+                '{0}_exceedances'.format(var_name): (('time',), g_vv_max-thr[0]),
+                'duration': (('time',), g_durac),
+                'area': (('time',), g_area),
+            },
+            coords = {'time': vt[g_time_max]},
+        )
+        peaks = peaks.sortby('time')
+
+        # add some attrs
+        peaks.attrs['threshold'] = thr[0]
+        peaks.attrs['percentile'] = percentile
+
+        return peaks
+
+    # output padded for each simulation
+    n_g = np.bincount(g_sim, minlength=n_sim)
+    g_pos = np.arange(len(g_ini)) - np.repeat(np.cumsum(n_g) - n_g, n_g)
+
+    def pad(vs, fill=np.nan):
+        vp = np.full((n_sim, np.max(n_g, initial=0)), fill, dtype=vs.dtype)
+        vp[g_sim, g_pos] = vs
+        return vp
+
+    t_fill = np.datetime64('NaT') if np.issubdtype(vt.dtype, np.datetime64) else None
+
     peaks = xr.Dataset(
         {
-            '{0}'.format(var_name): (('time',), vv_max),
-            '{0}_exceedances'.format(var_name): (('time',), vv_max-threshold),
-            'duration': (('time',), durac),
-            'area': (('time',), area),
+            '{0}'.format(var_name): (('n_sim','peak',), pad(g_vv_max)),
+            '{0}_exceedances'.format(var_name): (
+                ('n_sim','peak',), pad(g_vv_max - thr[g_sim])),
+            'duration': (('n_sim','peak',), pad(g_durac)),
+            'area': (('n_sim','peak',), pad(g_area)),
+            'time': (('n_sim','peak',), pad(vt[g_time_max], t_fill)),
+            'threshold': (('n_sim',), thr),
         },
-        coords = {'time': time_max},
     )
-    peaks = peaks.sortby('time')
+    if 'n_sim' in xds.coords:
+        peaks['n_sim'] = xds['n_sim'].values[:]
 
     # add some attrs
-    peaks.attrs['threshold'] = threshold
     peaks.attrs['percentile'] = percentile
 
     return peaks
 
-
-
@@ -6,7 +6,7 @@ import numpy as np
 import xarray as xr
 
 # tk
-from .util.time_operations import npdt64todatetime
+from .util.operations import segment_index, segment_reduce, segment_argmax
 
 # TODO: refactor con waves.py/hydrographs
 
@@ -30,141 +30,175 @@ class Hydrograph(object):
         self.TAU = []
 
 
-def Calculate_Hydrographs(xds_BMUS, xds_WAVES):
+def Calculate_Hydrographs(xds_BMUS, xds_WAVES, hydrographs=True):
     '''
     Calculates intradaily hydrographs
 
-    xds_BMUS: (time) bmus
-    xds_WAVES: (time) hs, tp, dir
+    xds_BMUS: (time) bmus  (daily)
+    xds_WAVES: (time) hs, tp, dir  (hourly)
 
-    returns dictionary of Hydrograph objects for each WT
-    and list of xarray.Datasets containing MU and TAU
+    hydrographs - True for storing each storm Hs, Tp, Dir hydrograph
+
+    returns dictionary of Hydrograph objects for each WT (None if hydrographs
+    is False) and list of xarray.Datasets containing MU and TAU
     '''
 
-    # solve intradaily bins
+    # work with storms <= 4 days
+    ndays_storms = 4
+
+    # solve intradaily bins
     bmus = xds_BMUS.bmus.values[:]
     time_KMA = xds_BMUS.time.values[:]
 
-    d_bins = {}
-    l_mutau_xdsets = []
+    # waves data
+    time_W = xds_WAVES.time.values[:]
+    hs_W = xds_WAVES.Hs.values[:]
+    tp_W = xds_WAVES.Tp.values[:]
+    dir_W = xds_WAVES.Dir.values[:]
+
+    # find hydrograms (storms) for each WT
+    l_wts, l_indx, l_hydro = [], [], []
     for i_wt in sorted(set(bmus)):
 
         # find WT indexes at KMA bmus
         indx = np.where((bmus == i_wt))[0]
-        date_index = time_KMA[indx]
 
-        # find hydrograms longer than 1 day
-        diff_time = np.array([
-            (b-a).astype('timedelta64[D]')/np.timedelta64(1,'D') \
-            for a,b in zip(date_index, date_index[1:])])
+        # find hydrograms longer than 1 day
+        diff_time = np.diff(time_KMA[indx]).astype('timedelta64[D]') / \
+                np.timedelta64(1,'D')
         sep_hydro = np.where((diff_time > 1.0))[0]
 
         if len(sep_hydro)==0:
-            bin_k = 'WT {0:02d}'.format(i_wt)
-            d_bins[bin_k] = None
-            print('{0} empty'.format(bin_k))
+            l_wts.append(i_wt)
+            l_indx.append(indx)
+            l_hydro.append(None)
             continue
 
-        hydro_indx = []
-        hydro_indx.append(indx[0:sep_hydro[0]+1])
+        hydro_indx = [indx[0:sep_hydro[0]+1]]
         for m in range(len(sep_hydro)-2):
             hydro_indx.append(
                 indx[sep_hydro[m]+1:sep_hydro[m+1]+1]
             )
         hydro_indx.append([indx[sep_hydro[len(sep_hydro)-1]-1]])
-        num_days = [len(x) for x in hydro_indx]
-
-        # initialize some output lists
-        Hs_hydro = []
-        Tp_hydro = []
-        Dir_hydro = []
-        TWL_max = []
-        Hs_max = []
-        MU = []
-        TAU = []
-
-        # work with storms <= 4 days
-        ndays_storms = 4
-        for h, nd in zip(hydro_indx, num_days):
-
-            # initialize loop output
-            hs_W = []
-            tp_W = []
-            dir_W = []
-            twl_max_v = 0
-            twl_max_t = 0
-            hs_max_v = 0
-            mu_v = 0
-
-            if nd <= ndays_storms:
-
-                # start and end dates for hydrograph
-                p1 = npdt64todatetime(time_KMA[h[0]])
-                p2 = npdt64todatetime(time_KMA[h[-1]]).replace(hour=23)
-
-                # get waves conditions for hydrograph
-                xds_W = xds_WAVES.sel(time = slice(p1, p2))
-                hs_W = xds_W.Hs.values[:]
-                tp_W = xds_W.Tp.values[:]
-                dir_W = xds_W.Dir.values[:]
-
-                # calculate TWL max and normalize
-                twl_temp = 0.1*(hs_W**0.5)*tp_W
-
-                dt = 1.0/len(twl_temp)
-                t_norm = np.arange(dt,1+dt,dt)
-
-                i_twlmax = np.where(twl_temp == np.amax(twl_temp))[0]
-                twl_max_v =  twl_temp[i_twlmax][0]
-                twl_max_t =  t_norm[i_twlmax][0]
-
-                # calculate MU
-                mu_v = np.trapz(np.divide(twl_temp, twl_max_v), t_norm)
-
-                # calculate max Hs and Tp
-                hs_max_v = hs_W[np.where(hs_W == np.amax(hs_W))[0]][0]
-                tp_max_v = tp_W[np.where(tp_W == np.amax(tp_W))[0]][0]
-
-            # store values
-            Hs_hydro.append(hs_W)
-            Tp_hydro.append(tp_W)
-            Dir_hydro.append(dir_W)
-            TWL_max.append(twl_max_v)
-            Hs_max.append(hs_max_v)
-            MU.append(mu_v)
-            TAU.append(twl_max_t)
+
+        l_wts.append(i_wt)
+        l_indx.append(indx)
+        l_hydro.append(hydro_indx)
+
+    # all storms: first and last day, number of days
+    l_hy_all = [h for hydro_indx in l_hydro if hydro_indx for h in hydro_indx]
+    h_ini = np.array([h[0] for h in l_hy_all], dtype=int)
+    h_end = np.array([h[-1] for h in l_hy_all], dtype=int)
+    num_days = np.array([len(h) for h in l_hy_all], dtype=int)
+
+    # storms hourly window (start day 00h - end day 23h) to waves indexes
+    p1 = time_KMA[h_ini]
+    p2 = time_KMA[h_end].astype('datetime64[D]') + np.timedelta64(23,'h')
+    i_ini = np.searchsorted(time_W, p1, side='left')
+    i_end = np.searchsorted(time_W, p2, side='right')
+
+    # only storms <= 4 days with waves data
+    w_len = np.where(num_days <= ndays_storms, i_end - i_ini, 0)
+    w_len[w_len < 0] = 0
+    p_ok = np.where(w_len > 0)[0]
+    w_len = w_len[p_ok]
+
+    # gather all storms windows in one array (segments)
+    ix_W, s_ini = segment_index(i_ini[p_ok], w_len)
+
+    hs_s = hs_W[ix_W]
+    tp_s = tp_W[ix_W]
+
+    # calculate TWL max and normalize
+    twl_s = 0.1*(hs_s**0.5)*tp_s
+    twl_max_v = segment_reduce(np.fmax, twl_s, s_ini)
+    twl_norm = twl_s / np.repeat(twl_max_v, w_len)
+
+    # TWL max time (first maximum, t_norm = 1/n ... 1)
+    # all-NaN storms get first index (as np.argmax)
+    i_twlmax = segment_argmax(twl_s, s_ini, twl_max_v)
+    i_twlmax = np.where(i_twlmax == len(twl_s), s_ini, i_twlmax) - s_ini
+    twl_max_t = (i_twlmax + 1) / w_len
+
+    # calculate MU (trapezoidal rule, dt = 1/n)
+    s_end = s_ini + w_len - 1
+    sum_norm = segment_reduce(np.add, twl_norm, s_ini)
+    mu_v = (sum_norm - (twl_norm[s_ini] + twl_norm[s_end])/2) / w_len
+
+    # calculate max Hs
+    hs_max_v = segment_reduce(np.fmax, hs_s, s_ini)
+
+    # store storms output (0 for storms not solved)
+    n_hy = len(l_hy_all)
+    TWL_max_all, Hs_max_all, MU_all, TAU_all = [np.zeros(n_hy) for _ in range(4)]
+    TWL_max_all[p_ok] = twl_max_v
+    Hs_max_all[p_ok] = hs_max_v
+    MU_all[p_ok] = mu_v
+    TAU_all[p_ok] = twl_max_t
+
+    # optional storms hydrographs
+    if hydrographs:
+        Hs_hydro_all, Tp_hydro_all, Dir_hydro_all = [
+            [[] for _ in range(n_hy)] for _ in range(3)]
+        for l_out, vv in zip(
+            [Hs_hydro_all, Tp_hydro_all, Dir_hydro_all], [hs_s, tp_s, dir_W[ix_W]]):
+            for p, v_s in zip(p_ok, np.split(vv, s_ini[1:])):
+                l_out[p] = v_s
+
+    # split storms output for each WT
+    d_bins = {}
+    l_mutau_xdsets = []
+    c = 0
+    for i_wt, indx, hydro_indx in zip(l_wts, l_indx, l_hydro):
+
+        if hydro_indx is None:
+            bin_k = 'WT {0:02d}'.format(i_wt)
+            d_bins[bin_k] = None
+            print('{0} empty'.format(bin_k))
+            continue
+
+        n = len(hydro_indx)
+        TWL_max = TWL_max_all[c:c+n]
+        Hs_max = Hs_max_all[c:c+n]
+        MU = MU_all[c:c+n]
+        TAU = TAU_all[c:c+n]
 
         # bin key and hydrograph storage
-        bin_k = 'bin{0:02d}'.format(i_wt)
-        bin_hy = Hydrograph()
-
-        bin_hy.date_index = indx
-        bin_hy.dates = date_index
-        bin_hy.indx_hydro = hydro_indx
-        bin_hy.numdays_hydro = num_days
-        bin_hy.Hs_hydro = Hs_hydro
-        bin_hy.Tp_hydro = Tp_hydro
-        bin_hy.Dir_hydro = Dir_hydro
-        bin_hy.TWL_max = TWL_max
-        bin_hy.Hs_max = Hs_max
-        bin_hy.MU = MU
-        bin_hy.TAU = TAU
-
-        # store at dictionary
-        d_bins[bin_k] = bin_hy
-        #print('{0} calculated'.format(bin_k))
+        if hydrographs:
+            bin_k = 'bin{0:02d}'.format(i_wt)
+            bin_hy = Hydrograph()
+
+            bin_hy.date_index = indx
+            bin_hy.dates = time_KMA[indx]
+            bin_hy.indx_hydro = hydro_indx
+            bin_hy.numdays_hydro = list(num_days[c:c+n])
+            bin_hy.Hs_hydro = Hs_hydro_all[c:c+n]
+            bin_hy.Tp_hydro = Tp_hydro_all[c:c+n]
+            bin_hy.Dir_hydro = Dir_hydro_all[c:c+n]
+            bin_hy.TWL_max = list(TWL_max)
+            bin_hy.Hs_max = list(Hs_max)
+            bin_hy.MU = list(MU)
+            bin_hy.TAU = list(TAU)
+
+            # store at dictionary
+            d_bins[bin_k] = bin_hy
+
+        c += n
 
         # store mu, tau xarray.Dataset
         xds_hg_wt = xr.Dataset(
             {
-                'MU':(('time',), np.array(MU)),
-                'TAU':(('time',), np.array(TAU)),
-                'hs_max':(('time',), np.array(Hs_max)),
-                'twl_max':(('time',), np.array(TWL_max)),
+                'MU':(('time',), MU),
+                'TAU':(('time',), TAU),
+                'hs_max':(('time',), Hs_max),
+                'twl_max':(('time',), TWL_max),
             },
             attrs={'WT':i_wt+1}
         )
         l_mutau_xdsets.append(xds_hg_wt)
 
+    if not hydrographs:
+        d_bins = None
+
     return d_bins, l_mutau_xdsets
 
@@ -9,12 +9,27 @@ from datetime import datetime
 import numpy as np
 import pandas as pd
 import xarray as xr
-from scipy.io import loadmat
+from scipy.io import loadmat, whosmat
 
 from .geo import gc_distance
+from ...storms import Vortex_Model
 
 
 # AUX. FUNCTIONs
+# SWAN .mat output variables and units
+d_output_units = {
+    'Hsig': 'm',
+    'Tm02': 's',
+    'Dir': 'º',
+    'Dspr': 'º',
+    'TPsmoo': 's',
+}
+
+# SWAN table_outpts.dat output variables (columns)
+l_output_points = ['DEP', 'HS', 'HSWELL', 'DIR', 'RTP', 'TM02', 'DSPR', 'WIND',
+                   'WATLEV', 'OUT']
+
+
 def geo_distance_azimuth(lat_matrix, lon_matrix, lat_point, lon_point):
     '''
     Returns geodesic distance and azimuth between lat,lon matrix and lat,lon
@@ -34,6 +49,95 @@ def geo_distance_azimuth(lat_matrix, lon_matrix, lat_point, lon_point):
 
     return arcl, azi
 
+def grid_to_text(data, decimals=2):
+    '''
+    Fast text formatter for 2D arrays (SWAN FREE format input files)
+
+    Same values as np.savetxt(fmt='%.{decimals}f'), right aligned fixed width
+    columns.
+    Values are formatted with integer arithmetic over the whole array.
+    1D arrays are written as a column (as np.savetxt).
+
+    returns bytes
+    '''
+
+    x = np.asarray(data, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    elif x.ndim != 2:
+        raise ValueError(
+            'grid_to_text: expected 1D or 2D array, got {0}D'.format(x.ndim))
+    nr, nc = x.shape
+    fmt = '%.{0}f'.format(decimals)
+
+    if x.size == 0:
+        return b''
+
+    # all rows equal (ex: constant fields): solve only first row
+    if nr > 1 and (x == x[0]).all():
+        return grid_to_text(x[:1], decimals) * nr
+
+    # integer fixed point values (python rounding for near ties)
+    xf = x.ravel()
+    sc = 10**decimals
+    v = xf * sc
+    bad = ~(np.abs(v) < 2.0**53)
+    v[bad] = 0
+    q = np.rint(v)
+    tie = np.abs(np.abs(v - q) - 0.5) < 1e-6
+    q = np.abs(q).astype(np.int64)
+    if tie.any():
+        q[tie] = [abs(int((fmt % u).replace('.', ''))) for u in xf[tie]]
+    neg = np.signbit(xf) & ~bad
+
+    # non finite or huge values (python formatted)
+    ix_bad = np.flatnonzero(bad)
+    u_bad, i_bad = np.unique(xf[ix_bad], return_inverse=True)
+    s_bad = [fmt % u for u in u_bad]
+
+    # column width: sign + integer digits + '.' + decimals + separator
+    ni = len(str(int(q.max()) // sc))
+    nd_dot = 1 if decimals > 0 else 0
+    w = max([ni + nd_dot + decimals + 2] + [len(t) + 1 for t in s_bad])
+
+    out = np.full((xf.size, w), ord(' '), dtype=np.uint8)
+
+    # decimals
+    r = q
+    for k in range(decimals):
+        out[:, w-2-k] = 48 + r % 10
+        r = r // 10
+    if nd_dot:
+        out[:, w-2-decimals] = ord('.')
+
+    # integer part (without leading zeros) and sign
+    c0 = w - 2 - nd_dot - decimals
+    nd = np.ones(xf.size, dtype=np.int64)
+    out[:, c0] = 48 + r % 10
+    r = r // 10
+    for k in range(1, ni):
+        m = r > 0
+        out[m, c0-k] = 48 + r[m] % 10
+        nd += m
+        r = r // 10
+    out[np.flatnonzero(neg), c0 - nd[neg]] = ord('-')
+
+    # non finite or huge values
+    for c, t in enumerate(s_bad):
+        out[ix_bad[i_bad == c], :w-1] = np.frombuffer(
+            t.rjust(w-1).encode(), dtype=np.uint8)
+
+    # row end
+    out.reshape(nr, nc*w)[:, -1] = ord('\n')
+
+    return out.tobytes()
+
+def savetxt_grid(p_file, data, decimals=2):
+    'Fast np.savetxt(p_file, data, fmt="%.{decimals}f") replacement (see grid_to_text)'
+
+    with open(p_file, 'wb') as f:
+        f.write(grid_to_text(data, decimals))
+
 
 # SWAN INPUT/OUTPUT STAT LIBRARY
 
@@ -253,6 +357,25 @@ class SwanIO_STAT(SwanIO):
                 m_n.export_dat(p_case)
                 self.make_input_nested(op.join(p_case, i_n), case_id)
 
+    def outmat_arrays(self, p_mat, var_names=None, ix=slice(None),
+                      iy=slice(None)):
+        '''
+        read .mat output file variables as numpy arrays (X, Y)
+
+        p_mat     - SWAN .mat output file
+        var_names - list of variables to read (default: all output variables)
+        ix, iy    - optional X, Y indexes selection (slices)
+
+        returns None (no output dates), dict {var: numpy.ndarray}
+        '''
+
+        if var_names == None: var_names = list(d_output_units.keys())
+
+        # matlab dictionary (only requested variables)
+        dmat = loadmat(p_mat, variable_names=var_names)
+
+        return None, {v: dmat[v].T[ix, iy] for v in var_names}
+
     def outmat2xr(self, p_mat):
 
         # matlab dictionary
@@ -361,9 +484,9 @@ class SwanIO_NONSTAT(SwanIO):
             # csv file 
             u_2d = aux * u
             v_2d = aux * v
-            u_v_stack = np.vstack((u_2d, v_2d))
             save = op.join(p_case, 'wind_{0:06}.dat'.format(c))
-            np.savetxt(save, u_v_stack, fmt='%.2f')
+            with open(save, 'wb') as f:
+                f.write(grid_to_text(u_2d) + grid_to_text(v_2d))
 
             # wind list file
             txt += 'wind_{0:06}.dat\n'.format(c)
@@ -381,22 +504,10 @@ class SwanIO_NONSTAT(SwanIO):
         needs SPHERICAL COORDINATES
         '''
 
-        # parameters
-        RE = 6378.135  # Earth radius
-
-        # wind variables
-        storm_move = storm_track.move.values[:]
-        storm_vf =   storm_track.vf.values[:]
-        storm_lon =  storm_track.lon.values[:]
-        storm_lat =  storm_track.lat.values[:]
-        storm_pn =   storm_track.pn.values[:]
-        storm_p0 =   storm_track.p0.values[:]
-        times =      storm_track.index[:]
-
         # main mesh
         mm = self.proj.mesh_main
 
-        # comp. grid for generating vortex wind files
+        # comp. grid for generating vortex wind files
         mxc = mm.cg['mxc']  # number mesh x
         myc = mm.cg['myc']  # number mesh y
 
@@ -408,70 +519,26 @@ class SwanIO_NONSTAT(SwanIO):
 
         cg_lon = np.linspace(lon0, lon1, mxc)
         cg_lat = np.linspace(lat0, lat1, myc)
-        mg_lon, mg_lat = np.meshgrid(cg_lon, cg_lat)
 
-        # wind output holder
-        hld_W = np.zeros((len(cg_lat), len(cg_lon), len(storm_move)))
-        hld_D = np.zeros((len(cg_lat), len(cg_lon), len(storm_move)))
+        # vortex model wind fields (time, lat, lon)
+        xds_vtx = Vortex_Model(storm_track, cg_lon, cg_lat)
+        u_3d = xds_vtx.U.values
+        v_3d = xds_vtx.V.values
 
         # each time needs 2D (mesh) wind files (U,V)
         txt = ''
-        for c, (lo, la, p0, pn, move, vf) in enumerate(zip(
-            storm_lon, storm_lat, storm_p0, storm_pn, storm_move, storm_vf)):
-
-            # get distance and angle between points 
-            arcl, beta = geo_distance_azimuth(mg_lat, mg_lon, la, lo)
-            r = arcl * np.pi / 180.0 * RE
-
-            if p0 < 900: p0 = 900  # fix p0
-
-            # Silva et al. 2010
-            RC = 0.4785 * p0 - 413.01
-            # TODO usar otro radio ciclostrofico? 
-
-            # Hydromet Rankin-Vortex model (eq. 76)
-            pr = p0 + (pn - p0) * np.exp(-2*RC/r)
-            py, px = np.gradient(pr)
-            ang = np.arctan2(py, px) + np.sign(la) * np.pi/2.0
-
-            # Wind model
-            w = 0.2618  # velocidad angular Earth (rad/h)
-            f = 2 * w * np.sin(la*np.pi/180)  # coriolis
-            ur = 21.8 * np.sqrt(pn-p0) - 0.5 * f * RC  # wind max grad (km/h)
-
-            fv = np.zeros(mg_lon.shape)
-            s1 = r/RC < 1  # eq. (9) Rodo (2009)
-            fv[s1] = 1 - 0.971 * np.exp(-6.826 * np.power(r[s1]/RC, 4.798))
-
-            s2 = r/RC >=1  # eq. (10) Rodo (2009)
-            nc = (f*RC)/ur
-            A = -0.99 * (1.066-np.exp(-1.936*nc))
-            B = -0.357 * (1.4456-np.exp(-5.2388*nc))
-            fv[s2] = np.exp(A*np.power(np.log(r[s2]/RC),3) * \
-                     np.exp(B*np.log(r[s2]/RC)))
-
-            abnaut = move + beta
-            ab = np.remainder(-abnaut+270, 360) *np.pi/180 # nautical to cartesian
-
-            W = 0.986 * (fv*ur + 0.5*vf * np.cos(ab-np.pi/2))
-            W[W<0] = 0
+        for c in range(len(xds_vtx.time)):
 
             # TODO: wind has to be rotated if alpc != 0
 
             # csv file 
-            u_2d = W * np.cos(ang) / 3.6  # km/h --> m/s
-            v_2d = W * np.sin(ang) / 3.6  # km/h --> m/s
-            u_v_stack = np.vstack((u_2d, v_2d))
             save = op.join(p_case, 'wind_{0:06}.dat'.format(c))
-            np.savetxt(save, u_v_stack, fmt='%.2f')
+            with open(save, 'wb') as f:
+                f.write(grid_to_text(u_3d[c]) + grid_to_text(v_3d[c]))
 
             # wind list file
             txt += 'wind_{0:06}.dat\n'.format(c)
 
-            # hold wind data (m/s)
-            hld_W[:,:,c] = W / 3.6 # km/h --> m/s
-            hld_D[:,:,c] =  270 - np.rad2deg(ang)  # direction (º clock. rel. north)
-
         # winds file path
         save = op.join(p_case, 'series_wind.dat')
         with open(save, 'w') as f:
@@ -481,13 +548,13 @@ class SwanIO_NONSTAT(SwanIO):
         p_vortex = op.join(p_case, 'vortex_wind.nc')
         xds_vortex = xr.Dataset(
             {
-                'W': (('lat','lon','time'), hld_W, {'units':'m/s'}),
-                'Dir': (('lat','lon','time'), hld_D, {'units':'º'})
+                'W': (('lat','lon','time'), xds_vtx.W.values.transpose(1,2,0), {'units':'m/s'}),
+                'Dir': (('lat','lon','time'), xds_vtx.Dir.values.transpose(1,2,0), {'units':'º'})
             },
             coords={
                 'Y' : cg_lat,
                 'X' : cg_lon,
-                'time' : times,
+                'time' : storm_track.index[:],
             }
         )
         xds_vortex.attrs['xlabel'] = 'Longitude (º)'
@@ -522,7 +589,7 @@ class SwanIO_NONSTAT(SwanIO):
             l = z + t  # total level
             l_2d = aux * l
             save = op.join(p_case, 'level_{0:06}.dat'.format(c))
-            np.savetxt(save, l_2d, fmt='%.2f')
+            savetxt_grid(save, l_2d)
 
             # level list file
             txt += 'level_{0:06}.dat\n'.format(c)
@@ -711,33 +778,53 @@ class SwanIO_NONSTAT(SwanIO):
 
         # TODO: add optional nested mesh depth and input files
 
-    def outmat2xr(self, p_mat):
+    def outmat_arrays(self, p_mat, var_names=None, ix=slice(None),
+                      iy=slice(None)):
+        '''
+        read .mat output file variables as numpy arrays (time, X, Y)
 
-        # matlab dictionary
-        dmat = loadmat(p_mat)
+        p_mat     - SWAN .mat output file
+        var_names - list of variables to read (default: all output variables)
+        ix, iy    - optional X, Y indexes selection (slices)
+
+        returns list of output dates, dict {var: numpy.ndarray}
+        '''
 
-        # get dates from one key
-        hsfs = sorted([x for x in dmat.keys() if 'Hsig' in x])
+        if var_names == None: var_names = list(d_output_units.keys())
+
+        # get dates from one key (only .mat variables headers are read)
+        hsfs = sorted([x[0] for x in whosmat(p_mat) if 'Hsig' in x[0]])
         dates_str = ['_'.join(x.split('_')[1:]) for x in hsfs]
         dates = [datetime.strptime(s,'%Y%m%d_%H%M%S') for s in dates_str]
 
-        # read times
-        l_times = []
-        for ds in dates_str:
-            xds_t = xr.Dataset(
-               {
-                   'Hsig':   (('X','Y',), dmat['Hsig_{0}'.format(ds)].T,   {'units':'m'}),
-                   'Tm02':   (('X','Y',), dmat['Tm02_{0}'.format(ds)].T,   {'units':'s'}),
-                   'Dir':    (('X','Y',), dmat['Dir_{0}'.format(ds)].T,    {'units':'º'}),
-                   'Dspr':   (('X','Y',), dmat['Dspr_{0}'.format(ds)].T,   {'units':'º'}),
-                   'TPsmoo': (('X','Y',), dmat['TPsmoo_{0}'.format(ds)].T, {'units':'s'}),
-               }
-            )
-            l_times.append(xds_t)
+        # matlab dictionary (only requested variables)
+        dmat = loadmat(
+            p_mat,
+            variable_names = [
+                '{0}_{1}'.format(v, ds) for v in var_names for ds in dates_str
+            ]
+        )
+
+        # stack output times: one array for each variable
+        d_out = {}
+        for v in var_names:
+            l_t = [dmat.pop('{0}_{1}'.format(v, ds)).T[ix, iy] for ds in dates_str]
+            d_out[v] = np.stack(l_t)
 
-        # join at times dim
-        xds_out = xr.concat(l_times, dim='time')
-        xds_out = xds_out.assign_coords(time=dates)
+        return dates, d_out
+
+    def outmat2xr(self, p_mat):
+
+        # read output variables (time, X, Y)
+        dates, d_out = self.outmat_arrays(p_mat)
+
+        xds_out = xr.Dataset(
+            {
+                v: (('time','X','Y',), d_out[v], {'units': d_output_units[v]})
+                for v in d_out
+            },
+            coords = {'time': dates}
+        )
 
         return xds_out
 
@@ -776,46 +863,48 @@ class SwanIO_NONSTAT(SwanIO):
 
         return t0, dt_min
 
-    def output_points(self, p_case):
-        'read table_outpts.dat output file and returns xarray.Dataset'
+    def output_points_arrays(self, p_case):
+        '''
+        read table_outpts.dat output file as a numpy array
+
+        returns output times (pandas.DatetimeIndex),
+        numpy.ndarray (time, point, variable)
+        '''
 
         p_dat = op.join(p_case, 'table_outpts.dat')
 
-        # variable names
-        names = ['DEP', 'HS', 'HSWELL', 'DIR', 'RTP', 'TM02', 'DSPR', 'WIND',
-                 'WATLEV', 'OUT' ]
+        # whitespace delimited table (C parser)
+        np_pts = pd.read_csv(p_dat, sep=r'\s+', header=None).values
 
-        x_out = self.proj.x_out
-        y_out = self.proj.y_out
+        # points are mixed at output file (rows: time, point)
+        n_pts = len(self.proj.x_out)
+        n_times = np_pts.shape[0] // n_pts
+        n_vars = len(l_output_points)
 
-        # points are mixed at output file
-        np_pts = np.genfromtxt(p_dat)
-        n_rows = np_pts.shape[0]
+        np_pts = np_pts[:n_times*n_pts, :n_vars].reshape(n_times, n_pts, n_vars)
 
-        # number of points
-        n_pts = len(x_out)
+        # times dim values
+        t0, dt_min = self.get_t0_dt(op.join(p_case, 'input.swn'))
+        time_out = pd.date_range(t0, periods=n_times, freq='{0}min'.format(dt_min))
 
-        l_xds_pts = []
-        for i in range(n_pts):
-            ix_p = np.arange(i, n_rows, n_pts)
+        return time_out, np_pts
 
-            np_pti = np_pts[ix_p, :]
-            xds_pti = xr.Dataset({}) #, coords='time')
-            for c, n in enumerate(names):
-                xds_pti[n] = (('time'), np_pti[:,c])
+    def output_points(self, p_case):
+        'read table_outpts.dat output file and returns xarray.Dataset'
 
-            l_xds_pts.append(xds_pti)
+        time_out, np_pts = self.output_points_arrays(p_case)
 
-        xds_out = xr.concat(l_xds_pts, dim='point')
+        # (variable, point, time)
+        np_pts = np.ascontiguousarray(np_pts.transpose(2, 1, 0))
 
-        # add point x and y
-        xds_out['x_point'] = (('point'), x_out)
-        xds_out['y_point'] = (('point'), y_out)
+        xds_out = xr.Dataset(
+            {n: (('point','time'), np_pts[c]) for c, n in enumerate(l_output_points)},
+            coords = {'time': time_out}
+        )
 
-        # add times dim values
-        t0, dt_min = self.get_t0_dt(op.join(p_case, 'input.swn'))
-        time_out = pd.date_range(t0, periods=len(xds_out.time), freq='{0}min'.format(dt_min))
-        xds_out = xds_out.assign_coords(time=time_out)
+        # add point x and y
+        xds_out['x_point'] = (('point'), self.proj.x_out)
+        xds_out['y_point'] = (('point'), self.proj.y_out)
 
         return xds_out
 
@@ -4,12 +4,22 @@
 import os
 import os.path as op
 import subprocess as sp
+import json
+import time
+import hashlib
+import fnmatch
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+as_completed
 
 import numpy as np
+import pandas as pd
 import xarray as xr
+import netCDF4
 
 # SWAN STAT LIBRARY
-from .io import SwanIO_STAT, SwanIO_NONSTAT
+from .io import SwanIO_STAT, SwanIO_NONSTAT, savetxt_grid, d_output_units, \
+l_output_points
 
 
 # grid description template
@@ -25,6 +35,12 @@ d_grid_template = {
     'dyinp': None,    # size mesh y
 }
 
+# SWAN execution generated files (not case input files)
+l_swan_outputs = [
+    '*.mat', 'table_outpts.dat', 'bounds_nest*.dat', '*.log', 'INPUT',
+    'PRINT*', 'Errfile', 'norm_end', 'swaninit', '*.erf',
+]
+
 # swan input parameters template
 d_params_template = {
     'sea_level': None,
@@ -55,7 +71,7 @@ class SwanMesh(object):
         'exports depth values to .dat file'
 
         p_export = op.join(p_case, self.depth_fn)
-        np.savetxt(p_export, self.depth, fmt='%.2f')
+        savetxt_grid(p_export, self.depth)
 
     def get_XY(self):
         'returns mesh X, Y arrays from computational grid'
@@ -140,6 +156,9 @@ class SwanWrap(object):
         p_res = op.join(op.dirname(op.realpath(__file__)), 'resources')
         self.bin = op.abspath(op.join(p_res, 'swan_bin', 'swan_ser.exe'))
 
+        # cases execution manifest
+        self.p_manifest = op.join(self.proj.p_main, 'run_manifest.json')
+
     def get_run_folders(self):
         'return sorted list of project cases folders'
 
@@ -150,42 +169,198 @@ class SwanWrap(object):
 
         return [p for p in fp_ldir if op.isdir(p)]
 
-    def run_cases(self):
-        'run all cases inside project "cases" folder'
+    def build_cases_pool(self, l_args, d_kwargs, num_workers=1):
+        '''
+        build cases with io.build_case (serial or process pool)
 
-        # TODO: improve log / check execution ending status
+        l_args   - list of io.build_case arguments for each case
+        d_kwargs - io.build_case keyword arguments (all cases)
+        '''
 
-        # get sorted execution folders
-        run_dirs = self.get_run_folders()
+        if num_workers <= 1:
+            for args in l_args:
+                self.io.build_case(*args, **d_kwargs)
+            return
 
-        for p_run in run_dirs:
+        with ProcessPoolExecutor(max_workers=num_workers) as exe:
+            l_fut = [
+                exe.submit(self.io.build_case, *args, **d_kwargs)
+                for args in l_args
+            ]
+            for fut in l_fut:
+                fut.result()
+
+    def get_case_inputs(self):
+        'return list of SWAN input files for each case (main and nested meshes)'
+
+        r_ns = [
+            self.proj.run_nest1,
+            self.proj.run_nest2,
+            self.proj.run_nest3,
+        ]
+        i_ns = [
+            'input_nest1.swn',
+            'input_nest2.swn',
+            'input_nest3.swn'
+        ]
+
+        return ['input.swn'] + [i_n for r_n, i_n in zip(r_ns, i_ns) if r_n]
+
+    def get_case_checksum(self, p_run):
+        '''
+        return sha1 checksum of case input files
 
-            # run case main mesh
-            self.run(p_run)
+        all case folder files are used (input.swn, waves, wind, level, depth,
+        ...) except SWAN execution generated files (l_swan_outputs)
+        '''
 
-            # run case nested mesh (optional)
-            r_ns = [
-                self.proj.run_nest1,
-                self.proj.run_nest2,
-                self.proj.run_nest3,
-            ]
-            i_ns = [
-                'input_nest1.swn',
-                'input_nest2.swn',
-                'input_nest3.swn'
-            ]
-            for r_n, i_n in zip(r_ns, i_ns):
-                if r_n:
-                    self.run(p_run, input_file=i_n)
+        h = hashlib.sha1()
+        for fn in sorted(os.listdir(p_run)):
+            p_i = op.join(p_run, fn)
+            if op.islink(p_i) or not op.isfile(p_i):
+                continue
+            if any(fnmatch.fnmatch(fn, o) for o in l_swan_outputs):
+                continue
+
+            h.update(fn.encode())
+            with open(p_i, 'rb') as f:
+                for b in iter(lambda: f.read(1 << 20), b''):
+                    h.update(b)
+
+        return h.hexdigest()
+
+    def load_manifest(self):
+        'return cases execution manifest: dict {case: record}'
+
+        if not op.isfile(self.p_manifest):
+            return {}
+
+        with open(self.p_manifest, 'r') as jf:
+            return json.load(jf)
+
+    def save_manifest(self, d_man):
+        'store cases execution manifest'
 
-            # log
-            p = op.basename(p_run)
-            print('SWAN CASE: {0} SOLVED'.format(p))
+        p_tmp = '{0}.{1}.tmp'.format(self.p_manifest, os.getpid())
+        with open(p_tmp, 'w') as jf:
+            json.dump(d_man, jf, indent=2)
+        os.replace(p_tmp, self.p_manifest)
+
+    def check_case(self, p_run, d_rec):
+        'True if case record is solved and case input files did not change'
+
+        if d_rec == None or d_rec.get('status') != 'done':
+            return False
+
+        return d_rec.get('checksum') == self.get_case_checksum(p_run)
+
+    def run_case(self, p_run, retries=0, log=False):
+        '''
+        run one case: main mesh and nested meshes (ordered).
+        Case is relaunched (retries times) if any SWAN execution fails
+
+        log - True for storing SWAN stdout/stderr at case folder (.log files)
+
+        returns case execution record (dict)
+        '''
+
+        d_rec = {
+            'case': op.basename(p_run),
+            'checksum': self.get_case_checksum(p_run),
+        }
+
+        t0 = time.time()
+        for n_try in range(retries+1):
+
+            l_runs = []
+            for i_n in self.get_case_inputs():
+                p_log = op.join(p_run, '{0}.log'.format(i_n)) if log else None
+
+                ti = time.time()
+                rc = self.run(p_run, input_file=i_n, out_file=p_log, err_file=p_log)
+                l_runs.append(
+                    {'input': i_n, 'returncode': rc, 'elapsed': time.time()-ti}
+                )
+
+                # nested meshes need main mesh output
+                if rc != 0: break
+
+            if rc == 0: break
+
+        d_rec.update({
+            'status': 'done' if rc == 0 else 'failed',
+            'returncode': rc,
+            'attempts': n_try + 1,
+            'elapsed': time.time() - t0,
+            'runs': l_runs,
+            'date': datetime.now().isoformat(),
+        })
+
+        return d_rec
+
+    def run_cases(self, num_workers=1, retries=0, resume=True):
+        '''
+        run all cases inside project "cases" folder
 
-    def run(self, p_run, input_file='input.swn'):
-        'Bash execution commands for launching SWAN'
+        num_workers - number of concurrent SWAN executions (cases)
+        retries     - number of relaunches for failed cases
+        resume      - skip cases already solved (manifest status "done" and
+                      same case input files)
 
-        # aux. func. for launching bash command
+        Each case execution status, return code and timing is stored at
+        project manifest (run_manifest.json)
+
+        returns dict {case: record} with cases execution manifest
+        '''
+
+        # get sorted execution folders
+        run_dirs = self.get_run_folders()
+
+        # skip solved cases
+        d_man = self.load_manifest()
+        if resume:
+            run_dirs = [
+                p for p in run_dirs
+                if not self.check_case(p, d_man.get(op.basename(p)))
+            ]
+            print('SWAN CASES: {0} to solve'.format(len(run_dirs)))
+
+        # store case record and log
+        def case_end(d_rec):
+            d_man[d_rec['case']] = d_rec
+            self.save_manifest(d_man)
+
+            if d_rec['status'] == 'done':
+                print('SWAN CASE: {0} SOLVED'.format(d_rec['case']))
+            else:
+                print('SWAN CASE: {0} FAILED (return code {1})'.format(
+                    d_rec['case'], d_rec['returncode']))
+
+        # serial execution
+        if num_workers <= 1:
+            for p_run in run_dirs:
+                case_end(self.run_case(p_run, retries=retries))
+
+        # parallel execution (SWAN output to case .log files)
+        else:
+            with ThreadPoolExecutor(max_workers=num_workers) as exe:
+                l_fut = [
+                    exe.submit(self.run_case, p_run, retries, True)
+                    for p_run in run_dirs
+                ]
+                for fut in as_completed(l_fut):
+                    case_end(fut.result())
+
+        return d_man
+
+    def run(self, p_run, input_file='input.swn', out_file=None, err_file=None):
+        '''
+        Bash execution commands for launching SWAN
+
+        returns SWAN execution return code
+        '''
+
+        # aux. func. for launching bash command
         def bash_cmd(str_cmd, out_file=None, err_file=None):
             'Launch bash command using subprocess library'
 
@@ -195,22 +370,24 @@ class SwanWrap(object):
             if out_file:
                 _stdout = open(out_file, 'w')
             if err_file:
-                _stderr = open(err_file, 'w')
+                _stderr = _stdout if err_file == out_file else open(err_file, 'w')
 
             s = sp.Popen(str_cmd, shell=True, stdout=_stdout, stderr=_stderr)
-            s.wait()
+            rc = s.wait()
 
             if out_file:
                 _stdout.flush()
                 _stdout.close()
-            if err_file:
+            if err_file and err_file != out_file:
                 _stderr.flush()
                 _stderr.close()
 
+            return rc
+
         # ln input file and run swan case
         cmd = 'cd {0} && ln -sf {1} INPUT && {2} INPUT'.format(
             p_run, input_file, self.bin)
-        bash_cmd(cmd)
+        return bash_cmd(cmd, out_file=out_file, err_file=err_file)
 
     def extract_output(self, mesh=None):
         '''
@@ -238,26 +415,175 @@ class SwanWrap(object):
 
         return(xds_out)
 
-    def extract_output_points(self):
+    def extract_output_nc(self, p_nc, mesh=None, var_names=None, x_lim=None,
+                          y_lim=None, num_workers=1, dtype='float32',
+                          zlib=False):
+        '''
+        exctract output from all cases to a single netCDF4 file
+
+        Cases .mat files are read concurrently and stored one at a time,
+        only num_workers cases output are kept in memory.
+
+        p_nc        - output netCDF4 file
+        mesh        - SwanMesh (default: main mesh)
+        var_names   - list of output variables to store (default: all)
+        x_lim       - optional (x_min, x_max) sub-region limits
+        y_lim       - optional (y_min, y_max) sub-region limits
+        num_workers - number of cases read concurrently (threads)
+        dtype       - stored variables data type
+        zlib        - True for compressed variables storage
+
+        non-stationary cases output times can differ: time dimension is
+        the output time step and each case dates are stored at "case_time"
+        (shorter cases are filled with NaN)
+
+        returns xarray.Dataset (opened from p_nc) with dims:
+        (case, time, X, Y) non-stationary, (case, X, Y) stationary
+        '''
+
+        # select main or nested mesh
+        if mesh == None: mesh = self.proj.mesh_main
+        if var_names == None: var_names = list(d_output_units.keys())
+
+        # get sorted execution folders
+        run_dirs = self.get_run_folders()
+
+        # mesh sub-region selection
+        X, Y = mesh.get_XY()
+
+        def lim_slice(v, v_lim, vn):
+            if v_lim == None: return slice(None)
+            ix = np.where((v >= v_lim[0]) & (v <= v_lim[1]))[0]
+            if len(ix) == 0:
+                raise ValueError(
+                    '{0} = {1} selects no mesh nodes (mesh range: {2} - {3})'.format(
+                        vn, v_lim, np.min(v), np.max(v)))
+            return slice(ix[0], ix[-1] + 1)
+
+        ix, iy = lim_slice(X, x_lim, 'x_lim'), lim_slice(Y, y_lim, 'y_lim')
+        X, Y = X[ix], Y[iy]
+
+        # longitude latitude names in spherical coords cases
+        nx, ny = 'X', 'Y'
+        if self.proj.params['coords_spherical'] != None:
+            nx, ny = 'lon', 'lat'
+
+        # read one case output
+        def read_case(p_run):
+            return self.io.outmat_arrays(
+                op.join(p_run, mesh.output_fn), var_names, ix, iy)
+
+        # output file (time dimension grows with cases output)
+        nc = netCDF4.Dataset(p_nc, 'w', format='NETCDF4')
+        nc.createDimension('case', len(run_dirs))
+        nc.createDimension(nx, len(X))
+        nc.createDimension(ny, len(Y))
+
+        nc.createVariable('case', 'i4', ('case',))[:] = np.arange(len(run_dirs))
+        nc.createVariable(nx, 'f8', (nx,))[:] = X
+        nc.createVariable(ny, 'f8', (ny,))[:] = Y
+
+        def store_case(c, dates, d_out):
+
+            # create variables with first case output
+            if c == 0:
+                dims = ('case', nx, ny)
+                if dates != None:
+                    nc.createDimension('time', None)
+                    v_t = nc.createVariable(
+                        'case_time', 'f8', ('case', 'time'), fill_value=np.nan)
+                    v_t.units = 'hours since 1970-01-01 00:00:00'
+                    v_t.calendar = 'standard'
+                    dims = ('case', 'time', nx, ny)
+
+                for v in var_names:
+                    v_nc = nc.createVariable(
+                        v, dtype, dims, fill_value=np.nan, zlib=zlib,
+                        chunksizes = (1,) * (len(dims) - 2) + (len(X), len(Y)),
+                    )
+                    v_nc.units = d_output_units[v]
+
+            # store case output
+            if dates != None:
+                nt = len(dates)
+                nc['case_time'][c, :nt] = netCDF4.date2num(
+                    dates, nc['case_time'].units, nc['case_time'].calendar)
+                for v in var_names:
+                    nc[v][c, :nt] = d_out[v]
+            else:
+                for v in var_names:
+                    nc[v][c] = d_out[v]
+
+            print('SWAN CASE: {0} EXTRACTED'.format(op.basename(run_dirs[c])))
+
+        try:
+            # serial
+            if num_workers <= 1:
+                for c, p_run in enumerate(run_dirs):
+                    store_case(c, *read_case(p_run))
+
+            # bounded pool: at most num_workers cases in memory
+            else:
+                with ThreadPoolExecutor(max_workers=num_workers) as exe:
+                    l_fut = []
+                    for c, p_run in enumerate(run_dirs):
+                        l_fut.append((c, exe.submit(read_case, p_run)))
+
+                        # store oldest case before reading new ones
+                        if len(l_fut) >= num_workers:
+                            cf, fut = l_fut.pop(0)
+                            store_case(cf, *fut.result())
+
+                    for cf, fut in l_fut:
+                        store_case(cf, *fut.result())
+        finally:
+            nc.close()
+
+        return xr.open_dataset(p_nc)
+
+    def extract_output_points(self, num_workers=1):
         '''
         exctract output from points all cases table_outpts.dat
 
+        num_workers - number of cases read concurrently (threads)
+
         return xarray.Dataset (uses new dim "case" to join output)
         '''
 
         # get sorted execution folders
         run_dirs = self.get_run_folders()
 
-        # exctract output case by case and concat in list
-        l_out = []
-        for p_run in run_dirs:
-
-            # read output file
-            xds_case_out = self.io.output_points(p_run)
-            l_out.append(xds_case_out)
-
-        # concatenate xarray datasets (new dim: case)
-        xds_out = xr.concat(l_out, dim='case')
+        # read cases output files: (time, point, variable) arrays
+        if num_workers <= 1:
+            l_out = [self.io.output_points_arrays(p) for p in run_dirs]
+        else:
+            with ThreadPoolExecutor(max_workers=num_workers) as exe:
+                l_out = list(exe.map(self.io.output_points_arrays, run_dirs))
+
+        # all cases output times
+        time_out = l_out[0][0]
+        for t, _ in l_out[1:]:
+            time_out = time_out.union(t)
+
+        # store output (variable, case, point, time), NaN at missing times
+        n_pts = len(self.proj.x_out)
+        np_out = np.full(
+            (len(l_output_points), len(l_out), n_pts, len(time_out)), np.nan
+        )
+        for c, (t, np_pts) in enumerate(l_out):
+            np_out[:, c][..., time_out.get_indexer(t)] = np_pts.transpose(2, 1, 0)
+
+        xds_out = xr.Dataset(
+            {
+                n: (('case', 'point', 'time'), np_out[c])
+                for c, n in enumerate(l_output_points)
+            },
+            coords = {'time': time_out}
+        )
+
+        # add point x and y
+        xds_out['x_point'] = (('case', 'point'), np.tile(self.proj.x_out, (len(l_out), 1)))
+        xds_out['y_point'] = (('case', 'point'), np.tile(self.proj.y_out, (len(l_out), 1)))
 
         return(xds_out)
 
@@ -268,23 +594,25 @@ class SwanWrap_STAT(SwanWrap):
     def __init__(self, swan_proj):
         super().__init__(swan_proj, SwanIO_STAT)
 
-    def build_cases(self, waves_dataset):
+    def build_cases(self, waves_dataset, num_workers=1):
         '''
         generates all files needed for swan stationary multi-case execution
 
         waves_dataset - pandas.dataframe with "n" boundary conditions setup
         [n x 4] (hs, per, dir, spr)
+
+        num_workers - number of cases built in parallel (processes)
         '''
 
         # make main project directory
         self.io.make_project()
 
         # one stat case for each wave sea state
-        for ix, (_, ws) in enumerate(waves_dataset.iterrows()):
-
-            # build stat case 
-            case_id = '{0:04d}'.format(ix)
-            self.io.build_case(case_id, ws)
+        l_args = [
+            ('{0:04d}'.format(ix), ws)
+            for ix, (_, ws) in enumerate(waves_dataset.iterrows())
+        ]
+        self.build_cases_pool(l_args, {}, num_workers)
 
 
 class SwanWrap_NONSTAT(SwanWrap):
@@ -294,7 +622,7 @@ class SwanWrap_NONSTAT(SwanWrap):
         super().__init__(swan_proj, SwanIO_NONSTAT)
 
     def build_cases(self, waves_event_list, storm_track_list=None,
-                    make_waves=True, make_winds=True):
+                    make_waves=True, make_winds=True, num_workers=1):
         '''
         generates all files needed for swan non-stationary multi-case execution
 
@@ -305,6 +633,8 @@ class SwanWrap_NONSTAT(SwanWrap):
         storm_track_list - list of storm tracks time series (pandas.DataFrame)
         storm_track generated winds have priority over waves_event winds
         [n x 6] (move, vf, lon, lat, pn, p0)
+
+        num_workers - number of cases built in parallel (processes)
         '''
 
         # check user input: no storm tracks
@@ -315,13 +645,12 @@ class SwanWrap_NONSTAT(SwanWrap):
         self.io.make_project()
 
         # one non-stationary case for each wave time series
-        for ix, (wds, sds) in enumerate(
-            zip(waves_event_list, storm_track_list)):
-
-            # build stat case 
-            case_id = '{0:04d}'.format(ix)
-            self.io.build_case(
-                case_id, wds, storm_track=sds,
-                make_waves=make_waves, make_winds=make_winds
-            )
+        l_args = [
+            ('{0:04d}'.format(ix), wds, sds)
+            for ix, (wds, sds) in enumerate(zip(waves_event_list, storm_track_list))
+        ]
+        self.build_cases_pool(
+            l_args, {'make_waves': make_waves, 'make_winds': make_winds},
+            num_workers
+        )
 
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# common
+from concurrent.futures import ProcessPoolExecutor
+
+# pip
+import numpy as np
+import xarray as xr
+
+# tk
+from .waves import AWL, Aggregate_WavesFamilies, Intradaily_Hydrograph
+from .util.time_operations import xds_limit_dates, repair_times_hourly, \
+add_max_storms_mask
+
+
+def waves_hourly(CE, n_sim, n_sim_ce=0):
+    '''
+    Generate hourly waves from one climate emulator simulation
+
+    - select one DWTs-WVS Climate emulator simulation
+    - aggregate simulated waves storms
+    - generate hourly hydrographs
+
+    CE        - Climate_Emulator (loaded)
+    n_sim     - DWTs simulation index
+    n_sim_ce  - inner climate emulator simulation index
+
+    returns xarray.Dataset with dims: time (hourly)
+    '''
+
+    # Load DWT --> WVS, TCs simulation
+    _, TCS_sim, WVS_upd = CE.LoadSim(n_sim = n_sim)
+    WVS_upd = WVS_upd.isel(n_sim = n_sim_ce)
+    TCS_sim = TCS_sim.isel(n_sim = n_sim_ce)
+
+    # aggregate waves families
+    WVS_agr = Aggregate_WavesFamilies(WVS_upd, a_tp='max_energy')
+
+    # calculate intradaily hourly hydrographs for simulated storms
+    WVS_h = Intradaily_Hydrograph(WVS_agr, TCS_sim)
+
+    # repair times: remove duplicates (if any)
+    WVS_h = repair_times_hourly(WVS_h)
+
+    # add mask for max_storms times
+    WVS_h = add_max_storms_mask(WVS_h, WVS_upd.time.values)
+
+    return WVS_h
+
+def offshore_hourly_sim(db, CE, n_sim, n_sim_ce=0, save=True):
+    '''
+    Generate complete hourly offshore output for one simulation
+
+    db        - teslakit Database (site already set)
+    CE        - Climate_Emulator (loaded)
+    n_sim     - DWTs simulation index
+    n_sim_ce  - inner climate emulator simulation index
+    save      - True for storing output with db.Save_SIM_OFFSHORE()
+
+    returns xarray.Dataset with dims: time (hourly)
+        vars: AWT, MJO, DWT, MMSL, AT, Hs, Tp, Dir, SS, AWL, TWL, level, ...
+    '''
+
+    # covariates hourly data (only this simulation)
+    CVS_s = db.Generate_SIM_Covariates(n_sim=n_sim)
+
+    # generate hourly waves
+    WVS_s = waves_hourly(CE, n_sim, n_sim_ce=n_sim_ce)
+
+    # merge all data
+    d1, d2 = xds_limit_dates([WVS_s, CVS_s])
+    WVS_s = WVS_s.sel(time = slice(d1, d2))
+    SIM = xr.combine_by_coords([WVS_s, CVS_s])
+
+    # set AT reference level (mean at 0)
+    SIM['AT'].values[:] = SIM['AT'] - np.nanmean(SIM['AT'])
+
+    # calculate AWL, TWL and level
+    SIM['AWL'] = AWL(SIM['Hs'], SIM['Tp'])
+    SIM['TWL'] = SIM['AWL'] + SIM['SS'] + SIM['AT'] + SIM['MMSL']
+    SIM['level'] = SIM['SS'] + SIM['AT'] + SIM['MMSL']
+
+    # store hourly simulation offshore data
+    if save:
+        db.Save_SIM_OFFSHORE(SIM, n_sim)
+
+    return SIM
+
+def offshore_hourly(db, n_sims, CE=None, n_sim_ce=0, num_workers=1,
+                    save=True):
+    '''
+    Streaming generator for complete hourly offshore simulations output.
+
+    Simulations are generated (and stored) one at a time, only
+    num_workers simulations hourly data are kept in memory.
+
+    db          - teslakit Database (site already set)
+    n_sims      - number of DWTs simulations (int) or list of simulation indexes
+    CE          - optional Climate_Emulator (loaded). default: site emulator
+    n_sim_ce    - inner climate emulator simulation index
+    num_workers - number of simulations processed concurrently (processes)
+    save        - True for storing output with db.Save_SIM_OFFSHORE()
+
+    yields (n_sim, xarray.Dataset) in simulation order
+
+    example:
+        for n, SIM in offshore_hourly(db, 100, num_workers=4):
+            print('simulation {0} processed.'.format(n))
+    '''
+
+    # simulations to process
+    if isinstance(n_sims, int):
+        n_sims = range(n_sims)
+    l_sims = list(n_sims)
+
+    # load site climate emulator
+    if CE == None:
+        from .climate_emulator import Climate_Emulator
+        CE = Climate_Emulator(db.paths.site.EXTREMES.climate_emulator)
+        CE.Load()
+
+    # serial
+    if num_workers <= 1:
+        for n in l_sims:
+            yield n, offshore_hourly_sim(db, CE, n, n_sim_ce=n_sim_ce, save=save)
+        return
+
+    # bounded pool: at most num_workers simulations in memory
+    with ProcessPoolExecutor(max_workers=num_workers) as exe:
+
+        l_fut = []
+        for n in l_sims:
+            l_fut.append(
+                (n, exe.submit(offshore_hourly_sim, db, CE, n, n_sim_ce, save))
+            )
+
+            # wait for oldest simulation before submitting new ones
+            if len(l_fut) >= num_workers:
+                nf, fut = l_fut.pop(0)
+                yield nf, fut.result()
+
+        # remaining simulations
+        for nf, fut in l_fut:
+            yield nf, fut.result()
+
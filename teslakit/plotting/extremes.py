@@ -157,29 +157,25 @@ def Plot_ChromosomesProbs(xds_chrom, show=True):
     if show: plt.show()
     return fig
 
-def Plot_SigmaCorrelation(xds_chrom, d_sigma, show=True):
+def Plot_SigmaCorrelation(xds_chrom, xds_sigma, show=True):
     'Plot sigma correlation (Hs1-Hs2, Hs1-Tp1) for each WT using chrom triangles'
 
     # Get sigma correlation values for plot
-    n_wts = len(d_sigma.keys())
-    n_chs = len(d_sigma[list(d_sigma.keys())[0]].keys())
+    corr = xds_sigma.sigma_corr.values[:]  # (WT, n, var_i, var_j)
+    nvar = xds_sigma.sigma_nvar.values[:]
+    n_wts, n_chs = corr.shape[:2]
     ss = int(np.sqrt(n_wts))  # works for 36
 
     chrom = xds_chrom.chrom.values[:]
 
     sigma_plot = np.zeros((n_wts, n_chs)) * np.nan
-    sigma_wtcrom = np.zeros((n_wts, n_chs)) * np.nan
+    sigma_wtcrom = xds_sigma.sigma_wt_crom.values[:]
 
-    for c_wt, k_wt in enumerate(sorted(d_sigma.keys())):
-        for c_ch, k_ch in enumerate(sorted(d_sigma[k_wt].keys())):
-
-            corr = d_sigma[k_wt][k_ch]['corr']
-            if corr.shape[0]==3:
-                sigma_plot[c_wt, c_ch] = corr[0,1]  # one family. Hs - Tp corr
-            elif corr.shape[0]==6:
-                sigma_plot[c_wt, c_ch] = corr[0,3]  # two families. Hs1 - Hs2 corr
-
-            sigma_wtcrom[c_wt, c_ch] = d_sigma[k_wt][k_ch]['wt_crom']
+    for c_ch, nv in enumerate(nvar):
+        if nv==3:
+            sigma_plot[:, c_ch] = corr[:, c_ch, 0, 1]  # one family. Hs - Tp corr
+        elif nv==6:
+            sigma_plot[:, c_ch] = corr[:, c_ch, 0, 3]  # two families. Hs1 - Hs2 corr
 
     # triangle
     tsd = 10.0
@@ -210,7 +206,7 @@ def Plot_SigmaCorrelation(xds_chrom, d_sigma, show=True):
     axs = [i for sl in axs for i in sl]
 
     # plot each WT
-    for c_wt, k_wt in enumerate(sorted(d_sigma.keys())):
+    for c_wt in range(n_wts):
         ax = axs[c_wt]
 
         # plot triangle
@@ -4,8 +4,6 @@
 
 # pip
 import numpy as np
-import statsmodels.api as sm
-from statsmodels.distributions.empirical_distribution import ECDF
 from scipy.interpolate import interp1d
 from scipy.stats import norm, genpareto, t
 from scipy.special import ndtri  # norm inv
@@ -18,6 +16,7 @@ def ksdensity_CDF(x):
     '''
 
     # fit a univariate KDE
+    import statsmodels.api as sm
     kde = sm.nonparametric.KDEUnivariate(x)
     kde.fit()
 
@@ -32,6 +31,7 @@ def ksdensity_ICDF(x, p):
     '''
 
     # fit a univariate KDE
+    import statsmodels.api as sm
     kde = sm.nonparametric.KDEUnivariate(x)
     kde.fit()
 
@@ -78,6 +78,7 @@ def Empirical_CDF(x):
     '''
 
     # fit ECDF
+    from statsmodels.distributions.empirical_distribution import ECDF
     ecdf = ECDF(x)
     cdf = ecdf(x)
 
@@ -91,6 +92,7 @@ def Empirical_ICDF(x, p):
     # TODO: revisar que el fill_value funcione correctamente
 
     # fit ECDF
+    from statsmodels.distributions.empirical_distribution import ECDF
     ecdf = ECDF(x)
     cdf = ecdf(x)
 
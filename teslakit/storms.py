@@ -42,6 +42,143 @@ def GeoAzimuth(lat1, lon1, lat2, lon2):
 
     return az
 
+def GeoDistanceAzimuth_Grid(lat1, lon1, grid_lat, grid_lon):
+    '''
+    Great circle distance and azimuth from points to a regular lat, lon grid
+    (same formulae as GeoDistance and GeoAzimuth)
+
+    lat1, lon1         - points coordinates (n,)
+    grid_lat, grid_lon - grid coordinates (ny,) (nx,)
+
+    Trigonometric terms are solved at points and grid axes.
+
+    returns distance, azimuth (degrees) numpy.array (n, ny, nx)
+    '''
+
+    # points (n,1,1) and grid axes (1,ny,1) (1,1,nx) in radians
+    la1 = np.radians(np.asarray(lat1, dtype=float))[:, None, None]
+    lo1 = np.radians(np.asarray(lon1, dtype=float))[:, None, None]
+    la2 = np.radians(np.asarray(grid_lat, dtype=float))[None, :, None]
+    lo2 = np.radians(np.asarray(grid_lon, dtype=float))[None, None, :]
+
+    # trigonometric terms
+    s_dla = np.sin((la2-la1)/2)**2
+    s_dlo = np.sin((lo2-lo1)/2)**2
+    c_la1, s_la1 = np.cos(la1), np.sin(la1)
+    c_la2, s_la2 = np.cos(la2), np.sin(la2)
+
+    # distance
+    a = np.clip(s_dla + (c_la1 * c_la2) * s_dlo, 0, 1)
+    rng = np.degrees(2 * np.arctan2(np.sqrt(a), np.sqrt(1-a)))
+
+    # azimuth
+    az = np.arctan2(
+        c_la2 * np.sin(lo2-lo1),
+        c_la1 * s_la2 - (s_la1 * c_la2) * np.cos(lo2-lo1)
+    )
+    az = np.where(la1 <= -pi/2, 0, az)
+    az = np.where(la2 >= pi/2, 0, az)
+    az = np.where(la2 <= -pi/2, pi, az)
+    az = np.where(la1 >= pi/2, pi, az)
+    az = np.degrees(az % (2*pi))
+
+    return rng, az
+
+def Vortex_Model(storm_track, cg_lon, cg_lat, chunk_size=24, dtype='float64'):
+    '''
+    Rankine vortex (Hydromet) - Rodo (2009) wind model over a regular grid.
+    Time steps are solved in blocks of chunk_size.
+
+    storm_track    - pandas.DataFrame (time index) move, vf, lon, lat, pn, p0
+    cg_lon, cg_lat - grid longitude, latitude (nx,) (ny,) (spherical coordinates)
+    chunk_size     - number of time steps solved at once
+    dtype          - output data type
+
+    returns xarray.Dataset (time, lat, lon)
+        W (m/s), Dir (º clock. rel. north), U, V (m/s)
+    '''
+
+    # parameters
+    RE = 6378.135  # Earth radius
+    w = 0.2618  # velocidad angular Earth (rad/h)
+
+    # storm track variables
+    st_move = storm_track.move.values[:].astype(float)
+    st_vf = storm_track.vf.values[:].astype(float)
+    st_lon = storm_track.lon.values[:].astype(float)
+    st_lat = storm_track.lat.values[:].astype(float)
+    st_pn = storm_track.pn.values[:].astype(float)
+    st_p0 = np.maximum(storm_track.p0.values[:].astype(float), 900)  # fix p0
+
+    nt, ny, nx = len(st_move), len(cg_lat), len(cg_lon)
+
+    # output holders
+    d_out = dict([(vn, np.empty((nt, ny, nx), dtype=dtype)) for vn in ['W','Dir','U','V']])
+
+    for c0 in range(0, nt, chunk_size):
+        ct = slice(c0, min(c0 + chunk_size, nt))
+
+        # storm parameters (t,1,1)
+        move, vf, la, pn, p0 = [
+            v[ct, None, None] for v in [st_move, st_vf, st_lat, st_pn, st_p0]
+        ]
+
+        # get distance and angle between points 
+        arcl, beta = GeoDistanceAzimuth_Grid(st_lat[ct], st_lon[ct], cg_lat, cg_lon)
+        r = arcl * np.pi / 180.0 * RE
+
+        # Silva et al. 2010
+        RC = 0.4785 * p0 - 413.01
+
+        # Hydromet Rankin-Vortex model (eq. 76)
+        pr = p0 + (pn - p0) * np.exp(-2*RC/r)
+        py, px = np.gradient(pr, axis=(1,2))
+        ang = np.arctan2(py, px) + np.sign(la) * np.pi/2.0
+
+        # Wind model
+        f = 2 * w * np.sin(la*np.pi/180)  # coriolis
+        ur = 21.8 * np.sqrt(pn-p0) - 0.5 * f * RC  # wind max grad (km/h)
+
+        rr = r/RC
+        nc = (f*RC)/ur
+        A = -0.99 * (1.066-np.exp(-1.936*nc))
+        B = -0.357 * (1.4456-np.exp(-5.2388*nc))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fv = np.where(
+                rr < 1,
+                1 - 0.971 * np.exp(-6.826 * np.power(rr, 4.798)),  # eq. (9) Rodo (2009)
+                np.exp(A*np.power(np.log(rr),3) * np.exp(B*np.log(rr))),  # eq. (10)
+            )
+        fv[np.isnan(rr)] = 0
+
+        abnaut = move + beta
+        ab = np.remainder(-abnaut+270, 360) *np.pi/180 # nautical to cartesian
+
+        W = 0.986 * (fv*ur + 0.5*vf * np.cos(ab-np.pi/2))
+        W[W<0] = 0
+
+        # store wind (km/h --> m/s)
+        d_out['W'][ct] = W / 3.6
+        d_out['Dir'][ct] = 270 - np.rad2deg(ang)
+        d_out['U'][ct] = W * np.cos(ang) / 3.6
+        d_out['V'][ct] = W * np.sin(ang) / 3.6
+
+    xds_vortex = xr.Dataset(
+        {
+            'W': (('time','lat','lon'), d_out['W'], {'units':'m/s'}),
+            'Dir': (('time','lat','lon'), d_out['Dir'], {'units':'º'}),
+            'U': (('time','lat','lon'), d_out['U'], {'units':'m/s'}),
+            'V': (('time','lat','lon'), d_out['V'], {'units':'m/s'}),
+        },
+        coords = {
+            'time': storm_track.index[:],
+            'lat': cg_lat,
+            'lon': cg_lon,
+        }
+    )
+
+    return xds_vortex
+
 
 def Extract_Circle(xds_TCs, p_lon, p_lat, r, d_vns):
     '''
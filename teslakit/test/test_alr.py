@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# common
+import sys
+import subprocess
+
+# pip
+import numpy as np
+import xarray as xr
+import pytest
+
+
+# statsmodels import blocker (prediction workers environment)
+code_no_statsmodels = '''
+import sys
+import importlib.abc
+
+class BlockStatsmodels(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name.split('.')[0] == 'statsmodels':
+            raise ImportError('statsmodels blocked')
+
+sys.meta_path.insert(0, BlockStatsmodels())
+
+import numpy as np
+from teslakit.alr import ALR_WRP, ALR_Predictor
+
+ALRW = ALR_WRP(sys.argv[1])
+ALRW.LoadModel(compact=True)
+ALRW.LoadBmus_Fit()
+assert isinstance(ALRW.model, ALR_Predictor)
+
+time_sim = np.arange('2020-01-01', '2020-03-01', dtype='datetime64[D]')
+xds_sim = ALRW.Simulate(2, time_sim)
+assert xds_sim.evbmus_sims.shape == (len(time_sim), 2)
+assert 'statsmodels' not in sys.modules
+'''
+
+
+def test_alr_predictor_no_statsmodels(tmp_path):
+    'compact ALR model is loaded and simulated without statsmodels'
+
+    alr = pytest.importorskip('teslakit.alr')
+
+    # fit a small ALR model (statsmodels)
+    np.random.seed(0)
+    time_fit = np.arange('1990-01-01', '1995-01-01', dtype='datetime64[D]')
+    xds_bmus = xr.Dataset(
+        {'bmus': (('time',), np.random.randint(1, 5, len(time_fit)))},
+        coords = {'time': time_fit}
+    )
+    d_terms_settings = {
+        'mk_order': 1,
+        'constant': True,
+        'long_term': False,
+        'seasonality': (True, [2]),
+    }
+
+    ALRW = alr.ALR_WRP(str(tmp_path))
+    ALRW.SetFitData(4, xds_bmus, d_terms_settings)
+    ALRW.FitModel(max_iter=50)
+
+    # load compact model and simulate (statsmodels blocked)
+    r = subprocess.run(
+        [sys.executable, '-c', code_no_statsmodels, str(tmp_path)],
+        capture_output=True, text=True,
+    )
+    assert r.returncode == 0, r.stderr
+
@@ -0,0 +1,27 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# pip
+import numpy as np
+import pytest
+
+
+def test_snell_propagation_offshore_waves():
+    'waves heading offshore (relative angle clipped to +-90) do not propagate'
+
+    waves = pytest.importorskip('teslakit.waves')
+
+    # deep water at both depths for short periods (k_I == k_E)
+    T = np.array([2.6, 2.6, 8.0, 2.6])
+    H_I = np.array([4.2, 4.2, 4.2, 4.2])
+    dir_I = np.array([0.0, 120.0, 0.0, 270.0])
+
+    H_E, dir_E, Ks, Kr = waves.Snell_Propagation(T, H_I, dir_I, 200, 30, 270)
+
+    # offshore waves
+    assert np.all(Kr[:3] == 0)
+    assert np.all(H_E[:3] == 0)
+
+    # normal incidence: no refraction, deep water: no shoaling
+    assert np.isclose(Kr[3], 1)
+    assert np.isclose(H_E[3], 4.2)
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import numpy as np
+import pandas as pd
 import xarray as xr
 
 
@@ -9,42 +10,69 @@ def Calculate_MMSL(xda_tide, year_ini, year_end):
     '''
     Calculate monthly mean sea level
 
-    xda_tide  - xarray.DataArray (time,)
+    xda_tide  - xarray.DataArray (time,) or (n_sim, time)
+
+    Each month uses data from month start to month end, discarding last
+    month hour, and is only solved if it has at least 300 samples.
+    All months (and simulations) are solved at once.
+
+    returns xarray.Dataset (time,) or (n_sim, time), vars: mmsl, mmsl_median
     '''
 
-    lout_mean = []
-    lout_median = []
-    lout_time = []
-    for yy in range(year_ini, year_end+1):
-        for mm in range(1,13):
+    # minimum number of samples for month calculation
+    min_samples = 300
+
+    # input data (time at last dimension)
+    if 'n_sim' in xda_tide.dims:
+        xda_tide = xda_tide.transpose('n_sim', 'time')
+    time = xda_tide.time.values[:]
+    vv = np.atleast_2d(xda_tide.values[:])
+
+    # month of each sample
+    t_month = time.astype('datetime64[M]')
+    mk = t_month.astype(int)
+
+    # month start position and number of samples
+    u_mk, m_ini, m_cnt = np.unique(mk, return_index=True, return_counts=True)
+
+    # months windows [d1, d2] minus last 2 samples. (d2: next month start)
+    m_nxt = np.minimum(m_ini + m_cnt, len(time)-1)
+    d2_in = (m_ini + m_cnt < len(time)) & (mk[m_nxt] == u_mk+1) & \
+            (time[m_nxt] == t_month[m_nxt])
+    m_sel = m_cnt - np.where(d2_in, 1, 2)
 
-            d1 = np.datetime64('{0:04d}-{1:02d}'.format(yy,mm))
-            d2 = d1 + np.timedelta64(1, 'M')
+    # samples inside month window
+    s_pos = np.arange(len(time)) - np.repeat(m_ini, m_cnt)
+    s_in = s_pos < np.repeat(m_sel, m_cnt)
 
-            tide_sel_m = xda_tide.where(
-                (xda_tide.time >= d1) & (xda_tide.time <= d2),
-                drop = True)[:-2]
-            time_sel = tide_sel_m.time.values
+    # monthly mean and median (NaNs skipped)
+    df_sel = pd.DataFrame(vv[:, s_in].T)
+    gb_sel = df_sel.groupby(mk[s_in])
+    m_mean = gb_sel.mean().reindex(u_mk).values.T
+    m_median = gb_sel.median().reindex(u_mk).values.T
 
-            if len(time_sel) >= 300:
-                # mean, median and dates
-                ts_mean = tide_sel_m.mean().values
-                ts_median = tide_sel_m.median().values
-                ts_time = time_sel[int(len(time_sel)/2)]
+    # valid months: year limits and number of samples
+    m_year = u_mk // 12 + 1970
+    p_ok = (m_year >= year_ini) & (m_year <= year_end) & (m_sel >= min_samples)
 
-                lout_mean.append(ts_mean)
-                lout_median.append(ts_median)
-                lout_time.append(ts_time)
+    # months mid date
+    m_time = time[m_ini[p_ok] + m_sel[p_ok] // 2]
 
+    # join output in xarray.Dataset
+    if 'n_sim' in xda_tide.dims:
+        dims = ('n_sim', 'time',)
+        out_mean, out_median = m_mean[:, p_ok], m_median[:, p_ok]
+    else:
+        dims = ('time',)
+        out_mean, out_median = m_mean[0, p_ok], m_median[0, p_ok]
 
-    # join output in xarray.Dataset
     xds_MMSL = xr.Dataset(
         {
-            'mmsl':(('time',), lout_mean),
-            'mmsl_median':(('time',), lout_median),
+            'mmsl':(dims, out_mean),
+            'mmsl_median':(dims, out_median),
         },
         coords = {
-            'time': lout_time
+            'time': m_time
         }
     )
 
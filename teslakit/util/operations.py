@@ -71,3 +71,37 @@ def GetRepeatedValues(series):
 
     return l_subseq_index
 
+
+def segment_index(ix_ini, seg_len):
+    '''
+    Gathers array segments [ix_ini, ix_ini + seg_len) in one flat index
+
+    returns flat index and each segment start position at flat index
+    '''
+
+    seg_len = np.asarray(seg_len, dtype=int)
+    seg_ini = np.concatenate([[0], np.cumsum(seg_len)[:-1]]).astype(int)
+    seg_pos = np.arange(np.sum(seg_len)) - np.repeat(seg_ini, seg_len)
+
+    return np.repeat(ix_ini, seg_len) + seg_pos, seg_ini
+
+def segment_reduce(ufunc, vv, seg_ini):
+    'Applies ufunc.reduceat to consecutive (not empty) vv segments starting at seg_ini'
+
+    if len(seg_ini) == 0:
+        return np.array([], dtype=vv.dtype)
+
+    return ufunc.reduceat(vv, seg_ini)
+
+def segment_argmax(vv, seg_ini, seg_max=None):
+    'Returns first maximum position (flat index) of consecutive vv segments'
+
+    seg_len = np.diff(np.append(seg_ini, len(vv))).astype(int)
+    if seg_max is None:
+        seg_max = segment_reduce(np.fmax, vv, seg_ini)
+
+    # first position with segment max. value
+    ix_max = np.where(
+        vv == np.repeat(seg_max, seg_len), np.arange(len(vv)), len(vv))
+
+    return segment_reduce(np.minimum, ix_max, seg_ini)
@@ -4,6 +4,7 @@
 from datetime import datetime, timedelta, date
 from dateutil.relativedelta import relativedelta
 from cftime._cftime import DatetimeGregorian
+import cftime
 import calendar
 
 import numpy as np
@@ -292,33 +293,37 @@ def xds_further_dates(xds_list):
     return d1, d2
 
 def date2yearfrac(d):
-    'Returns date d in fraction of the year'
-
-    # get timetuple obj 
-    if isinstance(d, datetime):
-        ttup = d.timetuple()
+    '''
+    Returns date d in fraction of the year
 
-    elif isinstance(d, np.datetime64):
-        ttup = npdt64todatetime(d).timetuple()
+    d - date (any format) or dates array
+    '''
 
-    elif isinstance(d, DatetimeGregorian):
-        ttup = d.timetuple()
+    # day of year and year number of days
+    ys, _, _ = get_years_months_days(np.atleast_1d(d))
+    year_ndays = np.where(is_leap_year(ys), 366.0, 365.0)
 
-    # total number of days in year
-    year_ndays = 366.0 if calendar.isleap(ttup.tm_year) else 365.0
+    yf = day_of_year(np.atleast_1d(d)) / year_ndays
 
-    return ttup.tm_yday / year_ndays
+    return yf[0] if np.ndim(d) == 0 else yf
 
 def date2datenum(d):
-    'Returns date d (any format) in datetime'
+    '''
+    Returns date d (any format) in datetime
+
+    d - date or dates array (returns np.array of datetime)
+    '''
 
-    # TODO: new type switch for xarray.core numpy.datetime64
     # TODO: rename to date2datetime
 
     if isinstance(d, datetime):
         return d
 
-    # else get timetuple
+    # dates array
+    elif np.ndim(d) > 0:
+        return time2datetime64(d, unit='s').astype(object)
+
+    # else get timetuple
     elif isinstance(d, np.datetime64):
         ttup = npdt64todatetime(d).timetuple()
 
@@ -328,24 +333,76 @@ def date2datenum(d):
     # return datetime 
     return datetime(*ttup[:6])
 
-def get_years_months_days(time):
+def time2datetime64(time, unit='D'):
     '''
-    Returns years, months, days of time in separete lists
+    Returns times array as np.datetime64 array with "unit" resolution.
+    (no 2262 limit for resolutions coarser than ns). Seconds resolution
+    for datetime and cftime objects
 
-    (Used to avoid problems with dates type)
+    time - np.datetime64, datetime, date or DatetimeGregorian (cftime) array
+           (other cftime calendars raise ValueError)
     '''
 
-    t0 = time[0]
-    if isinstance(t0, (date, datetime, DatetimeGregorian)):
-        ys = np.asarray([x.year for x in time])
-        ms = np.asarray([x.month for x in time])
-        ds = np.asarray([x.day for x in time])
+    time = np.asarray(time)
+    dt = 'datetime64[{0}]'.format(unit)
 
+    if np.issubdtype(time.dtype, np.datetime64) or time.size == 0:
+        return time.astype(dt)
+
+    # date objects: integer day ordinals
+    t0 = time.flat[0]
+    if isinstance(t0, cftime.datetime):
+        if t0.calendar not in ['standard', 'gregorian', 'proleptic_gregorian']:
+            raise ValueError(
+                'time2datetime64: cftime calendar "{0}" not supported'.format(
+                    t0.calendar))
+        d_epoch = 2440588  # julian day number at 1970-01-01
     else:
-        tpd = pd.DatetimeIndex(time)
-        ys = tpd.year
-        ms = tpd.month
-        ds = tpd.day
+        d_epoch = 719163   # datetime.date ordinal at 1970-01-01
+
+    tr = time.ravel()
+    days = np.fromiter((x.toordinal() for x in tr), 'int64', tr.size) - d_epoch
+    t64 = days.astype('datetime64[D]')
+
+    # add time of day
+    if unit not in ['Y', 'M', 'W', 'D'] and hasattr(t0, 'hour'):
+        secs = np.fromiter(
+            (x.hour*3600 + x.minute*60 + x.second for x in tr), 'int64', tr.size)
+        t64 = t64.astype('datetime64[s]') + secs.astype('timedelta64[s]')
+
+    return t64.reshape(time.shape).astype(dt)
+
+def is_leap_year(years):
+    'Returns True for leap years (np.array)'
+
+    years = np.asarray(years)
+
+    return (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+
+def day_of_year(time):
+    '''
+    Returns day of year (1 for January 1st) for times array (any date format)
+    '''
+
+    t_d = time2datetime64(time, unit='D')
+
+    return (t_d - t_d.astype('datetime64[Y]')).astype(int) + 1
+
+def get_years_months_days(time):
+    '''
+    Returns years, months, days of time in separete np.arrays
+
+    time - np.datetime64, datetime, date or DatetimeGregorian array
+    (integer calendar arithmetic, no per-element conversions)
+    '''
+
+    t_d = time2datetime64(time, unit='D')
+    t_m = t_d.astype('datetime64[M]')
+    t_y = t_d.astype('datetime64[Y]')
+
+    ys = t_y.astype(int) + 1970
+    ms = (t_m - t_y).astype(int) + 1
+    ds = (t_d - t_m).astype(int) + 1
 
     return ys, ms, ds
 
@@ -381,3 +438,45 @@ def add_max_storms_mask(xds, times_max_storms, name_mask='max_storms'):
 
     return xds
 
+
+def diff_days(time):
+    '''
+    Returns number of days (int) between consecutive dates at time array
+
+    time - np.datetime64, datetime or DatetimeGregorian array
+    '''
+
+    t_df = np.diff(np.asarray(time))
+
+    return np.floor(timedelta2hours(t_df) / 24).astype(int)
+
+def generate_hourly(t0, num_hours):
+    '''
+    Returns hourly times array starting at t0 (any date format)
+
+    output is np.datetime64[h], or datetime if dates go beyond 2262
+    '''
+
+    t0 = np.datetime64(date2datenum(t0), 'h')
+    th = t0 + np.arange(num_hours).astype('timedelta64[h]')
+
+    # np.datetime64[ns] limit
+    if th[-1] >= np.datetime64('2262-04-11', 'h'):
+        th = th.astype(object)  # datetime.datetime
+
+    return th
+
+def timedelta2hours(t_df):
+    '''
+    Returns time differences array in hours (float)
+
+    t_df - np.timedelta64 or datetime.timedelta array
+    '''
+
+    t_df = np.asarray(t_df)
+
+    # datetime / DatetimeGregorian differences are datetime.timedelta objects
+    if not np.issubdtype(t_df.dtype, np.timedelta64):
+        t_df = t_df.astype('timedelta64[us]')
+
+    return t_df / np.timedelta64(1, 'h')
@@ -6,14 +6,131 @@ import xarray as xr
 from datetime import datetime, timedelta
 
 # tk
-from .util.time_operations import get_years_months_days, npdt64todatetime, \
-fast_reindex_hourly
+from .util.time_operations import get_years_months_days, diff_days, \
+generate_hourly
 
 # hide numpy warnings
 np.warnings.filterwarnings('ignore')
 
 
-# TODO: combine GetDistribution functions (parse gow input and call GetDistribution?)
+def Sectors_Labels(p_dir, swell_sectors):
+    '''
+    Swell sector of each wave partition (single np.digitize lookup)
+
+    p_dir - partitions direction (any shape)
+    swell_sectors - list of degrees to cut wave energy [(a1, a2), (a2, a3), (a3, a1)]
+                    sectors are (s_ini, s_end], should not overlap (first
+                    sector is used)
+
+    returns sector index (same shape as p_dir), len(swell_sectors) if outside
+    all sectors (or nan direction)
+    '''
+
+    # sectors edges and sector of each edges interval
+    edges = np.unique(np.array(swell_sectors, dtype=float))
+    mids = np.concatenate(
+        [[edges[0]-1], (edges[:-1] + edges[1:])/2, [edges[-1]+1]]
+    )
+
+    n_sect = len(swell_sectors)
+    l_int = np.full(len(mids)+1, n_sect)
+    for c in reversed(range(n_sect)):
+        s_ini, s_end = swell_sectors[c]
+        if s_ini < s_end:
+            in_sw = (mids <= s_end) & (mids > s_ini)
+        else:
+            in_sw = (mids <= s_end) | (mids > s_ini)
+        l_int[:-1][in_sw] = c
+
+    # partitions interval (nan directions at last interval)
+    p_int = np.digitize(p_dir, edges, right=True)
+    p_int[np.isnan(p_dir)] = len(mids)
+
+    return l_int[p_int]
+
+def Aggregate_Sectors(p_hs, p_tp, p_dir, swell_sectors):
+    '''
+    Aggregate wave partitions inside each swell sector (single pass)
+
+    p_hs, p_tp, p_dir - numpy.array (..., partition)
+    swell_sectors - list of degrees to cut wave energy [(a1, a2), (a2, a3), (a3, a1)]
+
+    returns Hs, Tp, Dir numpy.array (..., sector)
+    '''
+
+    n_sect = len(swell_sectors)
+    shp = p_hs.shape[:-1]
+    n_rows = int(np.prod(shp))
+
+    # partitions sector labels (extra sector for partitions outside sectors)
+    lbl = Sectors_Labels(p_dir, swell_sectors)
+    ix = (np.arange(n_rows).reshape(shp + (1,)) * (n_sect+1) + lbl).ravel()
+
+    # accumulate Hs**2, Hs**2/Tp**2 and Hs**2*Tp direction components
+    def acc(w):
+        w = np.where(np.isnan(w), 0, w).ravel()
+        a = np.bincount(ix, weights=w, minlength=n_rows*(n_sect+1))
+        return a.reshape(shp + (n_sect+1,))[..., :n_sect]
+
+    h2 = np.square(p_hs)
+    d_rad = np.deg2rad(p_dir)
+    s_h2 = acc(h2)
+    s_h2tp2 = acc(h2 / np.square(p_tp))
+    h2 *= p_tp
+    s_sin = acc(h2 * np.sin(d_rad))
+    s_cos = acc(h2 * np.cos(d_rad))
+
+    # number of partitions and direction sum (one partition sectors)
+    cnt = np.bincount(ix, minlength=n_rows*(n_sect+1)).reshape(
+        shp + (n_sect+1,))[..., :n_sect]
+    s_dir = acc(p_dir)
+
+    # calculate swell Hs, Tp, Dir
+    swell_Hs = np.sqrt(s_h2)
+    swell_Tp = np.sqrt(s_h2 / s_h2tp2)
+    swell_Dir = np.arctan2(s_sin, s_cos)
+
+    # dir correction and denormalization 
+    swell_Dir[swell_Dir<0] = swell_Dir[swell_Dir<0] + 2*np.pi
+    swell_Dir = swell_Dir*180/np.pi
+
+    # dont do arctan2 if there is only one dir
+    swell_Dir[cnt==1] = s_dir[cnt==1]
+
+    # out of bound dir correction
+    swell_Dir[swell_Dir>360] = swell_Dir[swell_Dir>360] - 360
+    swell_Dir[swell_Dir<0] = swell_Dir[swell_Dir<0] + 360
+
+    # fix swell all-nans to 0s nansum behaviour
+    p_fix = swell_Hs==0
+    swell_Hs[p_fix] = np.nan
+    swell_Tp[p_fix] = np.nan
+    swell_Dir[p_fix] = np.nan
+
+    return swell_Hs, swell_Tp, swell_Dir
+
+def Families_Dataset(dims, coords, sea, swells):
+    '''
+    Mount waves families xarray.Dataset
+
+    sea    - (Hs, Tp, Dir) numpy.array (...)
+    swells - (Hs, Tp, Dir) numpy.array (..., sector)
+    '''
+
+    xds_fams = xr.Dataset(
+        {
+            'sea_Hs': (dims, sea[0]),
+            'sea_Tp': (dims, sea[1]),
+            'sea_Dir': (dims, sea[2]),
+        },
+        coords = coords
+    )
+
+    for c in range(swells[0].shape[-1]):
+        for vn, vv in zip(['Hs', 'Tp', 'Dir'], swells):
+            xds_fams['swell_{0}_{1}'.format(c+1, vn)] = (dims, vv[..., c])
+
+    return xds_fams
 
 def GetDistribution_gow(xds_wps, swell_sectors, n_partitions=5):
     '''
@@ -24,6 +141,7 @@ def GetDistribution_gow(xds_wps, swell_sectors, n_partitions=5):
 
     xds_wps (waves partitionss):
         xarray.Dataset (time,), phs, pspr, pwfrac... {0-5 partitions}
+        (any other dimension, ex: (point, time), is solved at once)
 
     sectors: list of degrees to cut wave energy [(a1, a2), (a2, a3), (a3, a1)]
 
@@ -31,97 +149,31 @@ def GetDistribution_gow(xds_wps, swell_sectors, n_partitions=5):
         xarray.Dataset (time,), fam_V, {fam: sea,swell_1,swell2. V: Hs,Tp,Dir}
     '''
 
+    # partitions data (partition at last dimension)
+    dims = xds_wps['phs0'].dims
+    cat_hs, cat_tp, cat_dir = [
+        np.stack(
+            [xds_wps['{0}{1}'.format(vn, i)].transpose(*dims).values
+             for i in range(n_partitions+1)], axis=-1
+        ) for vn in ['phs', 'ptp', 'pdir']
+    ]
+
     # fix data
     hs_fix_data = 50
-    for i in range(6):
-        phs = xds_wps['phs{0}'.format(i)].values
-        p_fix = np.where(phs >= hs_fix_data)[0]
-
-        # fix data
-        xds_wps['phs{0}'.format(i)][p_fix] = np.nan
-        xds_wps['ptp{0}'.format(i)][p_fix] = np.nan
-        xds_wps['pdir{0}'.format(i)][p_fix] = np.nan
+    p_fix = cat_hs >= hs_fix_data
+    cat_hs[p_fix] = np.nan
+    cat_tp[p_fix] = np.nan
+    cat_dir[p_fix] = np.nan
 
     # sea (partition 0)
-    sea_Hs = xds_wps['phs0'].values
-    sea_Tp = xds_wps['ptp0'].values
-    sea_Dir = xds_wps['pdir0'].values
-    time = xds_wps['time'].values
-
-    # concatenate energy groups 
-    cat_hs = np.column_stack(
-        [xds_wps['phs{0}'.format(i)] for i in range(1, n_partitions+1)])
-    cat_tp = np.column_stack(
-        [xds_wps['ptp{0}'.format(i)] for i in range(1, n_partitions+1)])
-    cat_dir = np.column_stack(
-        [xds_wps['pdir{0}'.format(i)] for i in range(1, n_partitions+1)])
-
-    # prepare output array
-    xds_fams = xr.Dataset(
-        {
-            'sea_Hs': ('time', sea_Hs),
-            'sea_Tp': ('time', sea_Tp),
-            'sea_Dir': ('time', sea_Dir),
-        },
-        coords = {'time': time}
-    )
+    sea = (cat_hs[..., 0], cat_tp[..., 0], cat_dir[..., 0])
 
-    # solve sectors
-    c = 1
-    for s_ini, s_end in swell_sectors:
-        if s_ini < s_end:
-            p_sw = np.where((cat_dir <= s_end) & (cat_dir > s_ini))
-        else:
-            p_sw = np.where((cat_dir <= s_end) | (cat_dir > s_ini))
-
-        # get data inside sector
-        sect_dir = np.zeros(cat_dir.shape)*np.nan
-        sect_hs = np.zeros(cat_dir.shape)*np.nan
-        sect_tp = np.zeros(cat_dir.shape)*np.nan
-
-        sect_dir[p_sw] = cat_dir[p_sw]
-        sect_hs[p_sw] = cat_hs[p_sw]
-        sect_tp[p_sw] = cat_tp[p_sw]
-
-        # calculate swell Hs, Tp, Dir
-        swell_Hs = np.sqrt(np.nansum(np.power(sect_hs,2), axis=1))
-
-        swell_Tp = np.sqrt(
-            np.nansum(np.power(sect_hs,2), axis=1) /
-            np.nansum(np.power(sect_hs,2)/np.power(sect_tp,2), axis=1)
-        )
-        swell_Dir = np.arctan2(
-            np.nansum(np.power(sect_hs,2) * sect_tp * np.sin(sect_dir*np.pi/180), axis=1),
-            np.nansum(np.power(sect_hs,2) * sect_tp * np.cos(sect_dir*np.pi/180), axis=1)
-        )
-
-        # dir correction and denormalization 
-        swell_Dir[np.where((swell_Dir<0))] = swell_Dir[np.where((swell_Dir<0))]+2*np.pi
-        swell_Dir = swell_Dir*180/np.pi
-
-        # dont do arctan2 if there is only one dir
-        i_onedir = np.where(
-            (np.count_nonzero(~np.isnan(sect_dir),axis=1)==1)
-        )[0]
-        swell_Dir[i_onedir] = np.nanmin(sect_dir[i_onedir], axis=1)
-
-        # out of bound dir correction
-        swell_Dir[np.where((swell_Dir>360))] = swell_Dir[np.where((swell_Dir>360))]-360
-        swell_Dir[np.where((swell_Dir<0))] = swell_Dir[np.where((swell_Dir<0))]+360
-
-
-        # fix swell all-nans to 0s nansum behaviour
-        p_fix = np.where(swell_Hs==0)
-        swell_Hs[p_fix] = np.nan
-        swell_Dir[p_fix] = np.nan
-
-        # append data to partitons dataset
-        xds_fams['swell_{0}_Hs'.format(c)] = ('time', swell_Hs)
-        xds_fams['swell_{0}_Tp'.format(c)] = ('time', swell_Tp)
-        xds_fams['swell_{0}_Dir'.format(c)] = ('time', swell_Dir)
-        c+=1
+    # swell sectors
+    swells = Aggregate_Sectors(
+        cat_hs[..., 1:], cat_tp[..., 1:], cat_dir[..., 1:], swell_sectors)
 
-    return xds_fams
+    coords = dict([(d, xds_wps[d].values) for d in dims if d in xds_wps.coords])
+    return Families_Dataset(dims, coords, sea, swells)
 
 def GetDistribution_ws(xds_wps, swell_sectors, n_partitions=5):
     '''
@@ -132,6 +184,7 @@ def GetDistribution_ws(xds_wps, swell_sectors, n_partitions=5):
 
     xds_wps (waves partitionss):
         xarray.Dataset (time,), phs, pspr, pwfrac... {0-5 partitions}
+        (any other dimension, ex: (point, time), is solved at once)
 
     sectors: list of degrees to cut wave energy [(a1, a2), (a2, a3), (a3, a1)]
 
@@ -139,93 +192,27 @@ def GetDistribution_ws(xds_wps, swell_sectors, n_partitions=5):
         xarray.Dataset (time,), fam_V, {fam: sea,swell_1,swell2. V: Hs,Tp,Dir}
     '''
 
+    # partitions data (partition at last dimension)
+    xds_p = xds_wps.isel(part=slice(0, n_partitions+1))
+    dims = tuple(d for d in xds_p.hs.dims if d != 'part')
+    cat_hs, cat_tp, cat_dir = [
+        xds_p[vn].transpose(*dims, 'part').values.astype(float)
+        for vn in ['hs', 'tp', 'dpm']
+    ]
+
     # sea (partition 0)
-    sea_Hs = xds_wps.isel(part=0).hs.values
-    sea_Tp = xds_wps.isel(part=0).tp.values
-    sea_Dir = xds_wps.isel(part=0).dpm.values
-    time = xds_wps.time.values
+    sea = (cat_hs[..., 0].copy(), cat_tp[..., 0].copy(), cat_dir[..., 0].copy())
 
     # fix sea all-nans to 0s nansum behaviour
-    p_fix = np.where(sea_Hs==0)
-    sea_Hs[p_fix] = np.nan
-    sea_Tp[p_fix] = np.nan
-    sea_Dir[p_fix] = np.nan
-
-    # concatenate energy groups 
-    cat_hs = np.column_stack(
-        [xds_wps.isel(part=i).hs.values for i in range(1, n_partitions+1)])
-    cat_tp = np.column_stack(
-        [xds_wps.isel(part=i).tp.values for i in range(1, n_partitions+1)])
-    cat_dir = np.column_stack(
-        [xds_wps.isel(part=i).dpm.values for i in range(1, n_partitions+1)])
-
-    # prepare output array
-    xds_fams = xr.Dataset(
-        {
-            'sea_Hs': ('time', sea_Hs),
-            'sea_Tp': ('time', sea_Tp),
-            'sea_Dir': ('time', sea_Dir),
-        },
-        coords = {'time': time}
-    )
+    p_fix = sea[0]==0
+    for sv in sea: sv[p_fix] = np.nan
 
-    # solve sectors
-    c = 1
-    for s_ini, s_end in swell_sectors:
-        if s_ini < s_end:
-            p_sw = np.where((cat_dir <= s_end) & (cat_dir > s_ini))
-        else:
-            p_sw = np.where((cat_dir <= s_end) | (cat_dir > s_ini))
-
-        # get data inside sector
-        sect_dir = np.zeros(cat_dir.shape)*np.nan
-        sect_hs = np.zeros(cat_dir.shape)*np.nan
-        sect_tp = np.zeros(cat_dir.shape)*np.nan
-
-        sect_dir[p_sw] = cat_dir[p_sw]
-        sect_hs[p_sw] = cat_hs[p_sw]
-        sect_tp[p_sw] = cat_tp[p_sw]
-
-        # calculate swell Hs, Tp, Dir
-        swell_Hs = np.sqrt(np.nansum(np.power(sect_hs,2), axis=1))
-
-        swell_Tp = np.sqrt(
-            np.nansum(np.power(sect_hs,2), axis=1) /
-            np.nansum(np.power(sect_hs,2)/np.power(sect_tp,2), axis=1)
-        )
-        swell_Dir = np.arctan2(
-            np.nansum(np.power(sect_hs,2) * sect_tp * np.sin(sect_dir*np.pi/180), axis=1),
-            np.nansum(np.power(sect_hs,2) * sect_tp * np.cos(sect_dir*np.pi/180), axis=1)
-        )
-
-        # dir correction and denormalization 
-        swell_Dir[np.where((swell_Dir<0))] = swell_Dir[np.where((swell_Dir<0))]+2*np.pi
-        swell_Dir = swell_Dir*180/np.pi
-
-        # dont do arctan2 if there is only one dir
-        i_onedir = np.where(
-            (np.count_nonzero(~np.isnan(sect_dir),axis=1)==1)
-        )[0]
-        swell_Dir[i_onedir] = np.nanmin(sect_dir[i_onedir], axis=1)
-
-        # out of bound dir correction
-        swell_Dir[np.where((swell_Dir>360))] = swell_Dir[np.where((swell_Dir>360))]-360
-        swell_Dir[np.where((swell_Dir<0))] = swell_Dir[np.where((swell_Dir<0))]+360
-
-
-        # fix swell all-nans to 0s nansum behaviour
-        p_fix = np.where(swell_Hs==0)
-        swell_Hs[p_fix] = np.nan
-        swell_Tp[p_fix] = np.nan
-        swell_Dir[p_fix] = np.nan
-
-        # append data to partitons dataset
-        xds_fams['swell_{0}_Hs'.format(c)] = ('time', swell_Hs)
-        xds_fams['swell_{0}_Tp'.format(c)] = ('time', swell_Tp)
-        xds_fams['swell_{0}_Dir'.format(c)] = ('time', swell_Dir)
-        c+=1
+    # swell sectors
+    swells = Aggregate_Sectors(
+        cat_hs[..., 1:], cat_tp[..., 1:], cat_dir[..., 1:], swell_sectors)
 
-    return xds_fams
+    coords = dict([(d, xds_wps[d].values) for d in dims if d in xds_wps.coords])
+    return Families_Dataset(dims, coords, sea, swells)
 
 def AWL(hs, tp):
     'Returns Atmospheric Water Level'
@@ -237,203 +224,286 @@ def TWL(awl, ss, at, mmsl):
 
     return awl + ss + at + mmsl
 
-def Aggregate_WavesFamilies(wvs_fams, a_tp='quadratic'):
+def Aggregate_Families(vv_Hs, vv_Tp, vv_Dir, a_tp='quadratic'):
     '''
-    Aggregate Hs, Tp and Dir from waves families data
-
-    wvs_fams (waves families):
-        xarray.Dataset (time,), fam1_Hs, fam1_Tp, fam1_Dir, ...
-        {any number of families}
+    Aggregate Hs, Tp and Dir from waves families arrays
 
+    vv_Hs, vv_Tp, vv_Dir - numpy.array (..., family), any leading dimensions
     a_tp = 'quadratic' / 'max_energy', Tp aggregation formulae
 
-    returns Hs, Tp, Dir (numpy.array)
+    returns Hs, Tp, Dir (numpy.array (...))
     '''
 
-    # get variable names
-    vs = [str(x) for x in wvs_fams.keys()]
-    vs_Hs = [x for x in vs if x.endswith('_Hs')]
-    vs_Tp = [x for x in vs if x.endswith('_Tp')]
-    vs_Dir = [x for x in vs if x.endswith('_Dir')]
-    times = wvs_fams.time.values[:]
-
-    # join variable values
-    vv_Hs = np.column_stack([wvs_fams[v].values[:] for v in vs_Hs])
-    vv_Tp = np.column_stack([wvs_fams[v].values[:] for v in vs_Tp])
-    vv_Dir = np.column_stack([wvs_fams[v].values[:] for v in vs_Dir])
-
-    # TODO: entire row nan?
-    #p_rn = np.where([x.all() for x in np.isnan(vv_Hs)])[0]
-    #vv_Hs = vv_Hs[~p_rn]
-    #vv_Tp = vv_Tp[~p_rn]
-    #vv_Dir = vv_Dir[~p_rn]
-    #times = wvs_fams.time.values[~p_rn]
+    # Hs**2 from families (buffer reused for Tp and Dir weights)
+    h2 = np.square(vv_Hs)
 
     # Hs from families
-    HS = np.sqrt(np.nansum(np.power(vv_Hs,2), axis=1))
+    s_h2 = np.nansum(h2, axis=-1)
+    HS = np.sqrt(s_h2)
 
     # nan positions
-    ix_nan_data = np.where(HS==0)
+    ix_nan_data = HS==0
 
     # Tp
     if a_tp == 'quadratic':
 
-        # TP from families 
-        tmp1 = np.power(vv_Hs,2)
-        tmp2 = np.divide(np.power(vv_Hs,2), np.power(vv_Tp,2))
-        TP = np.sqrt(np.nansum(tmp1, axis=1) / np.nansum(tmp2, axis=1))
+        # TP from families 
+        TP = np.sqrt(s_h2 / np.nansum(h2 / np.square(vv_Tp), axis=-1))
 
     elif a_tp == 'max_energy':
 
         # Hs maximun position 
-        vv_Hs_nanzero = vv_Hs.copy()
-        vv_Hs_nanzero[np.isnan(vv_Hs)] = 0
-        p_max_hs = np.nanargmax(vv_Hs_nanzero, axis=1)
+        p_max_hs = np.argmax(np.where(np.isnan(vv_Hs), 0, vv_Hs), axis=-1)
 
         # Tp from families (Hs max pos)
-        TP = np.array([r[i] for r,i in zip(vv_Tp, p_max_hs)])
+        TP = np.take_along_axis(vv_Tp, p_max_hs[..., np.newaxis], axis=-1)[..., 0]
 
     else:
-        # TODO: make it fail
-        pass
-
+        raise ValueError('a_tp not in quadratic / max_energy: {0}'.format(a_tp))
 
-    # Dir from families
+    # Dir from families (Hs**2 * Tp weights)
+    h2 *= vv_Tp
+    d_rad = np.deg2rad(vv_Dir)
     tmp3 = np.arctan2(
-        np.nansum(np.power(vv_Hs,2) * vv_Tp * np.sin(vv_Dir * np.pi/180), axis=1),
-        np.nansum(np.power(vv_Hs,2) * vv_Tp * np.cos(vv_Dir * np.pi/180), axis=1)
+        np.nansum(h2 * np.sin(d_rad), axis=-1),
+        np.nansum(h2 * np.cos(d_rad), axis=-1)
     )
     tmp3[tmp3<0] = tmp3[tmp3<0] + 2*np.pi
     DIR = tmp3 * 180/np.pi
 
-    # clear nans
+    # clear nans
     HS[ix_nan_data] = np.nan
     TP[ix_nan_data] = np.nan
     DIR[ix_nan_data] = np.nan
 
-    # TODO: se usa?
-    # Dir from families (Hs max pos)
-    #DIR = np.array([r[i] for r,i in zip(vv_Dir, p_max_hs)])
+    return HS, TP, DIR
+
+def Aggregate_WavesFamilies(wvs_fams, a_tp='quadratic', dtype=None, chunks=None):
+    '''
+    Aggregate Hs, Tp and Dir from waves families data
+
+    wvs_fams (waves families):
+        xarray.Dataset (time,) or (n_sim, time), fam1_Hs, fam1_Tp, fam1_Dir, ...
+        {any number of families}
+
+    a_tp = 'quadratic' / 'max_energy', Tp aggregation formulae
+
+    dtype  - optional data type used for aggregation (ex: 'float32')
+    chunks - optional dask chunks (ex: {'time': 365*24}). Aggregation is solved
+             lazily by chunks (also if wvs_fams is already a dask dataset)
+
+    returns xarray.Dataset (same dimensions as input), Hs, Tp, Dir
+    '''
+
+    # get variable names
+    vs = [str(x) for x in wvs_fams.keys()]
+    vs_Hs = [x for x in vs if x.endswith('_Hs')]
+    vs_Tp = [x for x in vs if x.endswith('_Tp')]
+    vs_Dir = [x for x in vs if x.endswith('_Dir')]
+
+    # optional dask chunks
+    if chunks != None:
+        wvs_fams = wvs_fams[vs_Hs + vs_Tp + vs_Dir].chunk(chunks)
+
+    # join variable values (family at last dimension)
+    def join_fams(vns):
+        xda = xr.concat([wvs_fams[v] for v in vns], dim='family')
+        if dtype != None: xda = xda.astype(dtype)
+        if xda.chunks != None: xda = xda.chunk({'family': -1})
+        return xda
+
+    HS, TP, DIR = xr.apply_ufunc(
+        Aggregate_Families,
+        join_fams(vs_Hs), join_fams(vs_Tp), join_fams(vs_Dir),
+        kwargs = {'a_tp': a_tp},
+        input_core_dims = [['family']]*3,
+        output_core_dims = [[]]*3,
+        dask = 'parallelized',
+        output_dtypes = [dtype or wvs_fams[vs_Hs[0]].dtype]*3,
+    )
 
     # return xarray.Dataset
     xds_AGGR = xr.Dataset(
         {
-            'Hs': (('time',), HS),
-            'Tp': (('time',), TP),
-            'Dir': (('time',), DIR),
+            'Hs': HS,
+            'Tp': TP,
+            'Dir': DIR,
         },
-        coords = {
-            'time': times,  # get time from input
-        }
     )
 
     return xds_AGGR
 
-def Intradaily_Hydrograph(xds_wvs, xds_tcs):
+def Hydrograph_Hourly(s_dur_h, vv, mu, tau, out=None):
+    '''
+    Calculates variable intradaily (hourly) piecewise-linear hydrograph.
+    All storms (and simulations) are solved with one interpolation.
+
+    s_dur_h - storms duration, integer hours (storm-1,)
+    vv      - variable value at storm max. (storm,) or (n_sim, storm)
+    mu      - storms mu (storm,) or (n_sim, storm)
+    tau     - storms max. instant (0-1) (storm,) or (n_sim, storm)
+    out     - optional preallocated output (hours,) or (n_sim, hours)
+
+    returns hourly variable values (hours,) or (n_sim, hours)
+    '''
+
+    one_sim = np.ndim(vv) == 1 and np.ndim(mu) == 1 and np.ndim(tau) == 1
+
+    # stack input (n_sim, storm)
+    vv, mu, tau = np.broadcast_arrays(*np.atleast_2d(vv, mu, tau))
+    n_sim, n_storms = vv.shape
+
+    # hours since time start at hydrographs extremes (storms start)
+    s_cs_h = np.concatenate([[0], np.cumsum(s_dur_h)])
+    n_hours = int(s_cs_h[-1]) + 1
+
+    # storm tau max (hours since time start)
+    tau_h = np.floor(s_cs_h[:-1] + s_dur_h * tau[:,:-1])
+
+    # var value at hydrographs extremes
+    vv_extr = vv * np.power(2*mu-1, 2)
+
+    # make it continuous
+    vv_extr_cont = (np.roll(vv_extr, 1, axis=1) + vv_extr) / 2
+    vv_extr_cont[:,0] = vv_extr_cont[:,1]
+    vv_extr_cont[:,-1] = vv_extr_cont[:,-2]
+
+    # join hydrograph extremes and max. (interleaved, already sorted)
+    n_knots = 2*n_storms - 1
+    vt = np.empty((n_sim, n_knots))
+    vt[:,0::2] = s_cs_h
+    vt[:,1::2] = tau_h
+    vk = np.empty((n_sim, n_knots))
+    vk[:,0::2] = vv_extr_cont
+    vk[:,1::2] = vv[:,:-1]
+
+    # move each simulation to its own hours block, then interpolate once
+    vt += (np.arange(n_sim) * n_hours)[:,None]
+    h_values = np.interp(np.arange(n_sim * n_hours), vt.ravel(), vk.ravel())
+
+    # store at output buffer
+    if out is None:
+        out = np.empty(n_hours) if one_sim else np.empty((n_sim, n_hours))
+    out[...] = h_values.reshape(out.shape)
+
+    return out
+
+def Pad_Hourly(s_dur_h, vv, out=None):
+    '''
+    Repeats (pad) storms variable value to hourly data
+
+    s_dur_h - storms duration, integer hours (storm-1,)
+    vv      - variable value (storm,) or (n_sim, storm)
+    out     - optional preallocated output (hours,) or (n_sim, hours)
+
+    returns hourly variable values (hours,) or (n_sim, hours)
+    '''
+
+    vv = np.asarray(vv)
+
+    # store at output buffer
+    if out is None:
+        out = np.empty(vv.shape[:-1] + (int(np.sum(s_dur_h)) + 1,))
+    out[...,:-1] = np.repeat(vv[...,:-1], s_dur_h, axis=-1)
+    out[...,-1] = vv[...,-1]
+
+    return out
+
+def Intradaily_Hydrograph(xds_wvs, xds_tcs, out=None):
     '''
     Calculates intradaily hydrograph (hourly) from a time series of storms.
     storms waves data (hs, tp, dir) and TCs data (mu, tau, ss) is needed.
 
     xds_wvs (waves aggregated):
-        xarray.Dataset (time,), Hs, Tp, Dir
+        xarray.Dataset (time,) or (n_sim, time), Hs, Tp, Dir
 
     xds_tcs (TCs):
-        xarray.Dataset (time,), mu, tau, ss
+        xarray.Dataset (time,) or (n_sim, time), mu, tau, ss
 
-    returns xarray.Dataset (time,), Hs, Tp, Dir, SS  (hourly)
+    out - optional dictionary with preallocated hourly output buffers
+          {vn: np.array (hours,) or (n_sim, hours)}, vn: Hs, Tp, Dir, SS
+
+    returns xarray.Dataset (time,) or (n_sim, time), Hs, Tp, Dir, SS  (hourly)
     '''
 
-    # input data (storms aggregated waves)
-    Hs = xds_wvs.Hs.values[:]
-    Tp = xds_wvs.Tp.values[:]
-    Dir = xds_wvs.Dir.values[:]
-    ts = xds_wvs.time.values[:]
+    if out is None: out = {}
 
-    # fix times
-    # TODO: this should not be needed
-    if isinstance(ts[0], np.datetime64):
-        ts = [npdt64todatetime(x) for x in ts]
+    # aux function: variable values with time as last dimension
+    def get_values(xds, vn):
+        xda = xds[vn]
+        if 'n_sim' in xda.dims:
+            xda = xda.transpose('n_sim', 'time')
+        return xda.values[:]
+
+    # storm durations (hours)
+    ts = xds_wvs.time.values[:]
+    s_dur_h = diff_days(ts) * 24
+    n_hours = int(np.sum(s_dur_h)) + 1
 
     # input data (storms TCs)
-    tau = xds_tcs.tau.values[:]  # storm max. instant (0-1)
-    mu = xds_tcs.mu.values[:]
-    ss = xds_tcs.ss.values[:]
-
-    # storm durations
-    s_dur_d = np.array([x.days for x in np.diff(ts)])  # days
-    s_dur_h = s_dur_d * 24  # hours
-    s_cs_h = np.cumsum(s_dur_h)  # hours since time start
-    s_cs_h = np.insert(s_cs_h,0,0)
-
-    # storm tau max (hourly)
-    tau_h = np.floor(s_cs_h[:-1] + s_dur_h * tau[:-1])
-
-    # aux function
-    def CalcHydro(vv, vt, tt, mt):
-        '''
-        Calculate variable hourly hydrograph.
-        vv - var value at max.
-        vt - var time (hours since start, at hydrograph extremes)
-        tt - tau max time (hours since start).
-        mt - mu value
-        '''
-
-        # var value at hydrographs extremes
-        vv_extr = vv * np.power(2*mt-1, 2)
-
-        # make it continuous
-        vv_extr_cont = (np.roll(vv_extr,1) + vv_extr) / 2
-        vv_extr_cont[0] = vv_extr_cont[1]
-        vv_extr_cont[-1] = vv_extr_cont[-2]
-
-        # join hydrograph max. and extremes variable data
-        vt_full = np.concatenate([vt, tt])  # concatenate times (used for sorting)
-        vv_full = np.concatenate([vv_extr_cont, vv])
-
-        # sort data
-        ix = np.argsort(vt_full)
-        vt_sf = vt_full[ix]
-        vv_sf = vv_full[ix]
-
-        # interpolate to fill all hours
-        h_times = np.arange(vt_sf[0], vt_sf[-1] + 1, 1)
-        h_values = np.interp(h_times, vt_sf, vv_sf)
-
-        # fix times
-        h_times = h_times.astype(int)
-
-        return h_values, h_times
-
-    # hydrograph variables: hs and ss
-    hourly_Hs, hourly_times = CalcHydro(Hs, s_cs_h, tau_h, mu)
-    hourly_ss, _ = CalcHydro(ss, s_cs_h, tau_h, mu)
-
-    # resample waves data to hourly (pad Tp and Dir)
-    xds_wvs_h = fast_reindex_hourly(xds_wvs)
-
-    # add Hs and SS 
-    xds_wvs_h['Hs'] =(('time',), hourly_Hs)
-    xds_wvs_h['SS'] =(('time',), hourly_ss)
+    tau = get_values(xds_tcs, 'tau')  # storm max. instant (0-1)
+    mu = get_values(xds_tcs, 'mu')
+    ss = get_values(xds_tcs, 'ss')
+
+    # output dataset (hourly)
+    xds_wvs_h = xr.Dataset(coords={'time': generate_hourly(ts[0], n_hours)})
+    if 'n_sim' in xds_wvs.coords:
+        xds_wvs_h['n_sim'] = xds_wvs['n_sim']
+
+    # hydrograph variable: Hs. resample waves data to hourly (pad Tp, Dir)
+    for vn in xds_wvs.data_vars:
+        vv = get_values(xds_wvs, vn)
+
+        if vn == 'Hs':
+            vv_h = Hydrograph_Hourly(s_dur_h, vv, mu, tau, out=out.get(vn))
+        else:
+            vv_h = Pad_Hourly(s_dur_h, vv, out=out.get(vn))
+
+        vd = ('n_sim', 'time') if vv_h.ndim > 1 else ('time',)
+        xds_wvs_h[vn] = (vd, vv_h)
+
+    # hydrograph variable: SS
+    vv_h = Hydrograph_Hourly(s_dur_h, ss, mu, tau, out=out.get('SS'))
+    vd = ('n_sim', 'time') if vv_h.ndim > 1 else ('time',)
+    xds_wvs_h['SS'] = (vd, vv_h)
 
     return xds_wvs_h
 
 
 # --------------------------------------
 
-# TODO check / refactor 
-import math
-def dispersionLonda(T, h):
-    L1 = 1
-    L2 = ((9.81*T**2)/(2*np.pi))*math.tanh(h*2*np.pi/L1)
-    umbral = 2
+def dispersionLonda(T, h, n_iter=3):
+    '''
+    Solves linear dispersion relation (numpy arrays or scalars)
+
+    Explicit approximation (Fenton & McKee, 1990) refined with n_iter
+    Newton iterations.
+
+    T - wave period (s)
+    h - water depth (m)
+
+    returns L, k, c (wave length, wave number, celerity)
+    '''
+
+    g = 9.81
+    w2 = np.square(2*np.pi / np.asarray(T, dtype=float))
+    h = np.asarray(h, dtype=float)
+
+    # explicit approximation
+    k0h = w2 / g * h
+    k = k0h * np.power(1/np.tanh(np.power(k0h, 0.75)), 2/3) / h
 
-    while(umbral>0.1):
-        L2 = ((9.81*T**2)/(2*np.pi))*math.tanh(h*2*np.pi/L1)
-        umbral = abs(L2-L1)
-        L1 = L2
+    # newton iterations: f(k) = g*k*tanh(k*h) - w**2
+    for _ in range(n_iter):
+        th = np.tanh(k*h)
+        f = g*k*th - w2
+        df = g*th + g*k*h*(1-th**2)
+        k = k - f/df
 
-    L = L2
-    k = (2*np.pi)/L
+    # deep water (exact)
+    k = np.where(np.tanh(k*h) == 1, w2/g, k)
+
+    L = (2*np.pi)/k
     c = np.sqrt(9.8*np.tanh(k*h)/k)
     return L, k, c
 
@@ -454,6 +524,9 @@ def Snell_Propagation(T, H_I, dir_I, Prof_I, Prof_E, OrientBati):
       prof_E: Profundidad final.                         Metros.
       OrientBati: Orientaci?n de la perpendicular a la batimetria. Rumbo (0 en el N)
 
+      T, H_I y dir_I pueden ser arrays de cualquier forma (ej: (n_sim, time)),
+      todos los estados de mar se resuelven a la vez.
+
     Salidas:
       H_E: Altura de ola en el punto final.              Metros.
       dir_E: Direccion del oleaje final.                 Rumbo (0 en el N)
@@ -473,61 +546,34 @@ def Snell_Propagation(T, H_I, dir_I, Prof_I, Prof_E, OrientBati):
     '''
 
     # Establece el angulo relativo entre el oleaje y la batimetria
-    Teta_I = dir_I - OrientBati
+    Teta_I = np.asarray(dir_I, dtype=float) - OrientBati
 
     # Fija el angulo relativo entre -90 y 90 grados
-    posd1 = np.where(Teta_I < -90)
-    Teta_I[posd1[0]] = Teta_I[posd1[0]] + 360
-
-    posd2 = np.where(Teta_I > 90)
-    Teta_I[posd2[0]] = Teta_I[posd2[0]] - 360
+    Teta_I = np.where(Teta_I < -90, Teta_I + 360, Teta_I)
+    Teta_I = np.where(Teta_I > 90, Teta_I - 360, Teta_I)
 
     # obligamos que el angulo este en este sector
-    Teta_I[np.where(Teta_I > 90)[0]] = 90
-    Teta_I[np.where(Teta_I < -90)[0]] = -90
+    Teta_I = np.clip(Teta_I, -90, 90)
 
     # Resolucion de la ec. de dispersion en la profundidad de partida y 
     # en la objetivo y calculo de las celeridades de grupo correspondientes
-    L_I = []
-    k_I = []
-    c_I = []
-    Cg_I = []
-
-    L_E = []
-    k_E = []
-    c_E = []
-    Cg_E = []
-
-    for i in range(len(T)):
-        [a,b,c] = dispersionLonda(T[i],Prof_I)
-        L_I.append(a)
-        k_I.append(b)
-        c_I.append(c)
-        Cg_I.append((c/2)*(1+((2*b*Prof_I)/(np.sinh(2*b*Prof_I)))))
-
-        [d,e,f] = dispersionLonda(T[i],Prof_E)
-        L_E.append(d)
-        k_E.append(e)
-        c_E.append(f)
-        Cg_E.append((f/2)*(1+((2*e*Prof_E)/(np.sinh(2*e*Prof_E)))))
-
-
-    dir_E = []
-    Teta_E = []
-    Ks = []
-    Kr = []
-    for i in range(len(Cg_E)):
-        H = math.asin((k_I[i]*np.sin(np.deg2rad(Teta_I[i])))/k_E[i])
-        Teta_E.append(np.rad2deg(H))
-        dir_E.append(np.rad2deg(H) + OrientBati)
-        Ks.append(np.sqrt(Cg_I[i]/Cg_E[i]))
-        Kr.append(np.sqrt(np.cos(np.deg2rad(Teta_I[i]))/np.cos(H)))
-
-    for i in range(len(dir_E)):
-        if dir_E[i] < 0:
-            dir_E[i] = dir_E[i] + 360
-        if dir_E[i] >=360:
-            dir_E[i] = dir_E[i] -360
+    L_I, k_I, c_I = dispersionLonda(T, Prof_I)
+    Cg_I = (c_I/2)*(1+((2*k_I*Prof_I)/(np.sinh(2*k_I*Prof_I))))
+
+    L_E, k_E, c_E = dispersionLonda(T, Prof_E)
+    Cg_E = (c_E/2)*(1+((2*k_E*Prof_E)/(np.sinh(2*k_E*Prof_E))))
+
+    # Snell
+    H = np.arcsin(np.clip((k_I*np.sin(np.deg2rad(Teta_I)))/k_E, -1, 1))
+    dir_E = np.rad2deg(H) + OrientBati
+    Ks = np.sqrt(Cg_I/Cg_E)
+    Kr = np.sqrt(np.cos(np.deg2rad(Teta_I))/np.cos(H))
+
+    # oleaje hacia mar adentro (angulo relativo fijado a +-90): no llega
+    Kr = np.where(np.abs(Teta_I) >= 90, 0, Kr)
+
+    dir_E = np.where(dir_E < 0, dir_E + 360, dir_E)
+    dir_E = np.where(dir_E >= 360, dir_E - 360, dir_E)
 
     # Altura de ola final
     H_E = H_I*Kr*Ks